@@ -52,6 +52,30 @@ def handle_search():
     logger.info(f"知识库查询结果：{results}")
     return jsonify({"results": results})
 
+# 运行指标
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Web进程自身的指标，以及各工作进程定时上报的快照（大模型调用都在工作进程中执行）
+    """
+    from husky.config import TASK_QUEUE
+    from husky.services.event_bus import event_bus
+    from husky.services.worker_metrics import WorkerMetricsStore, process_metrics
+    try:
+        # 超过3个上报周期未更新的工作进程视为已退出
+        workers = WorkerMetricsStore().active(TASK_QUEUE['heartbeat_seconds'] * 3)
+    except Exception as e:
+        logger.error(f"读取工作进程指标失败: {e}")
+        workers = None
+    return jsonify({
+        'code': 0,
+        'message': 'ok',
+        'data': {
+            'web': {**process_metrics(), 'event_subscribers': event_bus.subscriber_count()},
+            'workers': workers
+        }
+    })
+
 # 全局错误处理
 @app.errorhandler(404)
 def not_found(error):
@@ -72,6 +96,11 @@ if __name__ == '__main__':
     try:
         # 启动前创建数据库（如果不存在）
         create_database_if_not_exists()
+        # 内嵌模式下在Web进程内启动工作线程；debug模式只在重载后的子进程中启动
+        from husky.config import TASK_QUEUE
+        if TASK_QUEUE['embedded'] and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            from husky.services.task_queue import Worker
+            Worker().start()
         logger.info("准备启动应用服务器...")
         app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
     except Exception as e:
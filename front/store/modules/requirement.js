@@ -30,12 +30,13 @@ const actions = {
     try {
       const response = await this.$axios.post('/api/v1/require/search', params)
       if (response.data.code === 0) {
-        commit('SET_REQUIREMENT_LIST', response.data.data)
-        // 假设API返回分页信息，如果没有则需要调整
+        const { list, total, page, size } = response.data.data
+        commit('SET_REQUIREMENT_LIST', list)
+        // 未传 page/size 时接口返回全部需求，page/size 为空
         commit('SET_PAGINATION', {
-          current: 1,
-          size: response.data.data.length,
-          total: response.data.data.length
+          current: page || 1,
+          size: size || list.length,
+          total
         })
       }
       return response.data
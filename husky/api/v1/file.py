@@ -5,6 +5,7 @@ from io import BytesIO
 
 from husky.models.requirements import Requirements
 from husky.services.knowledge_service import KnowledgeService
+from husky.utils import parse_bool
 
 # 创建蓝图
 file_bp = Blueprint('file', __name__)
@@ -30,12 +31,21 @@ def handle_upload():
     try:
         # 第一步解析文档，并存储需求到require表格。
         file_stream = BytesIO(file.read())
-        require = Requirements(file_stream, filename)
+        no_cache = parse_bool(request.form.get('no_cache'))
+        # 传入已有的require_id表示上传修订版，后续功能点分析会与上一版增量比对
+        require_id = request.form.get('require_id') or None
+        if require_id and not Requirements.load(require_id):
+            return jsonify({"error": f"需求不存在: {require_id}"}), 404
+        require = Requirements(file_stream, filename, bypass_cache=no_cache, require_id=require_id)
         require.evaluate().save()
 
         # 第二步解析文档，并存储为llama_index本地知识。
         file_stream.seek(0)  # 重置文件流指针
-        result = KnowledgeService().add_files([file_stream], [file.mimetype])
+        result = KnowledgeService().add_files(
+            [file_stream],
+            [file.mimetype],
+            metadata={'require_id': require.record['require_id'], 'source': filename}
+        )
         # 构建响应数据（适配新表结构）
         response_data = {
             "status": "success",
@@ -4,7 +4,7 @@ from loguru import logger
 
 from husky.services.task_service import TaskService
 from husky.repositories.mysql_repository import MysqlRepository
-from husky.utils import get_husky_id
+from husky.utils import get_husky_id, parse_bool, parse_fields, parse_pagination, decode_json_fields
 
 # 创建蓝图
 point_bp = Blueprint('point', __name__)
@@ -23,9 +23,12 @@ def point_analysis():
     
     # 生成唯一任务ID
     task_id = get_husky_id('TASK')
-    # 初始化任务记录
-    task_service = TaskService()
-    task = task_service.init_task('point_analysis', task_id, require_id)
+    # 初始化任务记录并入队，由工作进程领取执行
+    task = TaskService().init_task(
+        'point_analysis', task_id, require_id,
+        # full 为True时忽略上一版分析结果，全量重新提取
+        payload={'no_cache': parse_bool(data.get('no_cache')), 'full': parse_bool(data.get('full'))}
+    )
     if not task:
         return jsonify({
             'code': 500,
@@ -33,11 +36,6 @@ def point_analysis():
             'data': None
         })
     
-    # 启动异步处理线程
-    from threading import Thread
-    thread = Thread(target=task_service.process_point_analysis, args=(task_id, require_id))
-    thread.start()
-    
     return jsonify({
         'code': 0,
         'message': 'Analysis started',
@@ -149,6 +147,16 @@ def point_update():
             'data': None
         })
 
+# 可投影的列与可过滤的列
+POINT_FIELDS = [
+    'point_id', 'task_id', 'require_id', 'function_name', 'test_type', 'description',
+    'module', 'business_domain', 'chunks', 'chunk_index', 'carried_from', 'stale', 'preconditions',
+    'created_at', 'updated_at'
+]
+POINT_FILTERS = ['module', 'business_domain', 'test_type', 'function_name']
+POINT_JSON_FIELDS = ['preconditions']
+
+
 @point_bp.route('/search', methods=['POST'])
 def points_search():
     # 获取请求参数
@@ -162,35 +170,50 @@ def points_search():
             'data': None
         })
     
+    # 过滤、投影与分页参数
+    where = {'task_id': task_id}
+    for field in POINT_FILTERS:
+        if data.get(field):
+            where[field] = data[field]
+    if data.get('stale') is not None:
+        where['stale'] = int(parse_bool(data['stale']))
+    fields = parse_fields(data.get('fields'), POINT_FIELDS)
+    try:
+        page, size = parse_pagination(data)
+    except ValueError as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e),
+            'data': None
+        })
+    
     try:
         # 使用Mysql类查询数据
         with MysqlRepository() as db:
-            # 查询points表中所有task_id匹配的记录
+            # 查询points表中所有task_id匹配的记录，总数走 idx_task_id 索引计数
             points = db.search(
                 table='points',
-                where={'task_id': task_id}
+                columns=[f'`{f}`' for f in fields] or None,
+                where=where,
+                order_by=['created_at', 'point_id'],
+                limit=size,
+                offset=(page - 1) * size if page else None
             )
+            total = db.count('points', where=where) if page else len(points)
             
-            # 处理JSON格式的字段
-            processed_points = []
-            for point in points:
-                # 转换preconditions字段
-                if 'preconditions' in point and isinstance(point['preconditions'], str):
-                    try:
-                        point['preconditions'] = json.loads(point['preconditions'])
-                    except json.JSONDecodeError:
-                        point['preconditions'] = []
-                
-                processed_points.append(point)
-            
-            return jsonify({
-                'code': 0,
-                'message': 'Success',
-                'data': {
-                    'total': len(processed_points),
-                    'list': processed_points
-                }
-            })
+        # 处理JSON格式的字段
+        decode_json_fields(points, POINT_JSON_FIELDS)
+        
+        return jsonify({
+            'code': 0,
+            'message': 'Success',
+            'data': {
+                'total': total,
+                'page': page,
+                'size': size,
+                'list': points
+            }
+        })
             
     except Exception as e:
         logger.error(f"Search points error: {str(e)}")
@@ -198,4 +221,4 @@ def points_search():
             'code': 500,
             'message': f'Internal server error: {str(e)}',
             'data': None
-        })
\ No newline at end of file
+        })
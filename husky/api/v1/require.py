@@ -5,51 +5,121 @@ from loguru import logger
 
 from husky.repositories.mysql_repository import MysqlRepository
 from husky.models.requirements import Requirements
+from husky.utils import parse_bool, parse_pagination
 # 已移除未使用的Knowledge导入
 from io import BytesIO
 
 # 创建蓝图
 require_bp = Blueprint('require', __name__)
 
+# 列表模式只返回摘要列，原文 original_text 仅由详情接口返回
+SUMMARY_COLUMNS = [
+    'require_id', 'require_name', 'description', 'business_domain', 'module',
+    'priority', 'quality_score', 'tags', 'source', 'status', 'is_deleted',
+    'created_at', 'updated_at'
+]
+
+# 默认质量评分，JSON解析失败时使用
+DEFAULT_QUALITY_SCORE = {
+    "clarity": 0,
+    "consistency": 0,
+    "testability": 0,
+    "completeness": 0
+}
+
+
+def process_requirement(req: dict) -> dict:
+    """将 tags、quality_score 等JSON字符串字段转换为对象"""
+    processed_req = dict(req)  # 创建字典副本
+    
+    # 处理 tags 字段
+    if 'tags' in processed_req and processed_req['tags']:
+        try:
+            processed_req['tags'] = json.loads(processed_req['tags'])
+        except json.JSONDecodeError:
+            # 如果解析失败，设置为空数组
+            processed_req['tags'] = []
+    
+    # 处理 quality_score 字段
+    if 'quality_score' in processed_req and processed_req['quality_score']:
+        try:
+            processed_req['quality_score'] = json.loads(processed_req['quality_score'])
+        except json.JSONDecodeError:
+            # 如果解析失败，设置为默认评分对象
+            processed_req['quality_score'] = dict(DEFAULT_QUALITY_SCORE)
+    
+    return processed_req
+
+
 @require_bp.route('/search', methods=['POST'])
 def require_search():
+    data = request.get_json(silent=True) or {}
+    # 未传 page/size 时返回全部需求
+    try:
+        page, size = parse_pagination(data, max_size=100)
+    except ValueError as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e),
+            'data': None
+        })
+    
+    # 过滤条件
+    where = {'is_deleted': int(parse_bool(data.get('is_deleted')))}
+    for field in ('business_domain', 'module', 'status'):
+        if data.get(field):
+            where[field] = data[field]
+    if data.get('tags'):
+        where['tags__contains'] = data['tags']
+    
     with MysqlRepository() as db:
-        requirements = db.search('requirements')
-        logger.info(f"require: {requirements}")
-        
-        # 处理返回数据，将字符串转换为对象
-        processed_requirements = []
-        for req in requirements:
-            processed_req = dict(req)  # 创建字典副本
-            
-            # 处理 tags 字段
-            if 'tags' in processed_req and processed_req['tags']:
-                try:
-                    processed_req['tags'] = json.loads(processed_req['tags'])
-                except json.JSONDecodeError:
-                    # 如果解析失败，设置为空数组
-                    processed_req['tags'] = []
-            
-            # 处理 quality_score 字段
-            if 'quality_score' in processed_req and processed_req['quality_score']:
-                try:
-                    processed_req['quality_score'] = json.loads(processed_req['quality_score'])
-                except json.JSONDecodeError:
-                    # 如果解析失败，设置为默认评分对象
-                    processed_req['quality_score'] = {
-                        "clarity": 0,
-                        "consistency": 0,
-                        "testability": 0,
-                        "completeness": 0
-                    }
-            
-            processed_requirements.append(processed_req)
-        
+        requirements = db.search(
+            'requirements',
+            columns=SUMMARY_COLUMNS,
+            where=where,
+            order_by=['-created_at', '-require_id'],
+            limit=size,
+            offset=(page - 1) * size if page else None
+        )
+        total = db.count('requirements', where=where) if page else len(requirements)
+    logger.info(f"require: 第{page or 1}页 {len(requirements)}/{total} 条")
+    
+    return jsonify({
+        'code': 0,
+        'message': 'ok',
+        'data': {
+            'total': total,
+            'page': page,
+            'size': size,
+            'list': [process_requirement(req) for req in requirements]
+        }
+    })
+
+@require_bp.route('/detail', methods=['POST'])
+def require_detail():
+    data = request.get_json(silent=True) or {}
+    if not data.get('require_id'):
         return jsonify({
-            'code': 0,
-            'message': 'ok',
-            'data': processed_requirements
+            'code': 400,
+            'message': 'require parameter `require_id`',
+            'data': data
         })
+    
+    with MysqlRepository() as db:
+        requirements = db.search('requirements', where={'require_id': data['require_id']})
+    
+    if not requirements:
+        return jsonify({
+            'code': 404,
+            'message': '未找到对应需求',
+            'data': data
+        })
+    
+    return jsonify({
+        'code': 0,
+        'message': 'ok',
+        'data': process_requirement(requirements[0])
+    })
 
 @require_bp.route('/update', methods=['POST'])
 def require_update():
@@ -90,33 +160,16 @@ def require_update():
                 # 查询更新后的数据返回给前端
                 updated_require = db.search(
                     'requirements',
+                    columns=SUMMARY_COLUMNS,
                     where={'require_id': data['require_id']}
                 )
                 
                 if updated_require:
                     # 处理返回数据格式
-                    processed_require = dict(updated_require[0])
-                    if 'tags' in processed_require and processed_require['tags']:
-                        try:
-                            processed_require['tags'] = json.loads(processed_require['tags'])
-                        except json.JSONDecodeError:
-                            processed_require['tags'] = []
-                    
-                    if 'quality_score' in processed_require and processed_require['quality_score']:
-                        try:
-                            processed_require['quality_score'] = json.loads(processed_require['quality_score'])
-                        except json.JSONDecodeError:
-                            processed_require['quality_score'] = {
-                                "clarity": 0,
-                                "consistency": 0,
-                                "testability": 0,
-                                "completeness": 0
-                            }
-                    
                     return jsonify({
                         'code': 0,
                         'message': '需求更新成功',
-                        'data': processed_require
+                        'data': process_requirement(updated_require[0])
                     })
             
             return jsonify({
@@ -1,62 +1,143 @@
 import json
-from flask import Blueprint, request, jsonify
+import base64
+import binascii
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify
 from loguru import logger
 
+from husky.config import BATCH_ANALYSIS
 from husky.repositories.mysql_repository import MysqlRepository
+from husky.services.batch_service import BATCH_TASK_TYPE, BatchService
+from husky.services.cancellation import cancel_task
+from husky.services.checkpoint import CheckpointStore
+from husky.services.event_bus import TERMINAL_STATUSES, event_bus
+from husky.services.llm_usage import UsageStore
+from husky.services.task_queue import ensure_status_bridge
+from husky.utils import parse_bool
 
 # 创建蓝图
 task_bp = Blueprint('task', __name__)
 
+# 允许的排序列，每个排序列都有 (列, task_id) 联合索引支撑键集分页
+TASK_SORTS = {
+    'created_at': 'idx_created_at_task_id',
+    'updated_at': 'idx_updated_at_task_id'
+}
+
+# 任务总数缓存秒数，新建任务时由 TaskService 增量维护
+TASK_COUNT_TTL = 30
+
+# SSE心跳间隔（秒），防止代理因空闲断开连接
+SSE_HEARTBEAT = 15
+
+
+def encode_cursor(sort: str, order: str, row: dict) -> str:
+    """将上一页最后一行编码为不透明的续页游标"""
+    value = row[sort]
+    if isinstance(value, datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S')
+    payload = json.dumps([sort, order, value, row['task_id']], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> list:
+    """解析续页游标，返回 [sort, order, value, task_id]"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if not isinstance(payload, list) or len(payload) != 4:
+            raise ValueError
+        return payload
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError('invalid cursor')
+
+
 @task_bp.route('/search', methods=['GET'])
 def task_search():
     # 获取请求参数
     page = request.args.get('page', 1, type=int)
-    size = request.args.get('size', 10, type=int)
+    size = min(max(request.args.get('size', 10, type=int), 1), 100)
     sort = request.args.get('sort', 'created_at')
-    order = request.args.get('order', 'desc')
-    
-    # 计算偏移量
-    offset = (page - 1) * size
+    order = request.args.get('order', 'desc').lower()
+    cursor = request.args.get('cursor')
     
-    # 构建排序字符串
-    order_by = f'{sort} {order.upper()}'
+    # 过滤条件
+    where = {}
+    for field in ('task_id', 'require_id', 'parent_id', 'status', 'task_type'):
+        if request.args.get(field):
+            where[field] = request.args.get(field)
     
     try:
+        # 游标中已包含排序方式，保证翻页过程中排序一致
+        after = None
+        if cursor:
+            sort, order, value, last_task_id = decode_cursor(cursor)
+            after = [value, last_task_id]
+        
+        if sort not in TASK_SORTS or order not in ('asc', 'desc'):
+            return jsonify({
+                'code': 400,
+                'message': f'sort must be one of {list(TASK_SORTS)} and order must be asc/desc',
+                'data': None
+            })
+        
         with MysqlRepository() as db:
-            # 查询总数
-            with db.connection.cursor() as cursor:
-                sql = f"SELECT COUNT(*) as total FROM `tasks`"
-                cursor.execute(sql)
-                result = cursor.fetchone()
-                total = result['total']
-
-            # 分页查询任务
-            with db.connection.cursor() as cursor:
-                sql = f"SELECT * FROM `tasks` ORDER BY {order_by} LIMIT {size} OFFSET {offset}"
-                cursor.execute(sql)
-                tasks = cursor.fetchall()
+            # 总数走缓存，轮询不会每次触发COUNT(*)
+            total = db.count('tasks', where=where, ttl=TASK_COUNT_TTL)
             
-            # 处理JSON字段
-            processed_tasks = []
-            for task in tasks:
-                # 转换result字段
-                if 'result' in task and task['result']:
-                    try:
-                        task['result'] = json.loads(task['result'])
-                    except json.JSONDecodeError:
-                        task['result'] = {}
-                
-                processed_tasks.append(task)
+            if after is None and page > 1:
+                # 兼容旧的页码参数；深分页请使用 next_cursor
+                tasks = db.search(
+                    'tasks',
+                    where=where,
+                    order_by=[sort if order == 'asc' else f'-{sort}', 'task_id' if order == 'asc' else '-task_id'],
+                    limit=size + 1,
+                    offset=(page - 1) * size
+                )
+            else:
+                tasks = db.keyset_search(
+                    'tasks',
+                    sort_keys=[sort, 'task_id'],
+                    after=after,
+                    descending=(order == 'desc'),
+                    limit=size + 1,
+                    where=where
+                )
             
-            return jsonify({
-                'code': 0,
-                'message': 'Success',
-                'data': {
-                    'total': total,
-                    'list': processed_tasks
-                }
-            })
+        # 多取一行用于判断是否还有下一页
+        has_more = len(tasks) > size
+        tasks = tasks[:size]
+        next_cursor = encode_cursor(sort, order, tasks[-1]) if has_more and tasks else None
+            
+        # 处理JSON字段
+        processed_tasks = []
+        for task in tasks:
+            # 转换result字段
+            if 'result' in task and task['result']:
+                try:
+                    task['result'] = json.loads(task['result'])
+                except json.JSONDecodeError:
+                    task['result'] = {}
+            
+            processed_tasks.append(task)
+        
+        return jsonify({
+            'code': 0,
+            'message': 'Success',
+            'data': {
+                'total': total,
+                'size': size,
+                'has_more': has_more,
+                'next_cursor': next_cursor,
+                'list': processed_tasks
+            }
+        })
             
+    except ValueError as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e),
+            'data': None
+        })
     except Exception as e:
         logger.error(f"Search tasks error: {str(e)}")
         return jsonify({
@@ -77,31 +158,52 @@ def task_cancel():
             'data': None
         })
     
+    # 是否保留已生成的部分结果，默认保留
+    keep_partial = parse_bool(data.get('keep_partial'), default=True)
     try:
         with MysqlRepository() as db:
-            # 更新任务状态为已终止
+            tasks = db.search('tasks', columns=['status', 'task_type', 'payload'], where={'task_id': task_id})
+            if not tasks or tasks[0]['status'] not in ('pending', 'processing'):
+                return jsonify({
+                    'code': 404,
+                    'message': 'Task not found or not in processing status',
+                    'data': None
+                })
+            task = tasks[0]
+            payload = json.loads(task['payload']) if task.get('payload') else {}
+            payload['keep_partial'] = keep_partial
+            # 排队中的任务直接取消；执行中的任务由工作进程中断后按 keep_partial 收尾
+            batch = task['task_type'] == BATCH_TASK_TYPE
+            message = '任务已取消' if task['status'] == 'pending' or batch else '正在取消任务...'
             affected_rows = db.update(
                     table='tasks',
                     update_data={
-                        'status': 'failed',
-                        'message': 'Task cancelled by user',
+                        'status': 'cancelled',
+                        'message': message,
+                        'payload': json.dumps(payload),
                         'end_time': db.get_current_time()
                     },
-                    where={'task_id': task_id}
+                    where={'task_id': task_id, 'status__in': ['pending', 'processing']}
                 )
-            
-            if affected_rows > 0:
-                return jsonify({
-                    'code': 0,
-                    'message': 'Task cancelled successfully',
-                    'data': None
-                })
-            else:
-                return jsonify({
-                    'code': 404,
-                    'message': 'Task not found or not in processing status',
-                    'data': None
-                })
+
+        if affected_rows > 0:
+            # 批量任务连同未结束的子任务一起取消
+            task_ids = [task_id] + (BatchService.cancel_children(task_id, keep_partial) if batch else [])
+            for cancelled_id in task_ids:
+                # 任务在本进程执行（内嵌工作线程）时立即中断
+                cancel_task(cancelled_id)
+            event_bus.publish(task_id, 'status', {'status': 'cancelled', 'message': message})
+            return jsonify({
+                'code': 0,
+                'message': 'Task cancelled successfully',
+                'data': None
+            })
+        else:
+            return jsonify({
+                'code': 404,
+                'message': 'Task not found or not in processing status',
+                'data': None
+            })
                 
     except Exception as e:
         logger.error(f"Cancel task error: {str(e)}")
@@ -109,4 +211,282 @@ def task_cancel():
             'code': 500,
             'message': f'Internal server error: {str(e)}',
             'data': None
-        })
\ No newline at end of file
+        })
+
+@task_bp.route('/resume', methods=['POST'])
+def task_resume():
+    """已结束的任务重新排队，按检查点只重新执行失败或未执行的工作单元"""
+    data = request.get_json()
+    task_id = data.get('task_id')
+
+    if not task_id:
+        return jsonify({
+            'code': 400,
+            'message': 'task_id is required',
+            'data': None
+        })
+
+    try:
+        with MysqlRepository() as db:
+            tasks = db.search('tasks', columns=['task_type', 'parent_id'], where={'task_id': task_id})
+            affected_rows = db.update(
+                table='tasks',
+                update_data={
+                    'status': 'pending',
+                    'progress': 0,
+                    'message': '等待续跑',
+                    'attempts': 0,
+                    'result': None,
+                    'end_time': None
+                },
+                where={'task_id': task_id, 'status__in': list(TERMINAL_STATUSES)}
+            )
+        if not affected_rows:
+            return jsonify({
+                'code': 404,
+                'message': 'Task not found or still running',
+                'data': None
+            })
+
+        event_bus.publish(task_id, 'status', {'status': 'pending', 'progress': 0, 'message': '等待续跑'})
+        if tasks and tasks[0]['parent_id']:
+            # 已结束的批次随子任务续跑重新进入汇总
+            with MysqlRepository() as db:
+                db.update('tasks', {'status': 'processing', 'end_time': None},
+                          where={'task_id': tasks[0]['parent_id'], 'status__in': list(TERMINAL_STATUSES)})
+        if tasks and tasks[0]['task_type'] == BATCH_TASK_TYPE:
+            # 批量任务只重新排队失败或取消的子任务，父任务进度随即按子任务重新汇总
+            resumed = BatchService.resume_children(task_id)
+            BatchService().refresh([task_id])
+            return jsonify({
+                'code': 0,
+                'message': 'Task resumed',
+                'data': {
+                    'task_id': task_id,
+                    'status': 'pending',
+                    'resumed_children': resumed
+                }
+            })
+        units = CheckpointStore().list(task_id)
+        summary = {}
+        for unit in units:
+            summary[unit['status']] = summary.get(unit['status'], 0) + 1
+        return jsonify({
+            'code': 0,
+            'message': 'Task resumed',
+            'data': {
+                'task_id': task_id,
+                'status': 'pending',
+                'units': summary
+            }
+        })
+    except Exception as e:
+        logger.error(f"Resume task error: {str(e)}")
+        return jsonify({
+            'code': 500,
+            'message': f'Internal server error: {str(e)}',
+            'data': None
+        })
+
+
+@task_bp.route('/batch', methods=['POST'])
+def task_batch():
+    """
+    多需求批量分析：创建父任务与每个需求的子任务，子任务共用批次的并发与token预算，按需求优先级调度
+    功能点分析传 require_ids；测试用例生成传 items: [{"require_id", "point_ids"}]
+    父任务的状态与进度由子任务汇总，可通过 /task/search?parent_id= 查看子任务
+    """
+    data = request.get_json() or {}
+    task_type = data.get('task_type', 'point_analysis')
+    if task_type not in ('point_analysis', 'testcase_analysis'):
+        return jsonify({
+            'code': 400,
+            'message': 'task_type must be point_analysis or testcase_analysis',
+            'data': None
+        })
+
+    if task_type == 'point_analysis':
+        items = [{'require_id': require_id} for require_id in data.get('require_ids') or [] if require_id]
+    else:
+        items = [item for item in data.get('items') or []
+                 if isinstance(item, dict) and item.get('require_id') and item.get('point_ids')]
+    if not items:
+        return jsonify({
+            'code': 400,
+            'message': 'require_ids is required' if task_type == 'point_analysis'
+                       else 'items with require_id and point_ids is required',
+            'data': None
+        })
+    if len(items) > BATCH_ANALYSIS['max_requirements']:
+        return jsonify({
+            'code': 400,
+            'message': f"at most {BATCH_ANALYSIS['max_requirements']} requirements per batch",
+            'data': None
+        })
+
+    try:
+        batch = BatchService().submit(task_type, items, data)
+    except ValueError as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e),
+            'data': None
+        })
+    except Exception as e:
+        logger.error(f"Create batch task error: {str(e)}")
+        return jsonify({
+            'code': 500,
+            'message': f'Internal server error: {str(e)}',
+            'data': None
+        })
+    return jsonify({
+        'code': 0,
+        'message': 'Batch analysis started',
+        'data': batch
+    })
+
+
+@task_bp.route('/units', methods=['GET'])
+def task_units():
+    """任务各阶段工作单元的执行状态与重试次数"""
+    task_id = request.args.get('task_id')
+    if not task_id:
+        return jsonify({
+            'code': 400,
+            'message': 'task_id is required',
+            'data': None
+        })
+    units = CheckpointStore().list(task_id, stage=request.args.get('stage'))
+    return jsonify({
+        'code': 0,
+        'message': 'Success',
+        'data': {
+            'total': len(units),
+            'list': units
+        }
+    })
+
+
+
+@task_bp.route('/usage', methods=['GET'])
+def task_usage():
+    """任务各阶段的大模型调用次数、token用量、耗时、重试与费用"""
+    task_id = request.args.get('task_id')
+    if not task_id:
+        return jsonify({
+            'code': 400,
+            'message': 'task_id is required',
+            'data': None
+        })
+    try:
+        summary = UsageStore().summary(where={'task_id': task_id}, group_by='stage')
+    except Exception as e:
+        logger.error(f"查询任务 {task_id} 大模型用量失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'Internal server error: {str(e)}',
+            'data': None
+        })
+    return jsonify({
+        'code': 0,
+        'message': 'Success',
+        'data': summary
+    })
+
+
+@task_bp.route('/usage/summary', methods=['GET'])
+def usage_summary():
+    """
+    大模型用量汇总，可按需求、阶段、时间范围过滤
+    group_by 可选 stage/model/task_id/require_id
+    """
+    group_by = request.args.get('group_by', 'stage')
+    if group_by not in UsageStore.DIMENSIONS:
+        return jsonify({
+            'code': 400,
+            'message': f'group_by must be one of {list(UsageStore.DIMENSIONS)}',
+            'data': None
+        })
+    where = {}
+    for field in ('require_id', 'stage', 'model'):
+        if request.args.get(field):
+            where[field] = request.args.get(field)
+    if request.args.get('start_time'):
+        where['created_at__gte'] = request.args.get('start_time')
+    if request.args.get('end_time'):
+        where['created_at__lte'] = request.args.get('end_time')
+    try:
+        summary = UsageStore().summary(where=where, group_by=group_by)
+    except Exception as e:
+        logger.error(f"汇总大模型用量失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'Internal server error: {str(e)}',
+            'data': None
+        })
+    return jsonify({
+        'code': 0,
+        'message': 'Success',
+        'data': summary
+    })
+
+def format_sse(event: str, data) -> str:
+    """按 text/event-stream 格式编码事件"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@task_bp.route('/<task_id>/events', methods=['GET'])
+def task_events(task_id):
+    """以SSE推送任务的状态、进度、消息以及新落库的功能点/测试用例"""
+    # 任务在工作进程中执行，由状态桥接线程把数据库中的状态变化与新落库的明细转发到本进程
+    ensure_status_bridge()
+    # 先订阅再取快照，避免两者之间的事件丢失
+    subscription = event_bus.subscribe(task_id)
+    snapshot = event_bus.snapshot(task_id)
+    if snapshot is None:
+        # 本进程内没有该任务的快照时回查一次数据库
+        with MysqlRepository() as db:
+            tasks = db.search(
+                'tasks',
+                columns=['task_id', 'require_id', 'task_type', 'status', 'progress', 'message', 'result'],
+                where={'task_id': task_id}
+            )
+        if not tasks:
+            event_bus.unsubscribe(subscription)
+            return jsonify({
+                'code': 404,
+                'message': 'Task not found',
+                'data': None
+            })
+        snapshot = tasks[0]
+        if isinstance(snapshot.get('result'), str):
+            try:
+                snapshot['result'] = json.loads(snapshot['result'])
+            except json.JSONDecodeError:
+                snapshot['result'] = {}
+
+    def stream():
+        try:
+            yield format_sse('status', snapshot)
+            if snapshot.get('status') in TERMINAL_STATUSES:
+                return
+            while True:
+                message = subscription.get(timeout=SSE_HEARTBEAT)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(message['event'], message['data'])
+                if message['event'] == 'status' and message['data'].get('status') in TERMINAL_STATUSES:
+                    return
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return Response(
+        stream(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -1,10 +1,10 @@
-import json
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from loguru import logger
 
 from husky.services.task_service import TaskService
+from husky.services.export_service import EXPORT_FORMATS, export_testcases
 from husky.repositories.mysql_repository import MysqlRepository
-from husky.utils import get_husky_id
+from husky.utils import get_husky_id, parse_bool, parse_fields, parse_pagination, decode_json_fields
 
 # 创建蓝图
 testcase_bp = Blueprint('testcase', __name__)
@@ -31,9 +31,11 @@ def testcase_analysis():
     
     # 生成唯一任务ID
     task_id = get_husky_id('TASK')
-    # 初始化任务记录
-    task_service = TaskService()
-    task = task_service.init_task('testcase_analysis', task_id, require_id)
+    # 初始化任务记录并入队，由工作进程领取执行
+    task = TaskService().init_task(
+        'testcase_analysis', task_id, require_id,
+        payload={'point_ids': point_ids, 'no_cache': parse_bool(data.get('no_cache'))}
+    )
     if not task:
         return jsonify({
             'code': 500,
@@ -41,11 +43,6 @@ def testcase_analysis():
             'data': None
         })
     
-    # 启动异步处理线程
-    from threading import Thread
-    thread = Thread(target=task_service.process_testcase_analysis, args=(task_id, require_id, point_ids))
-    thread.start()
-    
     return jsonify({
         'code': 0,
         'message': 'Analysis started',
@@ -56,6 +53,16 @@ def testcase_analysis():
         }
     })
 
+# 可投影的列与可过滤的列
+TESTCASE_FIELDS = [
+    'case_id', 'task_id', 'require_id', 'point_id', 'case_name', 'preconditions', 'test_steps',
+    'expected_result', 'priority', 'test_type', 'duplicate_of', 'create', 'modify', 'accept',
+    'review', 'verify', 'created_at', 'updated_at'
+]
+TESTCASE_FLAGS = ['create', 'modify', 'accept', 'review', 'verify']
+TESTCASE_JSON_FIELDS = ['preconditions', 'test_steps', 'expected_result', 'test_type']
+
+
 @testcase_bp.route('/search', methods=['POST'])
 def testcase_search():
     # 获取请求参数
@@ -69,40 +76,95 @@ def testcase_search():
             'data': None
         })
     
+    # 过滤、投影与分页参数
+    where = {'task_id': task_id}
+    if data.get('priority'):
+        where['priority'] = data['priority']
+    if data.get('point_id'):
+        where['point_id'] = data['point_id']
+    if data.get('test_type'):
+        where['test_type__contains'] = data['test_type']
+    for flag in TESTCASE_FLAGS:
+        if data.get(flag) is not None:
+            where[flag] = int(parse_bool(data[flag]))
+    # duplicate 为True只查近似重复的用例，为False排除近似重复的用例
+    if data.get('duplicate') is not None:
+        where['duplicate_of__ne' if parse_bool(data['duplicate']) else 'duplicate_of'] = None
+    fields = parse_fields(data.get('fields'), TESTCASE_FIELDS)
+    try:
+        page, size = parse_pagination(data)
+    except ValueError as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e),
+            'data': None
+        })
+    
     try:
         # 使用Mysql类查询数据
         with MysqlRepository() as db:
-            # 查询points表中所有task_id匹配的记录
+            # 查询testcases表中所有task_id匹配的记录，总数走 idx_task_id 索引计数
             testcases = db.search(
                 table='testcases',
-                where={'task_id': task_id}
+                columns=[f'`{f}`' for f in fields] or None,
+                where=where,
+                order_by=['created_at', 'case_id'],
+                limit=size,
+                offset=(page - 1) * size if page else None
             )
+            total = db.count('testcases', where=where) if page else len(testcases)
             
-            # 处理JSON格式的字段
-            processed_testcases = []
-            for testcase in testcases:
-                # 转换preconditions字段
-                if 'preconditions' in testcase and isinstance(testcase['preconditions'], str):
-                    try:
-                        testcase['preconditions'] = json.loads(testcase['preconditions'])
-                    except json.JSONDecodeError:
-                        testcase['preconditions'] = []
-                
-                processed_testcases.append(testcase)
-            
-            return jsonify({
-                'code': 0,
-                'message': 'Success',
-                'data': {
-                    'total': len(processed_testcases),
-                    'list': processed_testcases
-                }
-            })
+        # 处理JSON格式的字段
+        decode_json_fields(testcases, TESTCASE_JSON_FIELDS)
+        
+        return jsonify({
+            'code': 0,
+            'message': 'Success',
+            'data': {
+                'total': total,
+                'page': page,
+                'size': size,
+                'list': testcases
+            }
+        })
             
     except Exception as e:
-        logger.error(f"Search points error: {str(e)}")
+        logger.error(f"Search testcases error: {str(e)}")
         return jsonify({
             'code': 500,
             'message': f'Internal server error: {str(e)}',
             'data': None
-        })
\ No newline at end of file
+        })
+
+@testcase_bp.route('/export', methods=['GET'])
+def testcase_export():
+    # 按需求或任务导出，二者至少提供一个
+    where = {}
+    for field in ('require_id', 'task_id'):
+        if request.args.get(field):
+            where[field] = request.args.get(field)
+    if not where:
+        return jsonify({
+            'code': 400,
+            'message': 'require_id or task_id is required',
+            'data': None
+        })
+    
+    fmt = request.args.get('format', 'jsonl').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({
+            'code': 400,
+            'message': f'format must be one of {list(EXPORT_FORMATS)}',
+            'data': None
+        })
+    
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"testcases-{where.get('task_id') or where.get('require_id')}.{extension}"
+    return Response(
+        export_testcases(where, fmt),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -11,3 +11,120 @@ MYSQL={
     'charset': 'utf8mb4',
     'auth_plugin_map': {'mysql_native_password': 'pymysql._auth.scramble_native_password_auth'}
 }
+
+# 连接池配置（单位：秒）
+# max_size 为 None 时按并发估算：TASK_QUEUE['workers'] 个任务线程各带 LLM_MAX_WORKERS 个大模型调用线程，
+# 每个线程最多同时持有 connections_per_thread 个连接（如结果写入与检查点/用量记录），另留 reserve 个给Web请求、导出与续约
+# 借用等待超过 wait_warning 秒时记录告警
+MYSQL_POOL={
+    'max_size': None,
+    'connections_per_thread': 2,
+    'reserve': 10,
+    'max_idle': 300,
+    'max_lifetime': 3600,
+    'ping_interval': 30,
+    'timeout': 10,
+    'wait_warning': 1
+}
+
+# 单个任务内并发调用大模型的最大数量
+LLM_MAX_WORKERS=5
+
+# 进程内所有任务共享的大模型并发上限
+LLM_GLOBAL_CONCURRENCY=10
+
+# 进程内共享的大模型网关（rpm/tpm 为每分钟请求数与token数上限，0表示不限制）
+# 429/5xx/网络错误按抖动退避重试，连续失败 breaker_threshold 次后熔断 breaker_reset 秒
+LLM_GATEWAY={
+    'base_url': 'https://api.deepseek.com',
+    'model': 'deepseek-chat',
+    'timeout': 120,
+    'rpm': 300,
+    'tpm': 1000000,
+    'completion_reserve': 2000,
+    'max_retries': 3,
+    'backoff_base': 1.0,
+    'backoff_max': 30,
+    'breaker_threshold': 5,
+    'breaker_reset': 60
+}
+
+# 大模型响应缓存：backend 可选 sqlite（本地磁盘）或 mysql（多实例共享，表结构见 sql/llm_cache.sql）
+LLM_CACHE={
+    'enabled': True,
+    'backend': 'sqlite',
+    'path': 'storage/llm_cache.db',
+    'ttl': 7 * 24 * 3600,
+    'max_entries': 20000
+}
+
+# 流式接收大模型响应，功能点/测试用例解析完成即分批落库
+LLM_STREAMING=True
+STREAM_PERSIST_BATCH=10
+
+# 任务队列：任务以 tasks 表为队列，由独立的工作进程（worker.py）领取执行
+# embedded 为True时在Web进程内启动工作线程，便于本地开发不单独起进程
+# claim_scan_factor 为每轮领取时扫描的候选倍数，批量任务超出预算的子任务被跳过时由后续候选补位
+TASK_QUEUE={
+    'workers': 4,
+    'lease_seconds': 120,
+    'heartbeat_seconds': 30,
+    'poll_interval': 2,
+    'max_attempts': 3,
+    'embedded': False,
+    'claim_scan_factor': 4
+}
+
+# 生成测试用例时的需求上下文：mode 为 retrieval 时按测试点检索该需求最相关的top_k个片段，
+# 总量不超过 token_budget；检索不可用或无结果时回退为 full（整篇需求原文）
+TESTCASE_CONTEXT={
+    'mode': 'retrieval',
+    'top_k': 5,
+    'token_budget': 2000
+}
+
+# 批量调用大模型：把多个模块/测试点打包进一次请求，共用同一段指令；
+# 按本地估算的token数装箱，单批内容不超过 token_budget、不超过 max_items 个，
+# 响应被截断或格式错误时自动拆半重试
+LLM_BATCHING={
+    'enabled': True,
+    'token_budget': 6000,
+    'max_items': 5
+}
+
+# 大模型计价（元/百万tokens），用于按任务/阶段统计费用；cache_hit 为服务商上下文缓存命中的输入价格
+LLM_PRICING={
+    'deepseek-chat': {'input': 2.0, 'cache_hit': 0.5, 'output': 8.0}
+}
+
+# 需求分块：mode 为 local 时按标题、编号与篇幅在本地切分原文，大模型只为各区间标注模块与业务领域；
+# 为 llm 时由大模型直接输出分块原文。label_preview_tokens 为标注时每个区间送给大模型的内容上限
+# 超长文档按窗口并发处理（map-reduce）：每个窗口的内容不超过 window_tokens，
+# 相邻窗口重叠不超过 overlap_tokens 的区间，各窗口的模块在本地按模块名与业务领域合并去重
+CHUNKER={
+    'mode': 'local',
+    'max_tokens': 3000,
+    'min_tokens': 200,
+    'label_preview_tokens': 300,
+    'window_tokens': 16000,
+    'overlap_tokens': 1000
+}
+
+# 测试用例近似去重：落库前按用例名称、测试步骤与预期结果的 MinHash 签名（LSH 分桶）与本任务已生成的用例比对，
+# 估算相似度不低于 threshold 视为重复；mode 为 flag 时照常落库并在 duplicate_of 中标记最相似的用例，
+# 为 merge 时重复用例不落库
+TESTCASE_DEDUP={
+    'enabled': True,
+    'mode': 'flag',
+    'threshold': 0.75,
+    'num_perm': 64,
+    'shingle_size': 2
+}
+
+# 多需求批量分析：单次最多提交 max_requirements 个需求；每个批次同时执行的子任务不超过 max_concurrency 个，
+# 执行中子任务的预估输入token合计不超过 token_budget（提交时可按批次覆盖），子任务按需求优先级（P0-P3）领取
+BATCH_ANALYSIS={
+    'max_requirements': 200,
+    'max_concurrency': 4,
+    'token_budget': 200000
+}
@@ -1,4 +1,3 @@
-import os
 import re
 import json
 import random
@@ -10,22 +9,25 @@ from typing import Dict, Optional
 
 import PyPDF2  # 需要安装：pip install PyPDF2
 
-from openai import OpenAI
 from loguru import logger
 from husky.repositories.mysql_repository import MysqlRepository  # 更新导入路径
+from husky.services.llm_cache import cached_chat
+from husky.services.llm_schema import parse_response
 
 class Requirements:
-    def __init__(self, file_stream: BytesIO, filename: str):
+    def __init__(self, file_stream: BytesIO, filename: str, bypass_cache: bool = False, require_id: Optional[str] = None):
         """
         初始化需求解析器
         :param file_stream: 文件字节流
         :param filename: 原始文件名（用于提取信息）
+        :param bypass_cache: 是否忽略已缓存的大模型响应
+        :param require_id: 已有需求的ID，传入时作为该需求的修订版覆盖保存
         """
-        self.gpt = OpenAI(api_key=os.getenv("API_KEY"), base_url="https://api.deepseek.com")
+        self.bypass_cache = bypass_cache
         self.file_stream = file_stream
         self.filename = filename
         self.record = {
-            "require_id": self._generate_require_id(),
+            "require_id": require_id or self._generate_require_id(),
             "require_name": "",
             "description": "",
             "original_text": "",
@@ -128,18 +130,18 @@ class Requirements:
         
     def _parse_context_by_big_model(self) -> 'Requirements':
         prompt = self.load_prompt_template()
-        response = self.gpt.chat.completions.create(
-            model="deepseek-chat",
+        content = cached_chat(
             messages=[
                 {"role": "system", "content": prompt}
             ],
             # max_tokens='8K',
             temperature=1.0,
             response_format={"type": "json_object"},
-            stream=False
+            bypass_cache=self.bypass_cache,
+            usage={'require_id': self.record['require_id'], 'stage': 'describe'}
         )
         # 这里将测试用例存入数据库
-        requirement = json.loads(response.choices[0].message.content)
+        requirement = parse_response(content)
         logger.info(f'测试用例集：{requirement}')
         self.record['description'] = requirement.get('description')
         self.record['business_domain'] = requirement.get('business_domain')
@@ -180,25 +182,16 @@ class Requirements:
                     "is_deleted": False
                 }
 
-                with db.connection.cursor() as cursor:
-                    # 构造ON DUPLICATE KEY UPDATE语句
-                    columns = ', '.join([f'`{k}`' for k in data.keys()])
-                    placeholders = ', '.join(['%s'] * len(data))
-                    updates = ', '.join([f'`{k}`=VALUES(`{k}`)' for k in data.keys() if k != 'require_id'])
-                    
-                    sql = f"""
-                    INSERT INTO `requirements` ({columns}) 
-                    VALUES ({placeholders})
-                    ON DUPLICATE KEY UPDATE {updates}
-                    """
-                    
-                    cursor.execute(sql, tuple(data.values()))
-                    db.connection.commit()
-                    return True
+                # 构造ON DUPLICATE KEY UPDATE语句，主键不参与更新
+                db.bulk_upsert(
+                    'requirements',
+                    [data],
+                    update_columns=[k for k in data.keys() if k != 'require_id']
+                )
+                return True
                     
         except Exception as e:
             logger.error(f"需求存储失败: {e}")
-            db.connection.rollback()
             return False
 
     @classmethod
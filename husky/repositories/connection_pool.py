@@ -0,0 +1,250 @@
+import os
+import time
+import threading
+
+from collections import deque
+from typing import Dict, Optional
+
+import pymysql
+
+from loguru import logger
+
+from husky.config import LLM_MAX_WORKERS, MYSQL, MYSQL_POOL, TASK_QUEUE
+
+
+class PoolTimeoutError(pymysql.err.OperationalError):
+    """等待连接池超时"""
+
+
+class _PooledConnection:
+    """池内连接及其生命周期信息"""
+
+    __slots__ = ('raw', 'created_at', 'last_used_at')
+
+    def __init__(self, raw: pymysql.connections.Connection):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used_at = now
+
+
+class ConnectionPool:
+    """
+    线程安全的有界MySQL连接池
+    :param max_size: 最大连接数（含借出与空闲）
+    :param max_idle: 空闲连接最大保留秒数，超时即回收
+    :param max_lifetime: 连接最大存活秒数，超时即回收
+    :param ping_interval: 空闲超过该秒数的连接在借出前做一次ping健康检查
+    :param timeout: 借用连接的最大等待秒数
+    :param wait_warning: 借用等待超过该秒数时记录告警，便于发现连接池过小
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10,
+        max_idle: float = 300,
+        max_lifetime: float = 3600,
+        ping_interval: float = 30,
+        timeout: float = 10,
+        wait_warning: float = 1,
+        **connect_kwargs
+    ):
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self.wait_warning = wait_warning
+        self.connect_kwargs = connect_kwargs
+
+        self._idle = deque()
+        self._borrowed = {}
+        self._in_use = 0
+        self._waiters = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'borrowed': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0
+        }
+
+    def _connect(self) -> _PooledConnection:
+        raw = pymysql.connect(**self.connect_kwargs)
+        with self._cond:
+            self._stats['created'] += 1
+        return _PooledConnection(raw)
+
+    def _close(self, conn: _PooledConnection) -> None:
+        try:
+            conn.raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['closed'] += 1
+
+    def _is_expired(self, conn: _PooledConnection, now: float) -> bool:
+        return (now - conn.created_at > self.max_lifetime
+                or now - conn.last_used_at > self.max_idle)
+
+    def _is_healthy(self, conn: _PooledConnection, now: float) -> bool:
+        if now - conn.last_used_at < self.ping_interval:
+            return True
+        try:
+            conn.raw.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.warning(f"连接健康检查失败，丢弃连接: {e}")
+            return False
+
+    def acquire(self) -> pymysql.connections.Connection:
+        """借出一个连接，池满时阻塞等待直至超时"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            self._waiters += 1
+            try:
+                while not self._idle and self._in_use >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        logger.error(f"等待数据库连接超时({self.timeout}s)：使用中 {self._in_use}/{self.max_size}，"
+                                     f"等待者 {self._waiters}")
+                        raise PoolTimeoutError(f"等待数据库连接超时({self.timeout}s)")
+                    self._cond.wait(remaining)
+                candidate = self._idle.pop() if self._idle else None
+                self._in_use += 1
+            finally:
+                self._waiters -= 1
+            waited = time.monotonic() - start
+            self._stats['borrowed'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+            waiters = self._waiters
+        if waited >= self.wait_warning:
+            logger.warning(f"等待数据库连接 {waited:.2f}s（上限 {self.max_size}，仍有 {waiters} 个等待者），连接池可能过小")
+
+        # 建连与健康检查放在锁外，避免阻塞其他借用方
+        try:
+            now = time.monotonic()
+            if candidate and (self._is_expired(candidate, now) or not self._is_healthy(candidate, now)):
+                self._close(candidate)
+                candidate = None
+            if candidate is None:
+                candidate = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        candidate.last_used_at = time.monotonic()
+        with self._cond:
+            self._borrowed[id(candidate.raw)] = candidate
+        return candidate.raw
+
+    def release(self, raw: pymysql.connections.Connection, discard: bool = False) -> None:
+        """归还连接；未提交的事务会被回滚，避免快照泄漏给下一个借用方"""
+        with self._cond:
+            conn = self._borrowed.pop(id(raw), None)
+        if conn is None:
+            logger.warning("归还了不属于连接池的连接，直接关闭")
+            try:
+                raw.close()
+            except Exception:
+                pass
+            return
+
+        if not discard:
+            try:
+                raw.rollback()
+            except Exception as e:
+                logger.warning(f"归还连接时回滚失败，丢弃连接: {e}")
+                discard = True
+
+        now = time.monotonic()
+        if discard or now - conn.created_at > self.max_lifetime:
+            self._close(conn)
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            return
+
+        conn.last_used_at = now
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append(conn)
+            self._evict_idle(now)
+            self._cond.notify()
+
+    def _evict_idle(self, now: float) -> None:
+        """回收空闲过久的连接（调用方需持有锁），最久未用的连接在队首"""
+        while self._idle and now - self._idle[0].last_used_at > self.max_idle:
+            stale = self._idle.popleft()
+            try:
+                stale.raw.close()
+            except Exception:
+                pass
+            self._stats['closed'] += 1
+
+    def close(self) -> None:
+        """关闭所有空闲连接"""
+        with self._cond:
+            while self._idle:
+                conn = self._idle.popleft()
+                try:
+                    conn.raw.close()
+                except Exception:
+                    pass
+                self._stats['closed'] += 1
+
+    def stats(self) -> Dict:
+        """连接池指标"""
+        with self._cond:
+            borrowed = self._stats['borrowed']
+            return {
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiters': self._waiters,
+                'created': self._stats['created'],
+                'closed': self._stats['closed'],
+                'borrowed': borrowed,
+                'timeouts': self._stats['timeouts'],
+                'wait_time_total': round(self._stats['wait_time_total'], 6),
+                'wait_time_max': round(self._stats['wait_time_max'], 6),
+                'wait_time_avg': round(self._stats['wait_time_total'] / borrowed, 6) if borrowed else 0.0
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def pool_options() -> Dict:
+    """连接池参数：未配置 max_size 时按任务线程数与每个任务的大模型调用线程数估算"""
+    options = dict(MYSQL_POOL)
+    per_thread = options.pop('connections_per_thread', 2)
+    reserve = options.pop('reserve', 10)
+    if not options.get('max_size'):
+        threads = TASK_QUEUE['workers'] * (LLM_MAX_WORKERS + 1)
+        options['max_size'] = threads * per_thread + reserve
+    return options
+
+
+def get_pool() -> ConnectionPool:
+    """获取进程内共享的连接池（懒加载单例，fork后的子进程会重建自己的连接池）"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool_pid = os.getpid()
+                _pool = ConnectionPool(
+                    **pool_options(),
+                    **MYSQL,
+                    cursorclass=pymysql.cursors.DictCursor
+                )
+    return _pool
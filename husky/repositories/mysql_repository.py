@@ -1,16 +1,25 @@
+import re
 import json
+import time
+import threading
 import pymysql
 
 from loguru import logger
 
-from typing import Dict, List, Optional, Union, Any
+from typing import Dict, Iterator, List, Optional, Tuple, Union, Any
 
-from husky.config import MYSQL
+from husky.repositories.connection_pool import get_pool
+
+# 进程内计数缓存：(table, where_clause, params) -> (total, expires_at)
+_count_cache: Dict[tuple, Tuple[int, float]] = {}
+_count_lock = threading.Lock()
 
 
 class MysqlRepository:
     def __init__(self):
-        self.connection = pymysql.connect(**MYSQL, cursorclass=pymysql.cursors.DictCursor)
+        # 从进程级连接池借用连接，退出上下文时归还
+        self.pool = get_pool()
+        self.connection = self.pool.acquire()
     
     def get_current_time(self):
         """获取当前时间"""
@@ -23,7 +32,20 @@ class MysqlRepository:
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.connection.close()
+        self.close()
+
+    def close(self):
+        """归还连接到连接池，发生网络类错误的连接直接丢弃"""
+        if self.connection is None:
+            return
+        broken = not self.connection.open
+        self.pool.release(self.connection, discard=broken)
+        self.connection = None
+
+    @staticmethod
+    def pool_stats() -> Dict:
+        """连接池指标（使用中、等待者、等待时长等）"""
+        return get_pool().stats()
 
     def create(
         self, 
@@ -68,11 +90,152 @@ class MysqlRepository:
             self.connection.rollback()
             return False
 
+    @staticmethod
+    def _to_db_value(value: Any) -> Any:
+        """JSON字段序列化、布尔值转整型"""
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, ensure_ascii=False)
+        if isinstance(value, bool):
+            return int(value)
+        return value
+
+    def bulk_upsert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        chunk_size: int = 200,
+        update_columns: Optional[List[str]] = None,
+        commit: bool = True
+    ) -> int:
+        """
+        批量插入或更新（多行VALUES + ON DUPLICATE KEY UPDATE）
+        :param table: 表名
+        :param rows: 待写入的行，列结构相同的行共用同一条SQL
+        :param chunk_size: 每条INSERT语句携带的最大行数，每批提交一次
+        :param update_columns: 主键冲突时需要更新的列，默认更新全部列；某种列结构中一个都不存在时抛出 ValueError
+        :param commit: 为False时不提交，由调用方在同一事务中统一提交；出错时仍会回滚
+        :return: 受影响行数
+        """
+        if not rows:
+            return 0
+
+        # 1. 按列结构分组，每种结构只构造一次SQL；先校验全部结构，避免写入一部分后才发现列名错误
+        shapes: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in rows:
+            shapes.setdefault(tuple(row.keys()), []).append(row)
+        statements = []
+        for columns, group in shapes.items():
+            targets = [k for k in (update_columns or columns) if k in columns]
+            if not targets:
+                raise ValueError(f"bulk_upsert 的 update_columns {update_columns} 均不在写入的列 {list(columns)} 中")
+            column_sql = ', '.join([f'`{k}`' for k in columns])
+            update_set = ', '.join([f'`{k}` = VALUES(`{k}`)' for k in targets])
+            prefix = f"INSERT INTO `{table}` ({column_sql}) VALUES "
+            suffix = f" ON DUPLICATE KEY UPDATE {update_set}"
+            statements.append((columns, group, prefix, suffix))
+
+        affected = 0
+        try:
+            with self.connection.cursor() as cursor:
+                for columns, group, prefix, suffix in statements:
+                    row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+                    logger.debug(f"bulk_upsert: {prefix}... {suffix} ({len(group)} rows)")
+
+                    # 2. 多行VALUES分批发送，每批提交一次
+                    for start in range(0, len(group), chunk_size):
+                        batch = group[start:start + chunk_size]
+                        params = [self._to_db_value(row[k]) for row in batch for k in columns]
+                        sql = prefix + ', '.join([row_placeholder] * len(batch)) + suffix
+                        cursor.execute(sql, params)
+                        if commit:
+                            self.connection.commit()
+                        affected += cursor.rowcount
+            return affected
+        except pymysql.Error as e:
+            logger.error(f"Bulk upsert error: {e}")
+            self.connection.rollback()
+            raise
+
+    # where条件的操作符后缀，例如 {'created_at__gte': '2025-01-01'}
+    OPERATORS = {
+        'eq': '=',
+        'ne': '!=',
+        'gt': '>',
+        'gte': '>=',
+        'lt': '<',
+        'lte': '<=',
+        'in': 'IN',
+        'not_in': 'NOT IN',
+        'contains': 'JSON_CONTAINS'
+    }
+
+    @staticmethod
+    def _quote(column: str) -> str:
+        """校验并转义列名，防止通过列名注入SQL"""
+        if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', column):
+            raise ValueError(f"非法列名: {column}")
+        return f'`{column}`'
+
+    @classmethod
+    def _build_where(cls, where: Optional[Dict[str, Any]]) -> Tuple[str, tuple]:
+        """
+        构造WHERE子句
+        - 普通键值：`col` = %s
+        - 列表/元组/集合：`col` IN (...)，空集合恒为假
+        - None：`col` IS NULL
+        - 带后缀的键：col__gt/gte/lt/lte/ne/in/not_in
+        - JSON数组包含：col__contains，值为单个元素或元素列表
+        """
+        if not where:
+            return '', ()
+
+        conditions, params = [], []
+        for key, value in where.items():
+            column, _, suffix = key.partition('__')
+            op = cls.OPERATORS.get(suffix or 'eq')
+            if op is None:
+                raise ValueError(f"不支持的查询操作符: {suffix}")
+            column = cls._quote(column)
+            if op == 'JSON_CONTAINS':
+                conditions.append(f"JSON_CONTAINS({column}, %s)")
+                params.append(json.dumps(value if isinstance(value, list) else [value], ensure_ascii=False))
+            elif isinstance(value, (list, tuple, set)) and op in ('=', 'IN', '!=', 'NOT IN'):
+                values = list(value)
+                negate = op in ('!=', 'NOT IN')
+                if not values:
+                    conditions.append('1 = 1' if negate else '1 = 0')
+                    continue
+                placeholders = ', '.join(['%s'] * len(values))
+                conditions.append(f"{column} {'NOT IN' if negate else 'IN'} ({placeholders})")
+                params.extend(values)
+            elif value is None and op in ('=', '!='):
+                conditions.append(f"{column} IS {'NOT ' if op == '!=' else ''}NULL")
+            else:
+                conditions.append(f"{column} {op} %s")
+                params.append(value)
+        return " WHERE " + " AND ".join(conditions), tuple(params)
+
+    @classmethod
+    def _build_order_by(cls, order_by: Optional[List[str]]) -> str:
+        """构造ORDER BY子句，`-col` 表示降序"""
+        if not order_by:
+            return ''
+        terms = []
+        for term in order_by:
+            if term.startswith('-'):
+                terms.append(f"{cls._quote(term[1:])} DESC")
+            else:
+                terms.append(f"{cls._quote(term)} ASC")
+        return " ORDER BY " + ", ".join(terms)
+
     def search(
         self,
         table: str,
         columns: Optional[List[str]] = None,
-        where: Optional[Dict[str, Union[str, int]]] = None
+        where: Optional[Dict[str, Any]] = None,
+        order_by: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
     ) -> List[Dict]:
         """通用查询操作"""
         try:
@@ -80,15 +243,18 @@ class MysqlRepository:
                 # 选择列处理
                 select_columns = '*' if not columns else ', '.join(columns)
                 
-                # 条件处理
-                where_clause = ''
-                params = ()
-                if where:
-                    conditions = [f"{k} = %s" for k in where.keys()]
-                    where_clause = " WHERE " + " AND ".join(conditions)
-                    params = tuple(where.values())
+                # 条件与排序处理
+                where_clause, params = self._build_where(where)
+                order_clause = self._build_order_by(order_by)
+                
+                # 分页处理
+                limit_clause = ''
+                if limit is not None:
+                    limit_clause = f" LIMIT {int(limit)}"
+                    if offset:
+                        limit_clause += f" OFFSET {int(offset)}"
                 
-                sql = f"SELECT {select_columns} FROM `{table}`{where_clause}"
+                sql = f"SELECT {select_columns} FROM `{table}`{where_clause}{order_clause}{limit_clause}"
                 logger.info(f"search: {sql}")
                 cursor.execute(sql, params)
                 return cursor.fetchall()
@@ -96,23 +262,183 @@ class MysqlRepository:
             print(f"Read error: {e}")
             return []
 
+    def search_in(
+        self,
+        table: str,
+        column: str,
+        values: List[Any],
+        columns: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 500
+    ) -> List[Dict]:
+        """按IN列表批量查询，超长列表按chunk_size分批，避免单条SQL过大"""
+        values = list(dict.fromkeys(values))
+        rows = []
+        for start in range(0, len(values), chunk_size):
+            conditions = dict(where or {})
+            conditions[f"{column}__in"] = values[start:start + chunk_size]
+            rows.extend(self.search(table, columns=columns, where=conditions))
+        return rows
+
+    def stream(
+        self,
+        table: str,
+        columns: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        order_by: Optional[List[str]] = None,
+        batch_size: int = 500
+    ) -> Iterator[Dict]:
+        """
+        使用服务端游标（SSDictCursor）逐批读取，内存占用与结果集大小无关
+        调用方须在同一个 with MysqlRepository() 作用域内消费完生成器
+        """
+        where_clause, params = self._build_where(where)
+        order_clause = self._build_order_by(order_by)
+        select_columns = '*' if not columns else ', '.join(columns)
+        sql = f"SELECT {select_columns} FROM `{table}`{where_clause}{order_clause}"
+        logger.info(f"stream: {sql}")
+
+        finished = False
+        cursor = self.connection.cursor(pymysql.cursors.SSDictCursor)
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+            finished = True
+        finally:
+            if finished:
+                cursor.close()
+            else:
+                # 中途放弃时关闭连接，避免为排空剩余结果集而继续读取；归还时连接会被丢弃
+                self.connection.close()
+
+    def keyset_search(
+        self,
+        table: str,
+        sort_keys: List[str],
+        after: Optional[List[Any]] = None,
+        descending: bool = True,
+        limit: int = 10,
+        columns: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """
+        键集分页（seek method）：按sort_keys排序，从after游标之后继续取limit行
+        :param sort_keys: 排序列，末列必须唯一（如主键），需有对应的联合索引
+        :param after: 上一页最后一行对应sort_keys的值
+        :param descending: 是否降序
+        """
+        where_clause, params = self._build_where(where)
+        params = list(params)
+        quoted = [self._quote(k) for k in sort_keys]
+        op = '<' if descending else '>'
+
+        if after is not None:
+            # (a, b) < (x, y) 展开为 a < x OR (a = x AND b < y)，保证走索引范围扫描
+            branches = []
+            for i in range(len(quoted)):
+                terms = [f"{quoted[j]} = %s" for j in range(i)] + [f"{quoted[i]} {op} %s"]
+                branches.append('(' + ' AND '.join(terms) + ')')
+                params.extend(list(after[:i]) + [after[i]])
+            seek = '(' + ' OR '.join(branches) + ')'
+            where_clause = f"{where_clause} AND {seek}" if where_clause else f" WHERE {seek}"
+
+        direction = 'DESC' if descending else 'ASC'
+        order_clause = " ORDER BY " + ", ".join([f"{k} {direction}" for k in quoted])
+        select_columns = '*' if not columns else ', '.join(columns)
+        sql = f"SELECT {select_columns} FROM `{table}`{where_clause}{order_clause} LIMIT {int(limit)}"
+        logger.debug(f"keyset_search: {sql}")
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, tuple(params))
+            return cursor.fetchall()
+
+    def count(
+        self,
+        table: str,
+        where: Optional[Dict[str, Any]] = None,
+        ttl: float = 0
+    ) -> int:
+        """
+        统计行数，ttl>0 时在进程内缓存结果
+        未过滤的表总数可通过 bump_count 增量维护，避免频繁全表COUNT
+        """
+        where_clause, params = self._build_where(where)
+        key = (table, where_clause, params)
+        if ttl > 0:
+            with _count_lock:
+                cached = _count_cache.get(key)
+                if cached and cached[1] > time.monotonic():
+                    return cached[0]
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) AS total FROM `{table}`{where_clause}", params)
+            total = cursor.fetchone()['total']
+
+        if ttl > 0:
+            with _count_lock:
+                _count_cache[key] = (total, time.monotonic() + ttl)
+        return total
+
+    def aggregate(
+        self,
+        table: str,
+        metrics: Dict[str, str],
+        where: Optional[Dict[str, Any]] = None,
+        group_by: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        分组聚合统计
+        :param metrics: 结果列名 -> 聚合表达式（如 {'calls': 'COUNT(*)'}），表达式由调用方写定，不能来自用户输入
+        :param group_by: 分组列，结果中同时返回这些列
+        """
+        where_clause, params = self._build_where(where)
+        group_columns = [self._quote(column) for column in group_by or []]
+        select_columns = ', '.join(
+            group_columns + [f"{expression} AS {self._quote(alias)}" for alias, expression in metrics.items()]
+        )
+        group_clause = f" GROUP BY {', '.join(group_columns)}" if group_columns else ''
+        sql = f"SELECT {select_columns} FROM `{table}`{where_clause}{group_clause}"
+        logger.debug(f"aggregate: {sql}")
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    @staticmethod
+    def bump_count(table: str, delta: int = 1) -> None:
+        """增量维护缓存的表总数；带条件的计数无法推算，直接失效"""
+        with _count_lock:
+            for key in list(_count_cache.keys()):
+                if key[0] != table:
+                    continue
+                if key[1]:
+                    _count_cache.pop(key, None)
+                else:
+                    total, expires_at = _count_cache[key]
+                    _count_cache[key] = (max(0, total + delta), expires_at)
+
     def update(
         self,
         table: str,
         update_data: Dict[str, Union[str, int, bool]],
-        where: Dict[str, Union[str, int]]
+        where: Dict[str, Any]
     ) -> int:
-        """通用更新操作"""
+        """通用更新操作，where 不能为空，防止误更新整张表"""
+        if not where:
+            raise ValueError("update 必须指定 where 条件")
         try:
             with self.connection.cursor() as cursor:
                 # 更新字段处理
-                set_clause = ', '.join([f"`{k}` = %s" for k in update_data.keys()])
+                set_clause = ', '.join([f"{self._quote(k)} = %s" for k in update_data.keys()])
                 
                 # 条件处理
-                where_clause = ' AND '.join([f"`{k}` = %s" for k in where.keys()])
+                where_clause, where_params = self._build_where(where)
                 
-                sql = f"UPDATE {table} SET {set_clause} WHERE {where_clause}"
-                params = tuple(update_data.values()) + tuple(where.values())
+                sql = f"UPDATE `{table}` SET {set_clause}{where_clause}"
+                params = tuple(update_data.values()) + where_params
                 
                 cursor.execute(sql, params)
                 self.connection.commit()
@@ -125,18 +451,58 @@ class MysqlRepository:
     def delete(
         self,
         table: str,
-        where: Dict[str, Union[str, int]]
+        where: Dict[str, Any]
     ) -> int:
-        """通用删除操作"""
+        """通用删除操作，where 不能为空，防止误删整张表"""
+        if not where:
+            raise ValueError("delete 必须指定 where 条件")
         try:
             with self.connection.cursor() as cursor:
-                where_clause = ' AND '.join([f"{k} = %s" for k in where.keys()])
-                sql = f"DELETE FROM `{table}` WHERE {where_clause}"
+                where_clause, params = self._build_where(where)
+                sql = f"DELETE FROM `{table}`{where_clause}"
                 logger.info(f'sql: {sql}')
-                cursor.execute(sql, tuple(where.values()))
+                cursor.execute(sql, params)
                 self.connection.commit()
                 return cursor.rowcount
         except pymysql.Error as e:
             print(f"Delete error: {e}")
             self.connection.rollback()
-            return 0
\ No newline at end of file
+            return 0
+
+class BatchWriter:
+    """
+    线程安全的批量写入缓冲：累计到batch_size行时自动 bulk_upsert，
+    适合在流式生成结果时边产出边落库
+    :param on_flush: 每批写入成功后的回调，参数为本批行数据
+    """
+
+    def __init__(self, table: str, batch_size: int = 20, on_flush=None):
+        self.table = table
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.written = 0
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def add(self, row: Dict[str, Any]) -> None:
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) < self.batch_size:
+                return
+            rows, self._rows = self._rows, []
+        self._write(rows)
+
+    def flush(self) -> None:
+        with self._lock:
+            rows, self._rows = self._rows, []
+        self._write(rows)
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        with MysqlRepository() as db:
+            db.bulk_upsert(self.table, rows)
+        with self._lock:
+            self.written += len(rows)
+        if self.on_flush:
+            self.on_flush(rows)
@@ -0,0 +1,311 @@
+import json
+import math
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pymysql
+from loguru import logger
+
+from husky.config import BATCH_ANALYSIS, LLM_BATCHING, TESTCASE_CONTEXT
+from husky.repositories.mysql_repository import MysqlRepository
+from husky.services.event_bus import TERMINAL_STATUSES, event_bus
+from husky.services.token_counter import CJK_TOKEN_RATE
+from husky.utils import get_husky_id, parse_bool
+
+BATCH_TASK_TYPE = 'batch_analysis'
+
+# 需求优先级 -> 调度优先级（数值越小越先执行），未知优先级按 P2
+PRIORITIES = {'P0': 0, 'P1': 1, 'P2': 2, 'P3': 3}
+DEFAULT_PRIORITY = PRIORITIES['P2']
+
+
+def requirement_priority(require_id: Optional[str]) -> int:
+    """单个任务的调度优先级，取自需求的优先级"""
+    if not require_id:
+        return DEFAULT_PRIORITY
+    with MysqlRepository() as db:
+        rows = db.search('requirements', columns=['priority'], where={'require_id': require_id})
+    return PRIORITIES.get(rows[0]['priority'], DEFAULT_PRIORITY) if rows else DEFAULT_PRIORITY
+
+
+class BatchService:
+    """
+    多需求批量分析：一个父任务（batch_analysis）下为每个需求创建一个子任务，
+    子任务进入同一个任务队列，按需求优先级领取，同一批次同时执行的子任务数与预估token数受批次预算约束；
+    父任务不被工作进程领取，其状态与进度由子任务汇总得出
+    """
+
+    def submit(self, task_type: str, items: List[Dict], options: Dict) -> Dict:
+        """
+        创建父任务与子任务
+        :param items: [{'require_id', 'point_ids'}]，point_ids 仅测试用例生成需要
+        :param options: no_cache、full 以及批次预算 max_concurrency、token_budget
+        :return: 父任务ID、子任务列表与不存在的需求ID
+        """
+        # 同一需求出现多次时合并其测试点
+        point_ids: Dict[str, List[str]] = {}
+        for item in items:
+            merged = point_ids.setdefault(item['require_id'], [])
+            merged.extend(point_id for point_id in item.get('point_ids') or [] if point_id not in merged)
+        require_ids = list(point_ids)
+        with MysqlRepository() as db:
+            rows = db.search(
+                'requirements',
+                columns=['require_id', 'priority', 'CHAR_LENGTH(`original_text`) AS `text_length`'],
+                where={'require_id': require_ids, 'is_deleted': 0}
+            )
+        found = {row['require_id']: row for row in rows}
+        missing = [require_id for require_id in require_ids if require_id not in found]
+        if len(found) < len(require_ids):
+            logger.warning(f"批量分析中 {len(missing)} 个需求不存在: {missing}")
+        if not found:
+            raise ValueError(f"需求均不存在: {missing}")
+
+        parent_id = get_husky_id('TASK')
+        budget = {
+            'max_concurrency': max(1, int(options.get('max_concurrency') or BATCH_ANALYSIS['max_concurrency'])),
+            'token_budget': max(1, int(options.get('token_budget') or BATCH_ANALYSIS['token_budget']))
+        }
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        children = []
+        for require_id in require_ids:
+            requirement = found.get(require_id)
+            if not requirement:
+                continue
+            payload = {'no_cache': parse_bool(options.get('no_cache'))}
+            if task_type == 'point_analysis':
+                payload['full'] = parse_bool(options.get('full'))
+            else:
+                payload['point_ids'] = point_ids[require_id]
+            payload['est_tokens'] = self._estimate_tokens(task_type, requirement['text_length'] or 0, point_ids[require_id])
+            children.append({
+                'task_id': get_husky_id('TASK'),
+                'require_id': require_id,
+                'task_type': task_type,
+                'parent_id': parent_id,
+                'priority': PRIORITIES.get(requirement['priority'], DEFAULT_PRIORITY),
+                'status': 'pending',
+                'progress': 0,
+                'message': '等待调度',
+                'payload': payload,
+                'start_time': now
+            })
+
+        parent = {
+            'task_id': parent_id,
+            'task_type': BATCH_TASK_TYPE,
+            'priority': min(child['priority'] for child in children),
+            'status': 'pending',
+            'progress': 0,
+            'message': f"等待调度，共 {len(children)} 个需求",
+            'payload': {'task_type': task_type, 'total': len(children), **budget},
+            'start_time': now
+        }
+        # 父任务与全部子任务在同一事务中写入，失败时整体回滚，不会留下没有子任务或子任务不全的批次
+        with MysqlRepository() as db:
+            db.bulk_upsert('tasks', [parent] + children, commit=False)
+            try:
+                db.connection.commit()
+            except pymysql.Error:
+                db.connection.rollback()
+                raise
+        MysqlRepository.bump_count('tasks', len(children) + 1)
+        event_bus.publish(parent_id, 'status', {
+            'task_type': BATCH_TASK_TYPE,
+            'status': 'pending',
+            'progress': 0,
+            'message': f"等待调度，共 {len(children)} 个需求"
+        })
+        logger.info(f"批量任务 {parent_id} 已创建 {len(children)} 个{task_type}子任务，预算 {budget}")
+        return {
+            'task_id': parent_id,
+            'status': 'pending',
+            'children': [
+                {'task_id': child['task_id'], 'require_id': child['require_id'], 'priority': child['priority']}
+                for child in children
+            ],
+            'missing_require_ids': missing,
+            **budget
+        }
+
+    @staticmethod
+    def _estimate_tokens(task_type: str, text_length: int, point_ids: Optional[List[str]]) -> int:
+        """
+        子任务的预估输入token数，用于批次token预算：功能点分析约为需求原文长度；
+        测试用例生成按测试点数与每次请求的需求上下文估算
+        """
+        text_tokens = math.ceil(text_length * CJK_TOKEN_RATE)
+        if task_type == 'point_analysis':
+            return text_tokens
+        points = len(point_ids or [])
+        if TESTCASE_CONTEXT['mode'] == 'retrieval':
+            return points * min(text_tokens, TESTCASE_CONTEXT['token_budget'])
+        return math.ceil(points / LLM_BATCHING['max_items']) * text_tokens
+
+    @staticmethod
+    def lock_budgets(cursor) -> Dict[str, Dict]:
+        """
+        在领取事务内锁定所有未结束批次的父任务行，使多个工作进程对批次的领取串行化，
+        并读取各批次的预算与执行中子任务的占用：{parent_id: {max_concurrency, token_budget, running, tokens}}
+        """
+        cursor.execute(
+            "SELECT `task_id`, `payload` FROM `tasks` WHERE `task_type` = %s "
+            "AND `status` IN ('pending', 'processing') ORDER BY `task_id` FOR UPDATE",
+            (BATCH_TASK_TYPE,)
+        )
+        budgets = {}
+        for row in cursor.fetchall():
+            payload = json.loads(row['payload']) if isinstance(row['payload'], str) else row['payload'] or {}
+            budgets[row['task_id']] = {
+                'max_concurrency': payload.get('max_concurrency', BATCH_ANALYSIS['max_concurrency']),
+                'token_budget': payload.get('token_budget', BATCH_ANALYSIS['token_budget']),
+                'running': 0,
+                'tokens': 0
+            }
+        if budgets:
+            cursor.execute(
+                "SELECT `parent_id`, COUNT(*) AS `running`, "
+                "COALESCE(SUM(JSON_EXTRACT(`payload`, '$.est_tokens')), 0) AS `tokens` FROM `tasks` "
+                f"WHERE `parent_id` IN ({', '.join(['%s'] * len(budgets))}) AND `status` = 'processing' "
+                "GROUP BY `parent_id`",
+                tuple(budgets)
+            )
+            for row in cursor.fetchall():
+                budgets[row['parent_id']].update(running=int(row['running']), tokens=int(row['tokens']))
+        return budgets
+
+    @staticmethod
+    def saturated(budgets: Dict[str, Dict]) -> List[str]:
+        """并发或token预算已用满的批次，其子任务在领取查询中直接排除"""
+        return [
+            parent_id for parent_id, budget in budgets.items()
+            if budget['running'] >= budget['max_concurrency']
+            or (budget['running'] and budget['tokens'] >= budget['token_budget'])
+        ]
+
+    @staticmethod
+    def select_claimable(candidates: List[Dict], budgets: Dict[str, Dict], limit: int) -> List[str]:
+        """
+        从候选任务（已按优先级排序）中挑出不超出所属批次预算的任务，并把选中的子任务计入批次占用；
+        批次内没有执行中的子任务时，即使单个子任务超出token预算也允许领取
+        """
+        selected = []
+        for task in candidates:
+            if len(selected) >= limit:
+                break
+            parent_id = task.get('parent_id')
+            if parent_id:
+                budget = budgets.setdefault(parent_id, {
+                    'max_concurrency': BATCH_ANALYSIS['max_concurrency'],
+                    'token_budget': BATCH_ANALYSIS['token_budget'],
+                    'running': 0,
+                    'tokens': 0
+                })
+                payload = task['payload'] if isinstance(task['payload'], dict) else json.loads(task['payload'] or '{}')
+                cost = int(payload.get('est_tokens') or 0)
+                if budget['running'] >= budget['max_concurrency']:
+                    continue
+                if budget['running'] and budget['tokens'] + cost > budget['token_budget']:
+                    continue
+                budget['running'] += 1
+                budget['tokens'] += cost
+            selected.append(task['task_id'])
+        return selected
+
+    def refresh(self, parent_ids: Optional[List[str]] = None) -> int:
+        """
+        由子任务汇总父任务的状态、进度与统计，未指定时汇总所有未结束的批次；返回状态有变化的父任务数
+        - 子任务全部结束：有成功的为 completed，否则有失败的为 failed，其余为 cancelled
+        - 有子任务已开始为 processing，否则为 pending
+        """
+        from husky.services.task_service import TaskService
+
+        where = {'task_type': BATCH_TASK_TYPE, 'status__in': ['pending', 'processing']}
+        if parent_ids is not None:
+            if not parent_ids:
+                return 0
+            where['task_id'] = list(parent_ids)
+        with MysqlRepository() as db:
+            parents = db.search('tasks', columns=['task_id', 'status', 'progress', 'message'], where=where)
+            if not parents:
+                return 0
+            rows = db.aggregate(
+                'tasks',
+                {'tasks': 'COUNT(*)', 'progress': 'SUM(`progress`)'},
+                where={'parent_id': [parent['task_id'] for parent in parents]},
+                group_by=['parent_id', 'status']
+            )
+
+        stats: Dict[str, Dict] = {}
+        for row in rows:
+            counts = stats.setdefault(row['parent_id'], {'statuses': {}, 'progress': 0})
+            counts['statuses'][row['status']] = int(row['tasks'])
+            # 已结束的子任务按100%计入进度
+            counts['progress'] += int(row['tasks']) * 100 if row['status'] in TERMINAL_STATUSES else int(row['progress'] or 0)
+
+        changed = 0
+        service = TaskService()
+        for parent in parents:
+            counts = stats.get(parent['task_id'])
+            if not counts:
+                continue
+            statuses = counts['statuses']
+            total = sum(statuses.values())
+            finished = sum(statuses.get(status, 0) for status in TERMINAL_STATUSES)
+            if finished == total:
+                status = 'completed' if statuses.get('completed') else 'failed' if statuses.get('failed') else 'cancelled'
+            else:
+                status = 'pending' if statuses.get('pending', 0) == total else 'processing'
+            progress = counts['progress'] // total
+            message = (f"已完成 {statuses.get('completed', 0)}/{total} 个需求，执行中 {statuses.get('processing', 0)}，"
+                       f"排队 {statuses.get('pending', 0)}，失败 {statuses.get('failed', 0)}，取消 {statuses.get('cancelled', 0)}")
+            if (status, progress, message) == (parent['status'], parent['progress'], parent['message']):
+                continue
+            service.update_task_status(
+                parent['task_id'],
+                status=status,
+                progress=progress,
+                message=message,
+                result=json.dumps({'total': total, 'statuses': statuses})
+            )
+            changed += 1
+        return changed
+
+    @staticmethod
+    def cancel_children(parent_id: str, keep_partial: bool) -> List[str]:
+        """取消批次中未结束的子任务，返回被取消的子任务ID；执行中的子任务由工作进程中断后按 keep_partial 收尾"""
+        with MysqlRepository() as db:
+            conn = db.connection
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT `task_id` FROM `tasks` WHERE `parent_id` = %s "
+                        "AND `status` IN ('pending', 'processing') FOR UPDATE",
+                        (parent_id,)
+                    )
+                    task_ids = [row['task_id'] for row in cursor.fetchall()]
+                    if task_ids:
+                        cursor.execute(
+                            "UPDATE `tasks` SET `status` = 'cancelled', `message` = '批量任务已取消', `end_time` = NOW(), "
+                            "`payload` = JSON_SET(COALESCE(`payload`, JSON_OBJECT()), '$.keep_partial', %s) "
+                            f"WHERE `task_id` IN ({', '.join(['%s'] * len(task_ids))})",
+                            (keep_partial, *task_ids)
+                        )
+                conn.commit()
+            except pymysql.Error:
+                conn.rollback()
+                raise
+        for task_id in task_ids:
+            event_bus.publish(task_id, 'status', {'status': 'cancelled', 'message': '批量任务已取消'})
+        return task_ids
+
+    @staticmethod
+    def resume_children(parent_id: str) -> int:
+        """失败或取消的子任务重新排队，按各自的检查点续跑"""
+        with MysqlRepository() as db:
+            return db.update(
+                'tasks',
+                {'status': 'pending', 'progress': 0, 'message': '等待续跑', 'attempts': 0, 'result': None, 'end_time': None},
+                where={'parent_id': parent_id, 'status__in': ['failed', 'cancelled']}
+            )
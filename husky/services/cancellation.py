@@ -0,0 +1,112 @@
+import threading
+
+from typing import Callable, Dict
+
+
+class TaskCancelled(Exception):
+    """任务已被取消，流水线在检查点或进行中的大模型调用处抛出"""
+
+
+class CancelToken:
+    """
+    单个任务的取消令牌：流水线在步骤之间检查，
+    进行中的大模型流式请求注册关闭回调，取消时立即断开
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # 连接可能已经关闭，忽略即可
+                pass
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise TaskCancelled()
+
+    def wait(self, timeout: float) -> bool:
+        """等待至多timeout秒，期间被取消时提前返回True，用于可打断的休眠"""
+        return self._event.wait(timeout)
+
+    def register(self, callback: Callable[[], None]) -> None:
+        """登记取消时要执行的回调（如关闭HTTP流）；已取消时立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.add(callback)
+                return
+        callback()
+
+    def unregister(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            self._callbacks.discard(callback)
+
+    def guard(self, limiter: threading.Semaphore) -> 'CancellableSlot':
+        """包装并发额度，等待额度期间任务被取消时不再继续等待"""
+        return CancellableSlot(limiter, self)
+
+
+class CancellableSlot:
+    """可被取消令牌打断等待的信号量额度，接口与信号量一致"""
+
+    def __init__(self, limiter: threading.Semaphore, token: CancelToken, poll: float = 0.5):
+        self.limiter = limiter
+        self.token = token
+        self.poll = poll
+
+    def acquire(self) -> bool:
+        while not self.limiter.acquire(timeout=self.poll):
+            self.token.raise_if_cancelled()
+        if self.token.cancelled:
+            self.limiter.release()
+            raise TaskCancelled()
+        return True
+
+    def release(self) -> None:
+        self.limiter.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+# 本进程内正在执行的任务的取消令牌
+_tokens: Dict[str, CancelToken] = {}
+_tokens_lock = threading.Lock()
+
+
+def register_token(task_id: str) -> CancelToken:
+    with _tokens_lock:
+        return _tokens.setdefault(task_id, CancelToken())
+
+
+def release_token(task_id: str) -> None:
+    with _tokens_lock:
+        _tokens.pop(task_id, None)
+
+
+def cancel_task(task_id: str) -> bool:
+    """取消本进程内正在执行的任务，任务不在本进程执行时返回False"""
+    with _tokens_lock:
+        token = _tokens.get(task_id)
+    if token is None:
+        return False
+    token.cancel()
+    return True
@@ -0,0 +1,103 @@
+import json
+
+from typing import Any, Dict, List, Optional
+
+import pymysql
+from loguru import logger
+
+from husky.repositories.mysql_repository import MysqlRepository
+
+
+class CheckpointStore:
+    """
+    流水线工作单元的检查点（表结构见 sql/task_units.sql）
+    每个阶段按工作单元（需求分块、单个模块、单个测试点）记录状态、重试次数与产出，
+    续跑或重试时只重新执行未完成的单元
+    """
+
+    TABLE = 'task_units'
+
+    def load(self, task_id: str, stage: str) -> Dict[str, Dict]:
+        """读取某阶段的全部单元，按 unit_key 索引"""
+        with MysqlRepository() as db:
+            rows = db.search(self.TABLE, where={'task_id': task_id, 'stage': stage})
+        units = {}
+        for row in rows:
+            if isinstance(row.get('output'), str):
+                row['output'] = json.loads(row['output'])
+            units[row['unit_key']] = row
+        return units
+
+    @staticmethod
+    def completed(units: Dict[str, Dict]) -> set:
+        return {key for key, unit in units.items() if unit['status'] == 'completed'}
+
+    def start(self, task_id: str, stage: str, unit_key: Any) -> None:
+        """单元开始执行，累加执行次数"""
+        with MysqlRepository() as db:
+            conn = db.connection
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"INSERT INTO `{self.TABLE}` (`task_id`, `stage`, `unit_key`, `status`, `attempts`) "
+                        "VALUES (%s, %s, %s, 'running', 1) "
+                        "ON DUPLICATE KEY UPDATE `status` = 'running', `attempts` = `attempts` + 1, `error` = NULL",
+                        (task_id, stage, str(unit_key))
+                    )
+                conn.commit()
+            except pymysql.Error:
+                conn.rollback()
+                raise
+
+    def complete(self, task_id: str, stage: str, unit_key: Any, output: Any = None) -> None:
+        with MysqlRepository() as db:
+            db.update(
+                self.TABLE,
+                {'status': 'completed', 'output': json.dumps(output, ensure_ascii=False), 'error': None},
+                where={'task_id': task_id, 'stage': stage, 'unit_key': str(unit_key)}
+            )
+
+    def mark_completed(self, task_id: str, stage: str, outputs: Dict[Any, Any]) -> None:
+        """把无需执行的单元直接记为已完成（如增量分析中沿用上一版结果的模块）"""
+        if not outputs:
+            return
+        with MysqlRepository() as db:
+            db.bulk_upsert(self.TABLE, [
+                {
+                    'task_id': task_id,
+                    'stage': stage,
+                    'unit_key': str(unit_key),
+                    'status': 'completed',
+                    'attempts': 0,
+                    'output': json.dumps(output, ensure_ascii=False)
+                }
+                for unit_key, output in outputs.items()
+            ], update_columns=['status', 'output'])
+
+    def fail(self, task_id: str, stage: str, unit_key: Any, error: str) -> None:
+        with MysqlRepository() as db:
+            db.update(
+                self.TABLE,
+                {'status': 'failed', 'error': error[:2000]},
+                where={'task_id': task_id, 'stage': stage, 'unit_key': str(unit_key)}
+            )
+
+    def list(self, task_id: str, stage: Optional[str] = None) -> List[Dict]:
+        """任务的单元明细（不含产出）"""
+        where = {'task_id': task_id}
+        if stage:
+            where['stage'] = stage
+        with MysqlRepository() as db:
+            return db.search(
+                self.TABLE,
+                columns=['stage', 'unit_key', 'status', 'attempts', 'error', 'created_at', 'updated_at'],
+                where=where,
+                order_by=['stage', 'created_at']
+            )
+
+    def clear(self, task_id: str) -> int:
+        """清空任务的检查点，之后续跑将从头执行"""
+        with MysqlRepository() as db:
+            removed = db.delete(self.TABLE, where={'task_id': task_id})
+        logger.info(f"任务 {task_id} 已清空 {removed} 个检查点")
+        return removed
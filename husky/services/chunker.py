@@ -0,0 +1,187 @@
+import re
+
+from typing import Dict, List
+
+from husky.services.token_counter import estimate_tokens
+
+# 标题行：可选的 # 号与编号（1. / 1.2 / 1、/ 一、/ 第一章），后接2-20个中英文字符
+HEADING_PATTERN = re.compile(
+    r'^(?:[#]*\s*)?'                                                          # 匹配 # 号
+    r'(?:(?:\d+(?:\.\d+)*|[一二三四五六七八九十]+|第[一二三四五六七八九十\d]+[章节部分])[\.、．]?\s*)?'  # 匹配编号
+    r'([\u4e00-\u9fa5a-zA-Z]{2,20})'                                  # 捕获核心标题文字
+    r'[\s　]*$',                                                               # 结尾空白
+    re.IGNORECASE
+)
+
+# 超过该长度的行视为正文
+HEADING_MAX_LENGTH = 50
+
+
+def is_heading(line: str) -> bool:
+    line = line.strip()
+    return 0 < len(line) <= HEADING_MAX_LENGTH and HEADING_PATTERN.match(line) is not None
+
+
+def split_sections(text: str, max_tokens: int = 3000, min_tokens: int = 200) -> List[Dict]:
+    """
+    按标题、编号与篇幅把原文切分为连续的区间，不调用大模型
+    - 标题行作为区间起点；超过 max_tokens 的区间按空行、再按换行切开
+    - 不足 min_tokens 的区间与相邻区间合并（合并后不超过 max_tokens）
+    返回 [{'start', 'end', 'heading'}]，text[start:end] 即为区间原文，所有区间首尾相接覆盖全文
+    """
+    if not text.strip():
+        return []
+
+    # 1. 在标题行处断开
+    starts, offset = [0], 0
+    for line in text.splitlines(keepends=True):
+        if offset > 0 and is_heading(line):
+            starts.append(offset)
+        offset += len(line)
+
+    # 2. 切开过大的区间
+    pieces = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        # 切开的后续片段沿用所在章节的标题
+        heading = _heading(text[start:end])
+        pieces.extend((piece_start, piece_end, heading)
+                      for piece_start, piece_end in _split_oversized(text, start, end, max_tokens))
+
+    # 3. 合并过小的区间
+    merged = []
+    for start, end, heading in pieces:
+        if merged:
+            previous = merged[-1]['start']
+            small = min(estimate_tokens(text[previous:start]), estimate_tokens(text[start:end])) < min_tokens
+            if small and estimate_tokens(text[previous:end]) <= max_tokens:
+                merged[-1]['end'] = end
+                continue
+        merged.append({'start': start, 'end': end, 'heading': heading})
+    return merged
+
+
+def _split_oversized(text: str, start: int, end: int, max_tokens: int) -> List[tuple]:
+    """按段落（空行）切开超长区间，单个段落仍超长时按行切开，没有换行时按字符数硬切"""
+    if estimate_tokens(text[start:end]) <= max_tokens:
+        return [(start, end)]
+    for separator in (r'\n\s*\n', r'\n'):
+        cuts = [start + match.end() for match in re.finditer(separator, text[start:end])
+                if 0 < match.end() < end - start]
+        if cuts:
+            break
+    else:
+        size = max(1, (end - start) * max_tokens // estimate_tokens(text[start:end]))
+        return [(position, min(position + size, end)) for position in range(start, end, size)]
+
+    # 贪心累积段落，加上下一段会超长时在上一个切点断开
+    pieces, piece_start, last_cut = [], start, None
+    for cut in cuts + [end]:
+        if last_cut is not None and estimate_tokens(text[piece_start:cut]) > max_tokens:
+            pieces.append((piece_start, last_cut))
+            piece_start = last_cut
+        last_cut = cut
+    pieces.append((piece_start, end))
+
+    result = []
+    for piece_start, piece_end in pieces:
+        if (piece_start, piece_end) != (start, end):
+            result.extend(_split_oversized(text, piece_start, piece_end, max_tokens))
+        else:
+            result.append((piece_start, piece_end))
+    return result
+
+
+def _heading(section: str) -> str:
+    """区间的标题：首个非空行"""
+    for line in section.splitlines():
+        if line.strip():
+            return line.strip()[:HEADING_MAX_LENGTH]
+    return ''
+
+
+def window_sections(costs: List[int], window_tokens: int, overlap_tokens: int) -> List[List[int]]:
+    """
+    把有序区间分组为窗口（区间下标列表），每个窗口合计不超过 window_tokens（单个区间超出时独占一个窗口），
+    相邻窗口重叠上一窗口末尾的若干区间（合计不超过 overlap_tokens），保证跨窗口的模块能被对齐
+    """
+    windows, start, total = [], 0, len(costs)
+    while start < total:
+        end, used = start, 0
+        while end < total and (end == start or used + costs[end] <= window_tokens):
+            used += costs[end]
+            end += 1
+        windows.append(list(range(start, end)))
+        if end >= total:
+            break
+        next_start, overlap = end, 0
+        while next_start - 1 > start and overlap + costs[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += costs[next_start]
+        start = next_start
+    return windows
+
+
+def _label_key(label: Dict) -> tuple:
+    return (label.get('module') or '').strip(), (label.get('business_domain') or '').strip()
+
+
+def reconcile_labels(windows: List[List[int]], results: List[Dict[int, Dict]]) -> Dict[int, tuple]:
+    """
+    合并各窗口对区间的标注：重叠区间以前一个窗口的标注为准，
+    并据此把后一个窗口中的同一模块改名为前一个窗口的名称，使跨窗口的模块对齐
+    返回 区间下标 -> (module, business_domain)
+    """
+    final: Dict[int, tuple] = {}
+    for window, labels in zip(windows, results):
+        rename = {}
+        for index in window:
+            if index in final and index in labels:
+                rename.setdefault(_label_key(labels[index]), final[index])
+        for index in window:
+            if index in labels and index not in final:
+                key = _label_key(labels[index])
+                final[index] = rename.get(key, key)
+    return final
+
+
+def group_sections(text: str, sections: List[Dict], labels: Dict[int, tuple]) -> List[Dict]:
+    """
+    按 (module, business_domain) 合并区间，模块顺序为首次出现的顺序；
+    未标注的区间以标题作为模块名。模块原文由各区间原文按文档顺序拼接
+    """
+    modules: Dict[tuple, Dict] = {}
+    for index, section in enumerate(sections):
+        module, business_domain = labels.get(index) or ('', '')
+        key = (module or section['heading'] or f"模块{index + 1}", business_domain)
+        chunk = modules.setdefault(key, {'module': key[0], 'business_domain': key[1], 'ranges': []})
+        ranges = chunk['ranges']
+        if ranges and ranges[-1][1] == section['start']:
+            ranges[-1][1] = section['end']
+        else:
+            ranges.append([section['start'], section['end']])
+    chunks = []
+    for chunk in modules.values():
+        chunk['chunks'] = '\n'.join(text[start:end] for start, end in chunk['ranges'])
+        chunks.append(chunk)
+    return chunks
+
+
+def merge_modules(groups: List[List[Dict]]) -> List[Dict]:
+    """
+    合并各窗口由大模型切分出的模块：同名且同业务领域的模块合并为一个，
+    重叠窗口产生的重复原文（与已有内容相同或被其包含）只保留一份
+    """
+    modules: Dict[tuple, Dict] = {}
+    for chunks in groups:
+        for chunk in chunks:
+            key = _label_key(chunk)
+            text = chunk.get('chunks') or ''
+            merged = modules.setdefault(key, {'module': key[0], 'business_domain': key[1], 'parts': []})
+            if any(text.strip() in part for part in merged['parts']):
+                continue
+            # 新内容包含已有片段时替换之
+            merged['parts'] = [part for part in merged['parts'] if part.strip() not in text] + [text]
+    return [
+        {'module': merged['module'], 'business_domain': merged['business_domain'], 'chunks': '\n'.join(merged['parts'])}
+        for merged in modules.values()
+    ]
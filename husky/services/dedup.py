@@ -0,0 +1,126 @@
+import re
+import json
+import random
+import hashlib
+import threading
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 梅森素数，MinHash 置换在该模数下取值
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 归一化时去掉的内容：步骤编号（1. / 1、/ (1) / 步骤1：）、空白与标点
+_NUMBERING = re.compile(r'(?:^|\s)(?:步骤\s*\d+[:：]?|\(?\d+[\.、\)）:：])')
+_NOISE = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def normalize_text(value) -> str:
+    """归一化用于比较的文本：数组逐项拼接，去掉编号、空白与标点并转小写"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+            if isinstance(parsed, list):
+                value = parsed
+        except json.JSONDecodeError:
+            pass
+    if isinstance(value, (list, tuple)):
+        value = '\n'.join(str(item) for item in value)
+    text = _NUMBERING.sub(' ', str(value))
+    return _NOISE.sub('', text).lower()
+
+
+def testcase_text(testcase: Dict) -> str:
+    """测试用例的比较文本：用例名称、测试步骤与预期结果"""
+    return '|'.join(normalize_text(testcase.get(field)) for field in ('case_name', 'test_steps', 'expected_result'))
+
+
+def shingles(text: str, size: int = 2) -> set:
+    """字符 k-gram 集合，中文文本不依赖分词"""
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """
+    MinHash 签名：num_perm 个随机置换下 shingle 哈希的最小值，
+    两个签名相同位置相等的比例即为两个集合 Jaccard 相似度的无偏估计
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        generator = random.Random(seed)
+        self.num_perm = num_perm
+        self._permutations = [
+            (generator.randint(1, _PRIME - 1), generator.randint(0, _PRIME - 1)) for _ in range(num_perm)
+        ]
+
+    def signature(self, tokens: Iterable[str]) -> Tuple[int, ...]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=4).digest(), 'big')
+            for token in tokens
+        ]
+        if not hashes:
+            return tuple([_MAX_HASH] * self.num_perm)
+        return tuple(min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH for a, b in self._permutations)
+
+    @staticmethod
+    def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+        return sum(1 for x, y in zip(left, right) if x == y) / len(left)
+
+
+def lsh_params(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """选择分段数 bands 与每段行数 rows（bands*rows<=num_perm），使候选概率曲线的拐点 (1/b)^(1/r) 最接近阈值"""
+    return min(
+        ((num_perm // rows, rows) for rows in range(1, num_perm + 1)),
+        key=lambda params: abs((1 / params[0]) ** (1 / params[1]) - threshold)
+    )
+
+
+class TestcaseDeduplicator:
+    """
+    测试用例近似去重（MinHash + LSH）
+    签名按段分桶，只有至少一段完全相同的用例才作为候选再估算相似度，
+    查重与登记的开销与已登记的用例数量无关（近似线性），可在生成过程中逐条调用，线程安全
+    """
+
+    def __init__(self, threshold: float = 0.75, num_perm: int = 64, shingle_size: int = 2):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_params(num_perm, threshold)
+        self._buckets: List[Dict[Tuple[int, ...], List[str]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._exact: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def add(self, case_id: str, testcase: Dict) -> Optional[str]:
+        """
+        查重并登记：与已登记用例近似重复时返回最相似用例的ID（不登记），否则登记并返回None
+        """
+        text = testcase_text(testcase)
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        signature = self.hasher.signature(shingles(text, self.shingle_size))
+        bands = [signature[band * self.rows:(band + 1) * self.rows] for band in range(self.bands)]
+        with self._lock:
+            duplicate_of = self._exact.get(digest) or self._nearest(signature, bands)
+            if duplicate_of:
+                self.duplicates += 1
+                return duplicate_of
+            self._exact[digest] = case_id
+            self._signatures[case_id] = signature
+            for buckets, key in zip(self._buckets, bands):
+                buckets.setdefault(key, []).append(case_id)
+        return None
+
+    def _nearest(self, signature: Tuple[int, ...], bands: List[Tuple[int, ...]]) -> Optional[str]:
+        candidates = {case_id for buckets, key in zip(self._buckets, bands) for case_id in buckets.get(key, ())}
+        best, best_score = None, self.threshold
+        for case_id in candidates:
+            score = MinHasher.similarity(signature, self._signatures[case_id])
+            if score >= best_score:
+                best, best_score = case_id, score
+        return best
@@ -0,0 +1,113 @@
+import time
+import queue
+import threading
+
+from typing import Dict, Optional
+
+from loguru import logger
+
+
+# 任务进入这些状态后不会再有新事件
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class Subscription:
+    """单个订阅者的事件队列，队列满时丢弃最旧的事件，慢消费者不会拖住发布方"""
+
+    def __init__(self, task_id: str, maxsize: int = 256):
+        self.task_id = task_id
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event: Dict) -> None:
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """
+    进程内按任务划分的发布/订阅
+    同时缓存每个任务最近一次的状态，新订阅者无需查库即可拿到当前进度
+    """
+
+    def __init__(self, snapshot_ttl: float = 3600):
+        self.snapshot_ttl = snapshot_ttl
+        self._subscribers: Dict[str, set] = {}
+        self._snapshots: Dict[str, Dict] = {}
+        self._last_purge = time.monotonic()
+        self._lock = threading.Lock()
+
+    def subscribe(self, task_id: str) -> Subscription:
+        subscription = Subscription(task_id)
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.task_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._subscribers.pop(subscription.task_id, None)
+
+    def subscriber_count(self, task_id: Optional[str] = None) -> int:
+        with self._lock:
+            if task_id is not None:
+                return len(self._subscribers.get(task_id, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def subscribed_task_ids(self) -> list:
+        """当前有订阅者的任务"""
+        with self._lock:
+            return list(self._subscribers.keys())
+
+    def snapshot(self, task_id: str) -> Optional[Dict]:
+        """任务最近一次的状态（合并后的字段）"""
+        with self._lock:
+            entry = self._snapshots.get(task_id)
+            return dict(entry['data']) if entry else None
+
+    def publish(self, task_id: str, event: str, data: Dict) -> None:
+        """发布事件；status 事件会合并进任务状态快照"""
+        now = time.monotonic()
+        with self._lock:
+            if event == 'status':
+                entry = self._snapshots.setdefault(task_id, {'data': {'task_id': task_id}})
+                entry['data'].update(data)
+                entry['updated_at'] = now
+                self._purge(now)
+            subscribers = list(self._subscribers.get(task_id, ()))
+        message = {'event': event, 'data': data}
+        for subscription in subscribers:
+            subscription.put(message)
+        if subscribers:
+            logger.debug(f"任务 {task_id} 发布 {event} 事件给 {len(subscribers)} 个订阅者")
+
+    def _purge(self, now: float) -> None:
+        """清理过期快照（调用方需持有锁），每分钟最多执行一次"""
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        expired = [
+            task_id for task_id, entry in self._snapshots.items()
+            if now - entry['updated_at'] > self.snapshot_ttl
+        ]
+        for task_id in expired:
+            self._snapshots.pop(task_id, None)
+
+
+# 进程内共享的事件总线
+event_bus = EventBus()
@@ -0,0 +1,218 @@
+import io
+import re
+import csv
+import json
+import zipfile
+
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
+from xml.sax.saxutils import escape
+
+from loguru import logger
+
+from husky.repositories.mysql_repository import MysqlRepository
+
+
+# 导出的列及表头
+EXPORT_COLUMNS = [
+    ('case_id', '用例ID'),
+    ('task_id', '任务ID'),
+    ('require_id', '需求ID'),
+    ('case_name', '用例名称'),
+    ('priority', '优先级'),
+    ('test_type', '测试类型'),
+    ('preconditions', '前置条件'),
+    ('test_steps', '测试步骤'),
+    ('expected_result', '预期结果'),
+    ('review', '是否评审'),
+    ('accept', '是否验收'),
+    ('created_at', '创建时间')
+]
+JSON_COLUMNS = {'preconditions', 'test_steps', 'expected_result', 'test_type'}
+
+# XML 1.0 不允许出现的控制字符
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# 每累计多少行向客户端刷新一次
+FLUSH_ROWS = 200
+
+EXPORT_FORMATS = {
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx')
+}
+
+
+class _StreamBuffer(io.RawIOBase):
+    """不可seek的写缓冲，zipfile会自动切换为流式写入（data descriptor）"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _decode(row: Dict) -> Dict:
+    """解码JSON列，格式化时间列"""
+    for key, value in row.items():
+        if key in JSON_COLUMNS and isinstance(value, str):
+            try:
+                row[key] = json.loads(value)
+            except json.JSONDecodeError:
+                pass
+        elif isinstance(value, datetime):
+            row[key] = value.strftime('%Y-%m-%d %H:%M:%S')
+    return row
+
+
+def _flatten(value) -> str:
+    """表格类格式中把数组展开为多行文本"""
+    if isinstance(value, list):
+        return '\n'.join(str(v) for v in value)
+    if value is None:
+        return ''
+    return str(value)
+
+
+def _xml_text(value: str) -> str:
+    """转义XML并去除XML不允许的控制字符"""
+    return escape(_ILLEGAL_XML_CHARS.sub('', value))
+
+
+def _column_letter(index: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def iter_jsonl(rows: Iterable[Dict]) -> Iterator[bytes]:
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(_decode(row), ensure_ascii=False))
+        if len(buffer) >= FLUSH_ROWS:
+            yield ('\n'.join(buffer) + '\n').encode('utf-8')
+            buffer = []
+    if buffer:
+        yield ('\n'.join(buffer) + '\n').encode('utf-8')
+
+
+def iter_csv(rows: Iterable[Dict]) -> Iterator[bytes]:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    # BOM便于Excel正确识别中文
+    output.write('\ufeff')
+    writer.writerow([title for _, title in EXPORT_COLUMNS])
+    for count, row in enumerate(rows, 1):
+        row = _decode(row)
+        writer.writerow([_flatten(row.get(key)) for key, _ in EXPORT_COLUMNS])
+        if count % FLUSH_ROWS == 0:
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate(0)
+    yield output.getvalue().encode('utf-8')
+
+
+def iter_xlsx(rows: Iterable[Dict]) -> Iterator[bytes]:
+    """
+    流式生成XLSX：工作表使用inlineStr单元格，不需要sharedStrings，
+    zip条目边写边输出，内存占用与行数无关
+    """
+    sink = _StreamBuffer()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>'
+        ))
+        archive.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="testcases" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        archive.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            'Target="worksheets/sheet1.xml"/>'
+            '</Relationships>'
+        ))
+        yield sink.drain()
+
+        letters = [_column_letter(i) for i in range(len(EXPORT_COLUMNS))]
+
+        def render_row(number: int, values: List[str]) -> str:
+            cells = ''.join(
+                f'<c r="{letters[i]}{number}" t="inlineStr"><is><t xml:space="preserve">{_xml_text(value)}</t></is></c>'
+                for i, value in enumerate(values)
+            )
+            return f'<row r="{number}">{cells}</row>'
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + render_row(1, [title for _, title in EXPORT_COLUMNS])
+            ).encode('utf-8'))
+            for number, row in enumerate(rows, 2):
+                row = _decode(row)
+                sheet.write(render_row(number, [_flatten(row.get(key)) for key, _ in EXPORT_COLUMNS]).encode('utf-8'))
+                if number % FLUSH_ROWS == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def export_testcases(where: Dict, fmt: str) -> Iterator[bytes]:
+    """按条件流式导出测试用例"""
+    writers = {'jsonl': iter_jsonl, 'csv': iter_csv, 'xlsx': iter_xlsx}
+    columns = [f'`{key}`' for key, _ in EXPORT_COLUMNS]
+    exported = 0
+
+    def counted(rows):
+        nonlocal exported
+        for row in rows:
+            exported += 1
+            yield row
+
+    # 连接在整个下载过程中保持借出，生成器结束后归还
+    with MysqlRepository() as db:
+        rows = db.stream('testcases', columns=columns, where=where, order_by=['created_at', 'case_id'])
+        try:
+            for chunk in writers[fmt](counted(rows)):
+                if chunk:
+                    yield chunk
+        finally:
+            # 客户端中断下载时先关闭服务端游标，再归还连接
+            rows.close()
+    logger.info(f"导出测试用例完成: {where}, 格式 {fmt}, 共 {exported} 条")
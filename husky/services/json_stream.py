@@ -0,0 +1,83 @@
+import json
+
+from typing import Dict, List
+
+from loguru import logger
+
+from husky.services.llm_schema import SchemaError, repair_json
+
+
+class JsonArrayStreamParser:
+    """
+    增量解析大模型流式输出的JSON，从顶层对象的指定数组字段中逐个取出已闭合的元素
+    例如 key='points' 时，输入 {"points": [{...}, {...}]} 的任意切片，
+    每当一个 {...} 闭合就立即返回该对象，不必等待整段响应结束
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._buffer = []        # 当前正在收集的元素字符
+        self._depth = 0          # 当前嵌套深度
+        self._in_string = False
+        self._escape = False
+        self._string = []        # 顶层字符串内容，用于识别字段名
+        self._last_string = None
+        self._array_depth = None # 目标数组所在深度
+        self._item_depth = None  # 正在收集的元素起始深度
+
+    def feed(self, text: str) -> List[Dict]:
+        """输入一段文本，返回本段内闭合的所有元素"""
+        items = []
+        for char in text:
+            collecting = self._item_depth is not None
+            if collecting:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = ''.join(self._string)
+                elif self._depth == 1:
+                    self._string.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string = []
+            elif char in '{[':
+                if (char == '[' and self._depth == 1 and self._array_depth is None
+                        and self._last_string == self.key):
+                    self._array_depth = self._depth + 1
+                elif char == '{' and self._array_depth is not None and self._depth == self._array_depth and not collecting:
+                    self._item_depth = self._depth
+                    self._buffer = [char]
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._item_depth is not None and self._depth == self._item_depth:
+                    item = self._emit()
+                    if item is not None:
+                        items.append(item)
+                elif self._array_depth is not None and self._depth < self._array_depth:
+                    self._array_depth = None
+        return items
+
+    def _emit(self):
+        raw = ''.join(self._buffer)
+        self._buffer = []
+        self._item_depth = None
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError:
+            # 元素内多余的尾逗号等问题先在本地修复
+            try:
+                item, _ = repair_json(raw)
+            except SchemaError as e:
+                logger.warning(f"流式解析元素失败，已跳过: {e}")
+                return None
+        return item if isinstance(item, dict) else None
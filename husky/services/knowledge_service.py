@@ -3,12 +3,13 @@ import threading
 
 from io import BytesIO
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from loguru import logger
 
 from llama_index.core import Settings, StorageContext, VectorStoreIndex, load_index_from_storage
 from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.readers.file import PDFReader, DocxReader, MarkdownReader
 
@@ -42,15 +43,8 @@ class KnowledgeService:
         # 初始化存储
         self.storage_path = Path("./storage")
         self.storage_path.mkdir(exist_ok=True)
-        
-        try:
-            self.storage_context = StorageContext.from_defaults(
-                persist_dir=self.storage_path
-            )
-            self.index = load_index_from_storage(self.storage_context)
-        except:
-            self.storage_context = StorageContext.from_defaults()
-            self.index = VectorStoreIndex([], storage_context=self.storage_context)
+        self._index_lock = threading.RLock()
+        self._load_index()
         
         # 文件解析器
         self.readers = {
@@ -58,12 +52,54 @@ class KnowledgeService:
             'application/vnd.openxmlformats-officedocument.wordprocessingml.document': DocxReader(),
             'text/markdown': MarkdownReader()
         }
+        self.suffixes = {
+            'application/pdf': '.pdf',
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
+            'text/markdown': '.md'
+        }
         
         # 文本分块
         self.splitter = SentenceSplitter(chunk_size=512, chunk_overlap=64)
     
-    def add_files(self, files: List[BytesIO], mime_types: List[str]) -> Dict:
-        """处理上传文件并更新索引"""
+    def _storage_mtime(self) -> float:
+        """持久化文件的最后修改时间，没有持久化数据时为0"""
+        return max((path.stat().st_mtime for path in self.storage_path.glob('*.json')), default=0.0)
+
+    def _load_index(self) -> None:
+        """从持久化目录加载索引，没有可用数据时创建空索引"""
+        with self._index_lock:
+            self._loaded_mtime = self._storage_mtime()
+            try:
+                self.storage_context = StorageContext.from_defaults(
+                    persist_dir=self.storage_path
+                )
+                self.index = load_index_from_storage(self.storage_context)
+            except:
+                self.storage_context = StorageContext.from_defaults()
+                self.index = VectorStoreIndex([], storage_context=self.storage_context)
+
+    def _reload_if_changed(self) -> None:
+        """
+        Web进程与工作进程各有一个索引实例，共享同一个持久化目录；
+        持久化文件被其它进程更新后重新加载，使新上传的需求可被检索
+        """
+        with self._index_lock:
+            if self._storage_mtime() > self._loaded_mtime:
+                logger.info("知识库持久化数据已更新，重新加载索引")
+                self._load_index()
+
+    def _persist(self) -> None:
+        self.storage_context.persist(persist_dir=self.storage_path)
+        self._loaded_mtime = self._storage_mtime()
+
+    def add_files(self, files: List[BytesIO], mime_types: List[str], metadata: Optional[Dict] = None) -> Dict:
+        """
+        处理上传文件并更新索引
+        :param metadata: 写入每个分块的元数据；包含 require_id 时检索可按需求过滤，
+                         同一需求重新上传时替换该需求原有的分块
+        """
+        metadata = metadata or {}
+        require_id = metadata.get('require_id')
         new_docs = []
         for file, mime_type in zip(files, mime_types):
             # 安全检查
@@ -71,28 +107,59 @@ class KnowledgeService:
                 continue
             
             # 使用临时文件处理（避免内存泄露）
-            with tempfile.NamedTemporaryFile(delete=True) as tmp:
-                file.save(tmp.name)
+            with tempfile.NamedTemporaryFile(suffix=self.suffixes[mime_type], delete=True) as tmp:
+                tmp.write(file.getvalue())
+                tmp.flush()
                 try:
                     docs = self.readers[mime_type].load_data(Path(tmp.name))
+                    for number, doc in enumerate(docs):
+                        doc.metadata.update(metadata)
+                        # 元数据只用于过滤，不参与向量化与提示词
+                        doc.excluded_embed_metadata_keys.extend(metadata.keys())
+                        doc.excluded_llm_metadata_keys.extend(metadata.keys())
+                        if require_id:
+                            doc.id_ = f"{require_id}#{number}"
                     nodes = self.splitter(docs)
                     new_docs.extend(nodes)
                 except Exception as e:
                     logger.error(f"文件解析失败: {str(e)}")
         
-        # 增量更新索引
+        # 增量更新索引，先同步其它进程写入的数据，避免持久化时覆盖
         if new_docs:
-            self.index.insert_nodes(new_docs)
-            self.storage_context.persist(persist_dir=self.storage_path)
+            with self._index_lock:
+                self._reload_if_changed()
+                if require_id:
+                    self._remove_requirement(require_id)
+                self.index.insert_nodes(new_docs)
+                self._persist()
         
         return {"status": "success", "added_nodes": len(new_docs)}
+
+    def _remove_requirement(self, require_id: str) -> None:
+        """删除某需求此前上传版本的分块"""
+        prefix = f"{require_id}#"
+        for ref_doc_id in list(self.index.ref_doc_info.keys()):
+            if ref_doc_id.startswith(prefix):
+                self.index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
     
-    def query(self, question: str, top_k: int = 3) -> List[Dict]:
-        """执行语义检索"""
-        retriever = self.index.as_retriever(similarity_top_k=top_k)
+    def query(self, question: str, top_k: int = 3, require_id: Optional[str] = None) -> List[Dict]:
+        """执行语义检索，指定 require_id 时只在该需求的分块中检索"""
+        self._reload_if_changed()
+        filters = None
+        if require_id:
+            filters = MetadataFilters(filters=[ExactMatchFilter(key='require_id', value=require_id)])
+        with self._index_lock:
+            retriever = self.index.as_retriever(similarity_top_k=top_k, filters=filters)
         results = retriever.retrieve(question)
         return [{
             "text": node.text,
             "score": node.score,
             "metadata": node.metadata
-        } for node in results]
\ No newline at end of file
+        } for node in results]
+
+    def indexed(self, require_id: str) -> bool:
+        """该需求是否已有分块写入索引"""
+        self._reload_if_changed()
+        prefix = f"{require_id}#"
+        with self._index_lock:
+            return any(ref_doc_id.startswith(prefix) for ref_doc_id in self.index.ref_doc_info.keys())
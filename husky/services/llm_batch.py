@@ -0,0 +1,79 @@
+from typing import Any, Callable, Dict, List, Sequence
+
+from loguru import logger
+
+from husky.services.cancellation import TaskCancelled
+
+
+def pack_batches(units: Sequence[Any], cost: Callable[[Any], int], budget: int, max_items: int) -> List[List[Any]]:
+    """
+    按本地估算的token数把工作单元依次装箱：单批总量不超过budget、条数不超过max_items，
+    单个单元超出预算时单独成批
+    """
+    batches, current, used = [], [], 0
+    for unit in units:
+        weight = cost(unit)
+        if current and (used + weight > budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(unit)
+        used += weight
+    if current:
+        batches.append(current)
+    return batches
+
+
+def batch_results(unit_ids: Sequence[str], accepted: set, key: str, handle: Callable[[str, List], None]):
+    """
+    批量响应中单个结果（{"id": ..., key: [...]}）的回调：
+    只接受本批内、尚未接受过的单元，处理成功后记入accepted
+    """
+    expected = set(unit_ids)
+
+    def on_item(item: Dict) -> None:
+        unit_id = str(item.get('id', '')).strip()
+        if unit_id not in expected or unit_id in accepted or not isinstance(item.get(key), list):
+            logger.warning(f"忽略批量响应中无法对应的结果: id={unit_id!r}")
+            return
+        handle(unit_id, item[key])
+        accepted.add(unit_id)
+
+    return on_item
+
+
+def run_with_split(unit_ids: List[str], run_batch: Callable[[List[str], set], Any],
+                   run_single: Callable[[str], Any]) -> Dict[str, Exception]:
+    """
+    执行一批单元：只有一个单元时走单条调用；
+    批量响应被截断、格式错误或缺少部分单元时，未拿到结果的单元拆成两半分别重试
+    :param run_batch: 批量调用，每个单元的结果处理成功后记入传入的集合
+    :param run_single: 单条调用，失败时抛出异常
+    :return: 最终失败的单元及原因
+    """
+    if not unit_ids:
+        return {}
+    if len(unit_ids) == 1:
+        try:
+            run_single(unit_ids[0])
+            return {}
+        except TaskCancelled:
+            raise
+        except Exception as error:
+            return {unit_ids[0]: error}
+
+    accepted = set()
+    try:
+        run_batch(unit_ids, accepted)
+    except TaskCancelled:
+        raise
+    except Exception as error:
+        logger.warning(f"批量调用失败（{len(accepted)}/{len(unit_ids)} 个单元已完成）: {error}")
+    remaining = [unit_id for unit_id in unit_ids if unit_id not in accepted]
+    if not remaining:
+        return {}
+
+    logger.info(f"批量响应缺少 {len(remaining)} 个单元的结果，拆分后重试")
+    middle = (len(remaining) + 1) // 2
+    failures = run_with_split(remaining[:middle], run_batch, run_single)
+    failures.update(run_with_split(remaining[middle:], run_batch, run_single))
+    return failures
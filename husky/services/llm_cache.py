@@ -0,0 +1,290 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from husky.config import LLM_CACHE, LLM_GATEWAY
+from husky.services.llm_gateway import get_llm_gateway
+from husky.services.llm_schema import SchemaError, repair_json
+from husky.repositories.mysql_repository import MysqlRepository
+
+
+def make_cache_key(model: str, messages: List[Dict], temperature: float, response_format: Optional[Dict]) -> str:
+    """以(model, messages, temperature, response_format)的规范化JSON计算内容哈希"""
+    payload = json.dumps({
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+        'response_format': response_format
+    }, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SqliteCacheBackend:
+    """本地磁盘缓存，按最近访问时间做LRU淘汰"""
+
+    def __init__(self, path: str, max_entries: int):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "cache_key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON llm_cache (last_access_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM llm_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access_at = ? WHERE cache_key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, model: str, response: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (cache_key, model, response, expires_at, last_access_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now + ttl, now)
+            )
+            self._conn.commit()
+
+    def evict(self) -> int:
+        """清理过期条目，并将条目数压回上限以内"""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),)).rowcount
+            overflow = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                removed += self._conn.execute(
+                    "DELETE FROM llm_cache WHERE cache_key IN "
+                    "(SELECT cache_key FROM llm_cache ORDER BY last_access_at LIMIT ?)",
+                    (overflow,)
+                ).rowcount
+            self._conn.commit()
+            return removed
+
+
+class MysqlCacheBackend:
+    """MySQL缓存（表结构见 sql/llm_cache.sql），多进程/多实例共享"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+
+    def get(self, key: str) -> Optional[str]:
+        with MysqlRepository() as db:
+            rows = db.search(
+                'llm_cache',
+                columns=['response'],
+                where={'cache_key': key, 'expires_at__gt': time.time()}
+            )
+            if not rows:
+                return None
+            db.update('llm_cache', {'last_access_at': time.time()}, where={'cache_key': key})
+            return rows[0]['response']
+
+    def set(self, key: str, model: str, response: str, ttl: float) -> None:
+        now = time.time()
+        with MysqlRepository() as db:
+            db.bulk_upsert('llm_cache', [{
+                'cache_key': key,
+                'model': model,
+                'response': response,
+                'expires_at': now + ttl,
+                'last_access_at': now
+            }])
+
+    def evict(self) -> int:
+        with MysqlRepository() as db:
+            removed = db.delete('llm_cache', where={'expires_at__lt': time.time()})
+            overflow = db.count('llm_cache') - self.max_entries
+            if overflow > 0:
+                with db.connection.cursor() as cursor:
+                    cursor.execute(
+                        "DELETE FROM `llm_cache` ORDER BY `last_access_at` LIMIT %s", (overflow,)
+                    )
+                    removed += cursor.rowcount
+                db.connection.commit()
+            return removed
+
+
+class LLMCache:
+    """
+    大模型响应缓存，键为请求内容的哈希
+    :param backend: 存储后端，需实现 get/set/evict
+    :param ttl: 条目有效期（秒）
+    :param evict_every: 每写入多少次执行一次淘汰
+    """
+
+    def __init__(self, backend, ttl: float, evict_every: int = 100):
+        self.backend = backend
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'errors': 0}
+
+    def _incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # 缓存故障不影响主流程，按未命中处理
+            logger.warning(f"读取大模型缓存失败: {e}")
+            self._incr('errors')
+            value = None
+        self._incr('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key: str, model: str, response: str) -> None:
+        try:
+            self.backend.set(key, model, response, self.ttl)
+            self._incr('writes')
+            if self._stats['writes'] % self.evict_every == 0:
+                self._incr('evictions', self.backend.evict())
+        except Exception as e:
+            logger.warning(f"写入大模型缓存失败: {e}")
+            self._incr('errors')
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0.0
+            }
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """按配置创建进程内共享的缓存实例，未启用时返回None"""
+    global _cache
+    if not LLM_CACHE.get('enabled'):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if LLM_CACHE['backend'] == 'mysql':
+                    backend = MysqlCacheBackend(LLM_CACHE['max_entries'])
+                else:
+                    backend = SqliteCacheBackend(LLM_CACHE['path'], LLM_CACHE['max_entries'])
+                _cache = LLMCache(backend, LLM_CACHE['ttl'])
+    return _cache
+
+
+def cached_chat(
+    messages: List[Dict],
+    model: Optional[str] = None,
+    temperature: float = 1.0,
+    response_format: Optional[Dict] = None,
+    bypass_cache: bool = False,
+    cancel_token=None,
+    usage: Optional[Dict] = None
+) -> str:
+    """
+    带缓存的大模型调用，返回消息内容；未命中时经由进程内共享的网关请求
+    :param bypass_cache: 为True时跳过读缓存，但仍写入最新结果
+    :param cancel_token: 可选的取消令牌，任务取消后丢弃响应并抛出 TaskCancelled
+    :param usage: 用量记录的归属（task_id/require_id/stage），命中缓存时同样记录一次
+    """
+    model = model or LLM_GATEWAY['model']
+    cache = get_llm_cache()
+    key = make_cache_key(model, messages, temperature, response_format)
+    if cache and not bypass_cache:
+        content = cache.get(key)
+        if content is not None:
+            logger.debug(f"大模型缓存命中: {key[:12]}")
+            get_llm_gateway().usage_store.record(usage, model, cache_hit=True)
+            return content
+
+    content = get_llm_gateway().chat(
+        messages,
+        model=model,
+        temperature=temperature,
+        response_format=response_format,
+        cancel_token=cancel_token,
+        usage=usage
+    )
+    if cache and content and _is_cacheable(content, response_format):
+        cache.set(key, model, content)
+    return content
+
+
+def cached_chat_stream(
+    messages: List[Dict],
+    model: Optional[str] = None,
+    temperature: float = 1.0,
+    response_format: Optional[Dict] = None,
+    bypass_cache: bool = False,
+    cancel_token=None,
+    usage: Optional[Dict] = None
+) -> Iterator[str]:
+    """
+    带缓存的流式大模型调用，逐段产出消息内容
+    命中缓存时一次性产出完整内容；未命中时边接收边产出，结束后写入缓存
+    任务取消时网关立即关闭HTTP流并抛出 TaskCancelled，不完整的响应不会写入缓存
+    """
+    model = model or LLM_GATEWAY['model']
+    cache = get_llm_cache()
+    key = make_cache_key(model, messages, temperature, response_format)
+    if cache and not bypass_cache:
+        content = cache.get(key)
+        if content is not None:
+            logger.debug(f"大模型缓存命中: {key[:12]}")
+            get_llm_gateway().usage_store.record(usage, model, cache_hit=True)
+            yield content
+            return
+
+    pieces = []
+    for piece in get_llm_gateway().chat_stream(
+        messages,
+        model=model,
+        temperature=temperature,
+        response_format=response_format,
+        cancel_token=cancel_token,
+        usage=usage
+    ):
+        pieces.append(piece)
+        yield piece
+
+    content = ''.join(pieces)
+    if cache and content and _is_cacheable(content, response_format):
+        cache.set(key, model, content)
+
+
+def _is_cacheable(content: str, response_format: Optional[Dict]) -> bool:
+    """
+    要求JSON输出时，只缓存调用方能解析的响应，避免把坏结果固化下来；
+    与调用方一样经 repair_json 本地修复（代码块围栏、尾逗号等），但截断后补齐的响应丢失了内容，不缓存
+    """
+    if not response_format or response_format.get('type') != 'json_object':
+        return True
+    try:
+        _, repairs = repair_json(content)
+    except SchemaError:
+        return False
+    return 'truncated' not in repairs
@@ -0,0 +1,421 @@
+import os
+import time
+import random
+import threading
+
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+import openai
+from loguru import logger
+from openai import OpenAI
+
+from husky.config import LLM_GATEWAY, LLM_GLOBAL_CONCURRENCY
+from husky.services.cancellation import CancelToken, CancellableSlot, TaskCancelled
+from husky.services.llm_usage import UsageStore
+from husky.services.token_counter import estimate_tokens
+
+
+class LLMUnavailable(Exception):
+    """大模型服务持续失败，熔断期间直接拒绝请求"""
+
+
+class RateLimiter:
+    """
+    滑动窗口内的请求数与token数限额
+    请求发出前按估算的token数占用额度，拿到实际用量后再修正
+    """
+
+    def __init__(self, rpm: int, tpm: int, window: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self._entries = deque()
+        self._tokens = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens: int, cancel_token: Optional[CancelToken] = None) -> list:
+        """等待额度，返回占用记录（用于修正实际用量）"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                if self._fits(tokens):
+                    entry = [now, tokens]
+                    self._entries.append(entry)
+                    self._tokens += tokens
+                    return entry
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                # 最早一条记录滑出窗口后额度才会释放
+                wait = self._entries[0][0] + self.window - now
+                self._cond.wait(timeout=min(max(wait, 0.05), 0.5))
+
+    def settle(self, entry: list, tokens: int) -> None:
+        """按实际用量修正占用的token数"""
+        with self._cond:
+            if entry in self._entries:
+                self._tokens += tokens - entry[1]
+            entry[1] = tokens
+            self._cond.notify_all()
+
+    def usage(self) -> Dict:
+        with self._cond:
+            self._expire(time.monotonic())
+            return {'requests': len(self._entries), 'tokens': self._tokens, 'rpm': self.rpm, 'tpm': self.tpm}
+
+    def _fits(self, tokens: int) -> bool:
+        if not self._entries:
+            # 窗口为空时总能发出，避免单个超大请求永远等不到额度
+            return True
+        if self.rpm and len(self._entries) >= self.rpm:
+            return False
+        if self.tpm and self._tokens + tokens > self.tpm:
+            return False
+        return True
+
+    def _expire(self, now: float) -> None:
+        while self._entries and now - self._entries[0][0] >= self.window:
+            self._tokens -= self._entries.popleft()[1]
+
+
+class CircuitBreaker:
+    """
+    连续失败达到阈值后熔断，熔断期间拒绝请求；
+    冷却时间过后放行一个探测请求，成功则恢复，失败则继续熔断
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("大模型服务恢复，关闭熔断")
+            self.state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self._failures >= self.threshold:
+                if self.state != 'open':
+                    logger.error(f"大模型服务连续失败 {self._failures} 次，熔断 {self.reset_timeout} 秒")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """请求未能到达服务商（如任务取消）时归还探测名额"""
+        with self._lock:
+            self._probing = False
+
+
+class LLMGateway:
+    """
+    进程内共享的大模型网关：复用同一个HTTP连接池，
+    统一做并发额度、每分钟请求数/token数限流、429/5xx退避重试与熔断，并统计延迟与排队情况
+    """
+
+    def __init__(self, config: Dict = None):
+        config = {**LLM_GATEWAY, **(config or {})}
+        self.config = config
+        self.model = config['model']
+        self.client = OpenAI(
+            api_key=os.getenv("API_KEY"),
+            base_url=config['base_url'],
+            timeout=config['timeout'],
+            # 重试由网关统一处理
+            max_retries=0,
+            http_client=httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=LLM_GLOBAL_CONCURRENCY,
+                    max_keepalive_connections=LLM_GLOBAL_CONCURRENCY
+                ),
+                timeout=config['timeout']
+            )
+        )
+        self.limiter = RateLimiter(config['rpm'], config['tpm'])
+        self.breaker = CircuitBreaker(config['breaker_threshold'], config['breaker_reset'])
+        self.usage_store = UsageStore()
+        self._slots = threading.BoundedSemaphore(LLM_GLOBAL_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=500)
+        self._stats = {'requests': 0, 'succeeded': 0, 'failed': 0, 'retries': 0, 'rejected': 0,
+                       'in_flight': 0, 'waiting': 0}
+
+    def chat(
+        self,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        temperature: float = 1.0,
+        response_format: Optional[Dict] = None,
+        timeout: Optional[float] = None,
+        cancel_token: Optional[CancelToken] = None,
+        usage: Optional[Dict] = None
+    ) -> str:
+        """
+        非流式调用，返回消息内容
+        :param usage: 用量记录的归属（task_id/require_id/stage），每次调用结束后写入 llm_usage
+        """
+        params = self._params(messages, model, temperature, response_format, stream=False)
+        client = self.client.with_options(timeout=timeout) if timeout else self.client
+        call = {'started': time.monotonic(), 'attempt': 0, 'status': 'failed', 'usage': None, 'error': None}
+        try:
+            for attempt in range(self.config['max_retries'] + 1):
+                call['attempt'] = attempt
+                entry = self._begin(messages, cancel_token)
+                started = time.monotonic()
+                try:
+                    response = client.chat.completions.create(**params)
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                except Exception as error:
+                    delay = self._fail(error, attempt, cancel_token)
+                else:
+                    call['usage'] = getattr(response, 'usage', None)
+                    self._succeed(entry, started, call['usage'])
+                    call['status'] = 'success'
+                    return response.choices[0].message.content
+                finally:
+                    self._end()
+                self._sleep(delay, cancel_token)
+        except TaskCancelled:
+            call['status'] = 'cancelled'
+            raise
+        except Exception as error:
+            call['error'] = str(error)
+            raise
+        finally:
+            self._report(usage, params['model'], call)
+
+    def chat_stream(
+        self,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        temperature: float = 1.0,
+        response_format: Optional[Dict] = None,
+        cancel_token: Optional[CancelToken] = None,
+        usage: Optional[Dict] = None
+    ) -> Iterator[str]:
+        """
+        流式调用，逐段产出消息内容；只有在尚未产出任何内容时才会重试
+        任务取消时立即关闭HTTP流并抛出 TaskCancelled
+        """
+        params = self._params(messages, model, temperature, response_format, stream=True)
+        params['stream_options'] = {'include_usage': True}
+        call = {'started': time.monotonic(), 'attempt': 0, 'status': 'failed', 'usage': None, 'error': None}
+        try:
+            for attempt in range(self.config['max_retries'] + 1):
+                call['attempt'] = attempt
+                entry = self._begin(messages, cancel_token)
+                started = time.monotonic()
+                produced = False
+                try:
+                    stream = self.client.chat.completions.create(**params)
+                    if cancel_token is not None:
+                        cancel_token.register(stream.close)
+                    try:
+                        for chunk in stream:
+                            if cancel_token is not None:
+                                cancel_token.raise_if_cancelled()
+                            if getattr(chunk, 'usage', None):
+                                call['usage'] = chunk.usage
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                produced = True
+                                yield delta
+                    finally:
+                        # 调用方提前停止迭代或任务取消时关闭HTTP连接，不再继续接收
+                        if cancel_token is not None:
+                            cancel_token.unregister(stream.close)
+                        stream.close()
+                except GeneratorExit:
+                    # 调用方提前停止迭代，不计入成功或失败
+                    self.breaker.release()
+                    call['status'] = 'cancelled'
+                    raise
+                except Exception as error:
+                    cancelled = isinstance(error, TaskCancelled) or (cancel_token is not None and cancel_token.cancelled)
+                    if produced and not cancelled:
+                        # 已产出的内容无法撤回，不能重试
+                        self._record_failure(error)
+                        raise
+                    delay = self._fail(error, attempt, cancel_token)
+                else:
+                    self._succeed(entry, started, call['usage'])
+                    call['status'] = 'success'
+                    return
+                finally:
+                    self._end()
+                self._sleep(delay, cancel_token)
+        except TaskCancelled:
+            call['status'] = 'cancelled'
+            raise
+        except Exception as error:
+            call['error'] = str(error)
+            raise
+        finally:
+            self._report(usage, params['model'], call)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+        if latencies:
+            stats['latency'] = {
+                'avg': round(sum(latencies) / len(latencies), 3),
+                'p50': round(latencies[len(latencies) // 2], 3),
+                'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+            }
+        else:
+            stats['latency'] = None
+        stats['queue_depth'] = stats.pop('waiting')
+        stats['circuit'] = self.breaker.state
+        stats['rate'] = self.limiter.usage()
+        return stats
+
+    def _params(self, messages, model, temperature, response_format, stream: bool) -> Dict:
+        params = {'model': model or self.model, 'messages': messages, 'temperature': temperature, 'stream': stream}
+        if response_format:
+            params['response_format'] = response_format
+        return params
+
+    def _incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def _begin(self, messages: List[Dict], cancel_token: Optional[CancelToken]) -> list:
+        """过熔断、占并发额度、占限流额度，期间计入排队数"""
+        if not self.breaker.allow():
+            self._incr('rejected')
+            raise LLMUnavailable("大模型服务暂不可用（熔断中），请稍后重试")
+        estimate = sum(estimate_tokens(message.get('content') or '') for message in messages)
+        slot = CancellableSlot(self._slots, cancel_token) if cancel_token is not None else self._slots
+        self._incr('waiting')
+        try:
+            slot.acquire()
+            try:
+                entry = self.limiter.acquire(estimate + self.config['completion_reserve'], cancel_token)
+            except BaseException:
+                self._slots.release()
+                raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        finally:
+            self._incr('waiting', -1)
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['in_flight'] += 1
+        return entry
+
+    def _end(self) -> None:
+        self._incr('in_flight', -1)
+        self._slots.release()
+
+    def _succeed(self, entry: list, started: float, usage) -> None:
+        self.breaker.record_success()
+        if usage is not None and usage.total_tokens:
+            self.limiter.settle(entry, usage.total_tokens)
+        with self._lock:
+            self._stats['succeeded'] += 1
+            self._latencies.append(time.monotonic() - started)
+
+    def _report(self, usage: Optional[Dict], model: str, call: Dict) -> None:
+        """记录本次调用的用量、总耗时（含退避等待）与重试次数"""
+        self.usage_store.record(
+            usage,
+            model,
+            usage=call['usage'],
+            latency=time.monotonic() - call['started'],
+            retries=call['attempt'],
+            status=call['status'],
+            error=call['error']
+        )
+
+    def _record_failure(self, error: Exception) -> None:
+        self._incr('failed')
+        if self._is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            # 服务商正常响应了（如参数错误），不计入熔断
+            self.breaker.record_success()
+
+    def _fail(self, error: Exception, attempt: int, cancel_token: Optional[CancelToken]) -> float:
+        """处理一次失败的调用：不可重试或重试用尽时抛出，否则返回退避时间"""
+        if isinstance(error, TaskCancelled) or (cancel_token is not None and cancel_token.cancelled):
+            # 取消时从其他线程关闭了HTTP流，读取会以连接错误结束
+            self.breaker.release()
+            raise TaskCancelled() from error
+        self._record_failure(error)
+        if not self._is_retryable(error) or attempt >= self.config['max_retries'] or self.breaker.state == 'open':
+            raise error
+        delay = self._backoff(attempt, error)
+        self._incr('retries')
+        logger.warning(f"大模型调用失败，{delay:.1f} 秒后第 {attempt + 1} 次重试: {error}")
+        return delay
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """指数退避加全抖动，服务商给出 Retry-After 时以其为下限"""
+        ceiling = min(self.config['backoff_max'], self.config['backoff_base'] * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.config['backoff_max']))
+            except ValueError:
+                pass
+        return delay
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code >= 500
+        return False
+
+    @staticmethod
+    def _sleep(delay: float, cancel_token: Optional[CancelToken]) -> None:
+        if cancel_token is None:
+            time.sleep(delay)
+        elif cancel_token.wait(delay):
+            raise TaskCancelled()
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """进程内共享的网关实例"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
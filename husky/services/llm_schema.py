@@ -0,0 +1,306 @@
+import re
+import json
+import threading
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+class SchemaError(ValueError):
+    """大模型响应无法解析或修复"""
+
+
+# 各阶段输出元素的结构：字段类型（str/list/<结构名>[]）、必填字段、缺省值、长度上限与常见的错误字段名
+SCHEMAS = {
+    'chunk': {
+        'fields': {'module': 'str', 'business_domain': 'str', 'chunks': 'str'},
+        'required': ('module', 'chunks'),
+        'defaults': {'business_domain': ''},
+        'limits': {'module': 100, 'business_domain': 100},
+        'aliases': {'module_name': 'module', 'domain': 'business_domain', 'chunk': 'chunks', 'content': 'chunks'}
+    },
+    'label': {
+        'fields': {'id': 'str', 'module': 'str', 'business_domain': 'str'},
+        'required': ('id', 'module'),
+        'defaults': {'business_domain': ''},
+        'limits': {'module': 100, 'business_domain': 100},
+        'aliases': {'module_name': 'module', 'domain': 'business_domain'}
+    },
+    'point': {
+        'fields': {'function_name': 'str', 'test_type': 'str', 'description': 'str', 'preconditions': 'list'},
+        'required': ('function_name', 'description'),
+        'defaults': {'test_type': '功能', 'preconditions': []},
+        'limits': {'function_name': 100, 'test_type': 50},
+        'aliases': {'name': 'function_name', 'function': 'function_name', 'desc': 'description',
+                    'precondition': 'preconditions', 'type': 'test_type'}
+    },
+    'testcase': {
+        'fields': {'case_name': 'str', 'preconditions': 'list', 'test_steps': 'list',
+                   'expected_result': 'list', 'priority': 'str', 'test_type': 'list'},
+        'required': ('case_name', 'test_steps', 'expected_result'),
+        'defaults': {'preconditions': [], 'priority': 'P2', 'test_type': []},
+        'limits': {'case_name': 255, 'priority': 10},
+        'aliases': {'name': 'case_name', 'title': 'case_name', 'precondition': 'preconditions',
+                    'steps': 'test_steps', 'expected': 'expected_result', 'expected_results': 'expected_result',
+                    'type': 'test_type'}
+    },
+    'point_batch': {
+        'fields': {'id': 'str', 'points': 'point[]'},
+        'required': ('id', 'points'),
+        'defaults': {},
+        'limits': {},
+        'aliases': {}
+    },
+    'testcase_batch': {
+        'fields': {'id': 'str', 'testcases': 'testcase[]'},
+        'required': ('id', 'testcases'),
+        'defaults': {},
+        'limits': {},
+        'aliases': {'cases': 'testcases'}
+    }
+}
+
+
+class SchemaStats:
+    """解析与校验统计：响应修复率、元素修复率与补问率"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'responses': 0, 'repaired_responses': 0, 'failed_responses': 0, 'items': 0,
+                       'repaired_items': 0, 'invalid_items': 0, 'reasked_items': 0, 'recovered_items': 0}
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['repair_rate'] = round(stats['repaired_responses'] / stats['responses'], 4) if stats['responses'] else 0.0
+        stats['item_repair_rate'] = round(stats['repaired_items'] / stats['items'], 4) if stats['items'] else 0.0
+        stats['reask_rate'] = round(stats['reasked_items'] / stats['items'], 4) if stats['items'] else 0.0
+        return stats
+
+
+schema_stats = SchemaStats()
+
+# 完整的 JSON 字面量（数字、true/false/null）
+_LITERAL = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null')
+
+
+def repair_json(text: str) -> Tuple[Any, List[str]]:
+    """
+    宽松解析大模型输出的JSON，返回 (对象, 修复项)
+    依次尝试：去掉代码块围栏与前后多余文字、删除多余的尾逗号、补齐被截断的数组/对象
+    """
+    try:
+        return json.loads(text), []
+    except (TypeError, json.JSONDecodeError):
+        pass
+    if not text:
+        raise SchemaError("响应为空")
+
+    repairs, body = [], text.strip()
+    fence = re.search(r'```(?:json)?\s*(.*?)(?:```|$)', body, re.S)
+    if fence:
+        body = fence.group(1).strip()
+        repairs.append('fence')
+    start = min((i for i in (body.find('{'), body.find('[')) if i >= 0), default=-1)
+    if start < 0:
+        raise SchemaError("响应中没有JSON对象")
+    if start > 0:
+        body = body[start:]
+        repairs.append('prefix')
+
+    decoder = json.JSONDecoder()
+    for step in ('trailing_comma', 'truncated'):
+        try:
+            value, end = decoder.raw_decode(body)
+            if body[end:].strip():
+                repairs.append('suffix')
+            return value, repairs
+        except json.JSONDecodeError:
+            pass
+        body, changed = _remove_trailing_commas(body) if step == 'trailing_comma' else _close_truncated(body)
+        if changed:
+            repairs.append(step)
+    try:
+        return decoder.raw_decode(body)[0], repairs
+    except json.JSONDecodeError as e:
+        raise SchemaError(f"响应JSON无法修复: {e}")
+
+
+def _remove_trailing_commas(text: str) -> Tuple[str, bool]:
+    """删除 } 或 ] 前多余的逗号（忽略字符串内的内容）"""
+    output, in_string, escape, changed = [], False, False, False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '}]':
+            position = len(output) - 1
+            while position >= 0 and output[position].isspace():
+                position -= 1
+            if position >= 0 and output[position] == ',':
+                del output[position]
+                changed = True
+        output.append(char)
+    return ''.join(output), changed
+
+
+def _close_truncated(text: str) -> Tuple[str, bool]:
+    """
+    响应被截断时退回到最后一个完整的元素或值之后，并补齐未闭合的括号
+    可安全截断的位置：逗号、闭合的括号，以及数组元素或对象值位置上完整的字符串与字面量之后
+    """
+    stack, in_string, escape, safe = [], False, False, None
+    # expect_value: 对象中冒号之后、数组中，下一个标量是值而不是键；token 为正在读取的数字/true/false/null
+    expect_value, string_is_value, token = False, False, ''
+    for position, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+                if string_is_value:
+                    safe = (position + 1, list(stack))
+            continue
+        if token and (char.isspace() or char in ',]}'):
+            if _LITERAL.fullmatch(token) and expect_value:
+                safe = (position, list(stack))
+            token = ''
+        if char == '"':
+            in_string, string_is_value = True, expect_value
+        elif char in '{[':
+            stack.append(char)
+            expect_value = char == '['
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            safe = (position + 1, list(stack))
+            if not stack:
+                break
+            expect_value = stack[-1] == '['
+        elif char == ',':
+            safe = (position, list(stack))
+            expect_value = bool(stack) and stack[-1] == '['
+        elif char == ':':
+            expect_value = True
+        elif not char.isspace():
+            token += char
+    # 结尾处的 true/false/null 是完整的，数字可能被截断，不作为截断位置
+    if token in ('true', 'false', 'null') and expect_value:
+        safe = (len(text), list(stack))
+    if not stack and not in_string:
+        return text, False
+    if safe is None:
+        return text, False
+    position, open_brackets = safe
+    body = text[:position].rstrip().rstrip(',')
+    return body + ''.join('}' if bracket == '{' else ']' for bracket in reversed(open_brackets)), True
+
+
+def parse_response(content: str, key: Optional[str] = None) -> Dict:
+    """
+    解析一次大模型响应并计入统计；指定key但响应中缺少该字段时，
+    若顶层只有一个数组字段则视为字段名写错，改用该数组
+    """
+    schema_stats.incr('responses')
+    try:
+        result, repairs = repair_json(content)
+    except SchemaError:
+        schema_stats.incr('failed_responses')
+        raise
+    if isinstance(result, list) and key:
+        result, repairs = {key: result}, repairs + ['bare_array']
+    if not isinstance(result, dict):
+        schema_stats.incr('failed_responses')
+        raise SchemaError("响应不是JSON对象")
+    if key and key not in result:
+        arrays = [name for name, value in result.items() if isinstance(value, list)]
+        if len(arrays) == 1:
+            result[key] = result.pop(arrays[0])
+            repairs.append(f'key:{arrays[0]}')
+    if repairs:
+        schema_stats.incr('repaired_responses')
+        logger.info(f"大模型响应已本地修复: {repairs}")
+    return result
+
+
+def validate_item(kind: str, item: Any) -> Tuple[Optional[Dict], List[str]]:
+    """
+    按结构校验并规整单个元素：纠正字段别名、转换类型、补缺省值、截断超长字段、去掉多余字段
+    返回 (规整后的元素, 问题列表)，缺少必填字段等无法修复时元素为None
+    """
+    schema = SCHEMAS[kind]
+    if not isinstance(item, dict):
+        return None, ['不是JSON对象']
+    fixes, problems, normalized = [], [], {}
+    for name, value in item.items():
+        field = schema['aliases'].get(name, name)
+        if field != name:
+            fixes.append(f'{name}->{field}')
+        if field not in schema['fields']:
+            fixes.append(f'-{name}')
+            continue
+        if field not in normalized or normalized[field] in (None, '', []):
+            normalized[field] = value
+
+    for field, field_type in schema['fields'].items():
+        value = normalized.get(field)
+        if value is None or value == '' or value == []:
+            if field in schema['required']:
+                problems.append(f'缺少字段 {field}')
+            elif field in schema['defaults']:
+                normalized[field] = schema['defaults'][field]
+            continue
+        if field_type == 'str' and not isinstance(value, str):
+            value = '；'.join(map(str, value)) if isinstance(value, list) else str(value)
+            fixes.append(f'{field}:str')
+        elif field_type == 'list' and not isinstance(value, list):
+            value = [value]
+            fixes.append(f'{field}:list')
+        elif field_type.endswith('[]'):
+            if not isinstance(value, list):
+                problems.append(f'{field} 不是数组')
+                continue
+            children = []
+            for child in value:
+                child, child_problems = validate_item(field_type[:-2], child)
+                if child is None:
+                    schema_stats.incr('invalid_items')
+                    logger.warning(f"丢弃不合规的 {field_type[:-2]}: {child_problems}")
+                    continue
+                children.append(child)
+            value = children
+        limit = schema['limits'].get(field)
+        if limit and isinstance(value, str) and len(value) > limit:
+            value = value[:limit]
+            fixes.append(f'{field}:truncate')
+        normalized[field] = value
+
+    schema_stats.incr('items')
+    if problems:
+        return None, problems
+    if fixes:
+        schema_stats.incr('repaired_items')
+        logger.debug(f"{kind} 已本地修复: {fixes}")
+    return normalized, []
+
+
+def describe_schema(kind: str) -> str:
+    """补问提示词中的字段要求"""
+    schema = SCHEMAS[kind]
+    return '，'.join(
+        f"{field}（{'字符串' if field_type == 'str' else '数组'}{'，必填' if field in schema['required'] else ''}）"
+        for field, field_type in schema['fields'].items()
+    )
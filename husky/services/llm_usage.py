@@ -0,0 +1,118 @@
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from husky.config import LLM_PRICING
+from husky.repositories.mysql_repository import MysqlRepository
+
+
+def usage_fields(usage: Any) -> Dict[str, int]:
+    """从服务商返回的 usage 中取出输入、输出与上下文缓存命中的token数"""
+    if usage is None:
+        return {'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+    cached = getattr(usage, 'prompt_cache_hit_tokens', None)
+    if cached is None:
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', None) if details is not None else None
+    return {
+        'prompt_tokens': usage.prompt_tokens or 0,
+        'completion_tokens': usage.completion_tokens or 0,
+        'cached_tokens': cached or 0
+    }
+
+
+class UsageStore:
+    """
+    大模型调用用量（表结构见 sql/llm_usage.sql）
+    每次调用记录所属任务、阶段、token数、耗时与重试次数，按任务/阶段汇总用量与费用
+    """
+
+    TABLE = 'llm_usage'
+
+    METRICS = {
+        'calls': 'COUNT(*)',
+        'cache_hits': 'SUM(`cache_hit`)',
+        'failed': "SUM(`status` <> 'success')",
+        'prompt_tokens': 'SUM(`prompt_tokens`)',
+        'completion_tokens': 'SUM(`completion_tokens`)',
+        'cached_tokens': 'SUM(`cached_tokens`)',
+        'retries': 'SUM(`retries`)',
+        'latency_ms': 'SUM(`latency_ms`)',
+        'max_latency_ms': 'MAX(`latency_ms`)'
+    }
+
+    # 汇总接口允许的分组维度
+    DIMENSIONS = ('stage', 'model', 'task_id', 'require_id')
+
+    def record(self, context: Optional[Dict], model: str, usage: Any = None, latency: float = 0,
+               retries: int = 0, status: str = 'success', cache_hit: bool = False, error: str = None) -> None:
+        """记录一次调用，写入失败不影响大模型调用本身"""
+        context = context or {}
+        try:
+            with MysqlRepository() as db:
+                db.create(self.TABLE, {
+                    'task_id': context.get('task_id'),
+                    'require_id': context.get('require_id'),
+                    'stage': context.get('stage'),
+                    'model': model,
+                    'status': status,
+                    'cache_hit': cache_hit,
+                    'latency_ms': int(latency * 1000),
+                    'retries': retries,
+                    'error': error[:500] if error else None,
+                    **usage_fields(usage)
+                })
+        except Exception as e:
+            logger.warning(f"记录大模型用量失败: {e}")
+
+    def summary(self, where: Optional[Dict] = None, group_by: str = 'stage') -> Dict:
+        """汇总用量：整体合计及按 group_by 维度的明细，费用按模型计价累加"""
+        with MysqlRepository() as db:
+            rows = db.aggregate(self.TABLE, self.METRICS, where=where, group_by=list(dict.fromkeys([group_by, 'model'])))
+
+        groups: Dict[Any, Dict] = {}
+        total = self._empty()
+        for row in rows:
+            row = {key: (int(value) if key in self.METRICS and value is not None else value) for key, value in row.items()}
+            cost = self._cost(row)
+            for bucket in (groups.setdefault(row[group_by], self._empty()), total):
+                self._merge(bucket, row, cost)
+        return {
+            'total': self._finish(total),
+            group_by: [{group_by: key, **self._finish(bucket)} for key, bucket in groups.items()]
+        }
+
+    def _empty(self) -> Dict:
+        return {**{key: 0 for key in self.METRICS}, 'cost': 0.0, 'models': []}
+
+    @staticmethod
+    def _merge(bucket: Dict, row: Dict, cost: float) -> None:
+        for key, value in row.items():
+            if key == 'max_latency_ms':
+                bucket[key] = max(bucket[key], value or 0)
+            elif key in bucket and key not in ('models', 'cost'):
+                bucket[key] += value or 0
+        bucket['cost'] += cost
+        if row['model'] not in bucket['models']:
+            bucket['models'].append(row['model'])
+
+    @staticmethod
+    def _finish(bucket: Dict) -> Dict:
+        requested = bucket['calls'] - bucket['cache_hits']
+        bucket['avg_latency_ms'] = bucket['latency_ms'] // requested if requested > 0 else 0
+        bucket['cost'] = round(bucket['cost'], 4)
+        return bucket
+
+    @staticmethod
+    def _cost(row: Dict) -> float:
+        """按模型计价估算费用（元），未配置价格的模型记为0"""
+        price = LLM_PRICING.get(row['model'])
+        if not price:
+            return 0.0
+        missed = (row['prompt_tokens'] or 0) - (row['cached_tokens'] or 0)
+        return (
+            missed * price['input']
+            + (row['cached_tokens'] or 0) * price['cache_hit']
+            + (row['completion_tokens'] or 0) * price['output']
+        ) / 1_000_000
+
@@ -1,9 +1,10 @@
 import os
-import re
 
 import fitz  # PyMuPDF
 import pdfplumber
 
+from husky.services.chunker import HEADING_MAX_LENGTH, HEADING_PATTERN
+
 class PdfService:
 
     def __init__(self, pdf_path):
@@ -28,21 +29,13 @@ class PdfService:
         """优化的章节解析方法"""
         sections = {}
         current_section = None
-        # 增强版正则表达式，匹配更复杂的标题格式
-        section_pattern = re.compile(
-            r'^(?:[#]*\s*)?'          # 匹配 # 号或编号
-            r'(?:\d+[\.、]?\s*)?'     # 匹配数字编号（1. 或 1、）
-            r'([\u4e00-\u9fa5a-zA-Z]{2,20})'  # 捕获核心标题文字
-            r'[\s　]*$',              # 结尾空白
-            re.IGNORECASE
-        )
-
         for line in self.text.split('\n'):
             line = line.strip()
-            if len(line) > 50:  # 过滤过长的内容行
+            if len(line) > HEADING_MAX_LENGTH:  # 过滤过长的内容行
                 continue
                 
-            match = section_pattern.match(line)
+            # 标题规则与需求本地分块共用
+            match = HEADING_PATTERN.match(line)
             if match:
                 # 提取核心标题文字（如"1.1 功能需求" -> "功能需求"）
                 current_section = match.group(1).strip()
@@ -0,0 +1,421 @@
+import os
+import json
+import time
+import socket
+import threading
+
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pymysql
+from loguru import logger
+
+from husky.config import TASK_QUEUE
+from husky.repositories.mysql_repository import MysqlRepository
+from husky.services.batch_service import BATCH_TASK_TYPE, BatchService
+from husky.services.cancellation import TaskCancelled, cancel_task, register_token, release_token
+from husky.services.event_bus import event_bus
+from husky.services.worker_metrics import WorkerMetricsStore
+from husky.utils import decode_json_fields
+
+
+class TaskQueue:
+    """
+    以 tasks 表为持久化队列：pending 即待执行，工作进程领取后持有带过期时间的租约，
+    执行期间定时续约；租约过期的任务视为工作进程失联，自动重新排队
+    """
+
+    def __init__(self, worker_id: str, lease_seconds: int = None, max_attempts: int = None):
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds or TASK_QUEUE['lease_seconds']
+        self.max_attempts = max_attempts or TASK_QUEUE['max_attempts']
+
+    @staticmethod
+    def _placeholders(values: List) -> str:
+        return ', '.join(['%s'] * len(values))
+
+    def claim(self, limit: int) -> List[Dict]:
+        """
+        按优先级、创建顺序领取最多limit个待执行任务，SKIP LOCKED 保证多个工作进程互不阻塞；
+        批量任务的子任务还须满足所属批次的并发与token预算：预算已用满的批次在查询中直接排除，
+        其余超出预算的子任务被跳过，继续向后扫描直到领满或没有更多待执行任务
+        """
+        if limit <= 0:
+            return []
+        with MysqlRepository() as db:
+            conn = db.connection
+            try:
+                with conn.cursor() as cursor:
+                    budgets = BatchService.lock_budgets(cursor)
+                    saturated = BatchService.saturated(budgets)
+                    exclude = (f" AND (`parent_id` IS NULL OR `parent_id` NOT IN ({self._placeholders(saturated)}))"
+                               if saturated else '')
+                    page = limit * TASK_QUEUE['claim_scan_factor']
+                    task_ids, offset = [], 0
+                    while len(task_ids) < limit:
+                        cursor.execute(
+                            "SELECT `task_id`, `parent_id`, `payload` FROM `tasks` "
+                            f"WHERE `status` = 'pending' AND `task_type` <> %s{exclude} "
+                            "ORDER BY `priority`, `created_at` LIMIT %s OFFSET %s FOR UPDATE SKIP LOCKED",
+                            (BATCH_TASK_TYPE, *saturated, page, offset)
+                        )
+                        candidates = cursor.fetchall()
+                        task_ids += BatchService.select_claimable(candidates, budgets, limit - len(task_ids))
+                        if len(candidates) < page:
+                            break
+                        offset += page
+                    if not task_ids:
+                        conn.commit()
+                        return []
+                    placeholders = self._placeholders(task_ids)
+                    cursor.execute(
+                        "UPDATE `tasks` SET `status` = 'processing', `message` = '工作进程已领取任务', "
+                        "`worker_id` = %s, `attempts` = `attempts` + 1, "
+                        f"`lease_expires_at` = NOW() + INTERVAL %s SECOND WHERE `task_id` IN ({placeholders})",
+                        (self.worker_id, self.lease_seconds, *task_ids)
+                    )
+                    cursor.execute(
+                        "SELECT `task_id`, `require_id`, `task_type`, `parent_id`, `payload`, `attempts` FROM `tasks` "
+                        f"WHERE `task_id` IN ({placeholders}) ORDER BY `priority`, `created_at`",
+                        tuple(task_ids)
+                    )
+                    tasks = cursor.fetchall()
+                conn.commit()
+            except pymysql.Error:
+                conn.rollback()
+                raise
+
+        for task in tasks:
+            if isinstance(task.get('payload'), str):
+                task['payload'] = json.loads(task['payload'])
+            event_bus.publish(task['task_id'], 'status', {'status': 'processing', 'message': '工作进程已领取任务'})
+        return tasks
+
+    def heartbeat(self, task_ids: List[str]) -> int:
+        """为仍在执行的任务续约，返回续约成功的数量"""
+        if not task_ids:
+            return 0
+        with MysqlRepository() as db:
+            with db.connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE `tasks` SET `lease_expires_at` = NOW() + INTERVAL %s SECOND "
+                    f"WHERE `task_id` IN ({self._placeholders(task_ids)}) "
+                    "AND `worker_id` = %s AND `status` = 'processing'",
+                    (self.lease_seconds, *task_ids, self.worker_id)
+                )
+                renewed = cursor.rowcount
+            db.connection.commit()
+        if renewed < len(task_ids):
+            logger.warning(f"工作进程 {self.worker_id} 有 {len(task_ids) - renewed} 个任务续约失败，租约可能已被回收")
+        return renewed
+
+    def cancelled(self, task_ids: List[str]) -> List[str]:
+        """在途任务中已被用户取消的任务"""
+        if not task_ids:
+            return []
+        with MysqlRepository() as db:
+            rows = db.search_in(
+                'tasks', 'task_id', task_ids,
+                columns=['task_id'],
+                where={'status': 'cancelled'}
+            )
+        return [row['task_id'] for row in rows]
+
+    def release(self, task_id: str) -> None:
+        """任务执行结束后释放租约"""
+        with MysqlRepository() as db:
+            db.update(
+                'tasks',
+                {'worker_id': None, 'lease_expires_at': None},
+                where={'task_id': task_id, 'worker_id': self.worker_id}
+            )
+
+    def requeue_expired(self) -> int:
+        """
+        回收租约已过期的任务：未超过重试次数的重新排队，否则标记失败
+        lease_expires_at 为空的 processing 任务来自升级前的进程内线程，同样视为失联；
+        批量任务的父任务不被领取、没有租约，不在回收范围内
+        """
+        expired = (f"`status` = 'processing' AND `task_type` <> '{BATCH_TASK_TYPE}' "
+                   "AND (`lease_expires_at` IS NULL OR `lease_expires_at` < NOW())")
+        with MysqlRepository() as db:
+            conn = db.connection
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "UPDATE `tasks` SET `status` = 'failed', `message` = '工作进程多次失联，任务已终止', "
+                        f"`end_time` = NOW(), `worker_id` = NULL, `lease_expires_at` = NULL "
+                        f"WHERE {expired} AND `attempts` >= %s",
+                        (self.max_attempts,)
+                    )
+                    failed = cursor.rowcount
+                    cursor.execute(
+                        "UPDATE `tasks` SET `status` = 'pending', `message` = '工作进程失联，任务重新排队', "
+                        f"`worker_id` = NULL, `lease_expires_at` = NULL WHERE {expired}"
+                    )
+                    requeued = cursor.rowcount
+                conn.commit()
+            except pymysql.Error:
+                conn.rollback()
+                raise
+        if failed or requeued:
+            logger.warning(f"回收失联任务：重新排队 {requeued} 个，终止 {failed} 个")
+        return requeued
+
+
+def run_task(task: Dict) -> None:
+    """按任务类型分派到 TaskService，执行期间登记取消令牌"""
+    from husky.services.task_service import RESULT_TABLES, TaskService
+
+    task_id = task['task_id']
+    payload = task.get('payload') or {}
+    if task['task_type'] not in RESULT_TABLES:
+        raise ValueError(f"未知的任务类型: {task['task_type']}")
+    if task['attempts'] > 1:
+        # 重试时按检查点续跑，已完成的工作单元不再重复调用大模型
+        logger.info(f"任务 {task_id} 第 {task['attempts']} 次执行，从检查点续跑")
+
+    token = register_token(task_id)
+    service = TaskService(bypass_cache=bool(payload.get('no_cache')), cancel_token=token)
+    try:
+        if task['task_type'] == 'point_analysis':
+            service.process_point_analysis(task_id, task['require_id'], incremental=not payload.get('full'))
+        else:
+            service.process_testcase_analysis(task_id, task['require_id'], payload.get('point_ids') or [])
+    except TaskCancelled:
+        service.finish_cancelled(task_id, task['task_type'])
+    finally:
+        release_token(task_id)
+
+
+class Worker:
+    """
+    固定大小的工作线程池：轮询领取任务、定时续约并回收失联任务
+    :param workers: 同时执行的任务数
+    """
+
+    def __init__(self, workers: int = None, worker_id: str = None):
+        self.workers = workers or TASK_QUEUE['workers']
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.queue = TaskQueue(self.worker_id)
+        self.metrics = WorkerMetricsStore()
+        self.poll_interval = TASK_QUEUE['poll_interval']
+        self.heartbeat_seconds = TASK_QUEUE['heartbeat_seconds']
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # 有执行槽位空出时唤醒轮询，不必等满一个轮询间隔
+        self._wake = threading.Event()
+
+    def stop(self) -> None:
+        """停止领取新任务，已领取的任务执行完毕后退出"""
+        self._stop.set()
+        self._wake.set()
+
+    def start(self) -> threading.Thread:
+        """在后台线程中运行（Web进程内嵌模式）"""
+        thread = threading.Thread(target=self.run, name=f'worker-{self.worker_id}', daemon=True)
+        thread.start()
+        return thread
+
+    def run(self) -> None:
+        logger.info(f"工作进程 {self.worker_id} 启动，并发 {self.workers}")
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name='worker-heartbeat', daemon=True)
+        heartbeat.start()
+        last_reap = 0.0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='worker') as executor:
+            while not self._stop.is_set():
+                try:
+                    if time.monotonic() - last_reap >= self.heartbeat_seconds:
+                        self.queue.requeue_expired()
+                        # 汇总未结束批次的进度，覆盖子任务执行中的进度与失联回收
+                        BatchService().refresh()
+                        # 上报进程内指标，供Web进程的 /metrics 汇总
+                        self.metrics.publish(self.worker_id, len(self._running))
+                        last_reap = time.monotonic()
+                    with self._lock:
+                        running = list(self._running)
+                    # 用户取消的在途任务立即中断，任务退出后会唤醒轮询领取新任务
+                    for task_id in self.queue.cancelled(running):
+                        if cancel_task(task_id):
+                            logger.info(f"任务 {task_id} 已被取消，正在中断")
+                    with self._lock:
+                        free = self.workers - len(self._running)
+                    for task in self.queue.claim(free):
+                        with self._lock:
+                            self._running.add(task['task_id'])
+                        executor.submit(self._execute, task)
+                except Exception as e:
+                    # 数据库暂不可用等情况，等待下一轮
+                    logger.error(f"工作进程 {self.worker_id} 轮询任务失败: {e}")
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+            logger.info(f"工作进程 {self.worker_id} 停止领取任务，等待 {len(self._running)} 个任务结束")
+        heartbeat.join()
+        self.metrics.remove(self.worker_id)
+        logger.info(f"工作进程 {self.worker_id} 已退出")
+
+    def _execute(self, task: Dict) -> None:
+        task_id = task['task_id']
+        logger.info(f"开始执行任务 {task_id}（{task['task_type']}，第 {task['attempts']} 次）")
+        try:
+            run_task(task)
+        except Exception as e:
+            logger.exception(f"任务 {task_id} 执行失败: {e}")
+            from husky.services.task_service import TaskService
+            TaskService().update_task_status(task_id, status='failed', message=f"任务执行失败: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(task_id)
+            self._wake.set()
+            try:
+                self.queue.release(task_id)
+            except Exception as e:
+                logger.error(f"释放任务 {task_id} 租约失败: {e}")
+            if task.get('parent_id'):
+                try:
+                    BatchService().refresh([task['parent_id']])
+                except Exception as e:
+                    logger.error(f"汇总批量任务 {task['parent_id']} 进度失败: {e}")
+
+    def _heartbeat_loop(self) -> None:
+        """定时续约；停止后仍持续到所有在途任务结束"""
+        while True:
+            with self._lock:
+                running = list(self._running)
+            if self._stop.is_set() and not running:
+                return
+            try:
+                self.queue.heartbeat(running)
+            except Exception as e:
+                logger.error(f"工作进程 {self.worker_id} 续约失败: {e}")
+            time.sleep(min(self.heartbeat_seconds, 1) if self._stop.is_set() else self.heartbeat_seconds)
+
+
+# 桥接时转发新落库明细的任务类型：明细表、主键与需要解码的JSON字段
+ITEM_TABLES = {
+    'point_analysis': ('points', 'point_id', ['preconditions']),
+    'testcase_analysis': ('testcases', 'case_id', ['preconditions', 'test_steps', 'expected_result', 'test_type'])
+}
+
+
+class StatusBridge:
+    """
+    任务在独立工作进程中执行时，Web进程的事件总线收不到其发布的事件；
+    由本桥接线程轮询有订阅者的任务状态与新落库的功能点/测试用例，变化时转发到本进程事件总线
+    明细按 created_at 高水位增量读取：created_at 只精确到秒，且并发写入的行提交顺序与时间戳不一定一致，
+    因此每轮回看高水位之前 lookback 秒，并按主键记住回看窗口内已转发的行
+    """
+
+    def __init__(self, interval: float = None, lookback: float = 5):
+        self.interval = interval or TASK_QUEUE['poll_interval']
+        self.lookback = timedelta(seconds=lookback)
+        self._seen: Dict[str, tuple] = {}
+        # task_id -> [高水位, {回看窗口内已转发的主键: created_at}]
+        self._marks: Dict[str, list] = {}
+
+    def run(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"任务状态桥接轮询失败: {e}")
+            time.sleep(self.interval)
+
+    def poll(self) -> None:
+        task_ids = event_bus.subscribed_task_ids()
+        self._seen = {task_id: seen for task_id, seen in self._seen.items() if task_id in task_ids}
+        self._marks = {task_id: mark for task_id, mark in self._marks.items() if task_id in task_ids}
+        if not task_ids:
+            return
+        with MysqlRepository() as db:
+            tasks = db.search_in(
+                'tasks', 'task_id', task_ids,
+                columns=['task_id', 'task_type', 'status', 'progress', 'message', 'result', 'updated_at']
+            )
+            # 状态之后再读明细：工作进程先写明细再更新状态，任务结束前的最后一批明细不会漏掉
+            items = self._new_items(db, tasks)
+        for task in tasks:
+            task_id = task.pop('task_id')
+            task_type = task.pop('task_type')
+            # 明细先于状态转发，订阅者收到结束状态断开前已拿到全部明细
+            if items.get(task_id):
+                event_bus.publish(task_id, 'items', {'type': ITEM_TABLES[task_type][0], 'items': items[task_id]})
+            version = (task['updated_at'], task['status'], task['progress'], task['message'])
+            if self._seen.get(task_id) == version:
+                continue
+            self._seen[task_id] = version
+            if isinstance(task.get('result'), str):
+                try:
+                    task['result'] = json.loads(task['result'])
+                except json.JSONDecodeError:
+                    task['result'] = {}
+            event_bus.publish(task_id, 'status', task)
+
+    def _new_items(self, db: MysqlRepository, tasks: List[Dict]) -> Dict[str, List[Dict]]:
+        """
+        各任务自上一轮以来新落库的明细；首次见到的任务以当前已落库的最新行为起点，
+        此前的明细由查询接口获取（与内嵌模式下只推送订阅之后落库的明细一致）
+        """
+        by_type: Dict[str, List[str]] = {}
+        for task in tasks:
+            if task['task_type'] in ITEM_TABLES:
+                by_type.setdefault(task['task_type'], []).append(task['task_id'])
+
+        items: Dict[str, List[Dict]] = {}
+        for task_type, task_ids in by_type.items():
+            table, key, json_fields = ITEM_TABLES[task_type]
+            for task_id in task_ids:
+                if task_id not in self._marks:
+                    latest = db.search(table, columns=['created_at'], where={'task_id': task_id},
+                                       order_by=['-created_at'], limit=1)
+                    self._marks[task_id] = [latest[0]['created_at'] if latest else None, {}]
+                    if latest:
+                        # 起点所在回看窗口内的行视为已转发
+                        self._advance(task_id, key, db.search(
+                            table, columns=[key, 'created_at'],
+                            where={'task_id': task_id, 'created_at__gte': latest[0]['created_at'] - self.lookback}
+                        ))
+            marks = [self._marks[task_id][0] for task_id in task_ids]
+            where = {'task_id': task_ids}
+            if None not in marks:
+                where['created_at__gte'] = min(marks) - self.lookback
+            rows = db.search(table, where=where, order_by=['created_at', key])
+            for row in rows:
+                since, forwarded = self._marks[row['task_id']]
+                if row[key] in forwarded or (since is not None and row['created_at'] < since - self.lookback):
+                    continue
+                forwarded[row[key]] = row['created_at']
+                items.setdefault(row['task_id'], []).append(
+                    {k: v for k, v in row.items() if k not in ('created_at', 'updated_at')}
+                )
+            for task_id in task_ids:
+                self._advance(task_id, key, [])
+            decode_json_fields([row for task_id in task_ids for row in items.get(task_id, [])], json_fields)
+        return items
+
+    def _advance(self, task_id: str, key: str, rows: List[Dict]) -> None:
+        """登记已转发的行，推进高水位，并丢弃回看窗口之外的主键"""
+        mark = self._marks[task_id]
+        for row in rows:
+            mark[1][row[key]] = row['created_at']
+        if mark[1]:
+            mark[0] = max(mark[1].values()) if mark[0] is None else max(mark[0], *mark[1].values())
+            mark[1] = {item_id: created_at for item_id, created_at in mark[1].items()
+                       if created_at >= mark[0] - self.lookback}
+
+
+_bridge: Optional[threading.Thread] = None
+_bridge_lock = threading.Lock()
+
+
+def ensure_status_bridge() -> None:
+    """按需启动进程内唯一的状态桥接线程；内嵌工作线程模式下事件直接在本进程发布，无需桥接"""
+    global _bridge
+    if TASK_QUEUE.get('embedded'):
+        return
+    with _bridge_lock:
+        if _bridge is None or not _bridge.is_alive():
+            _bridge = threading.Thread(target=StatusBridge().run, name='task-status-bridge', daemon=True)
+            _bridge.start()
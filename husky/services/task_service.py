@@ -1,193 +1,90 @@
-import os
 import json
 import uuid
+import threading
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from itertools import zip_longest
 from typing import Dict, List, Optional
 
 from loguru import logger
-from openai import OpenAI
 
-from husky.repositories.mysql_repository import MysqlRepository
-from husky.utils import get_husky_id
+from husky.config import (LLM_MAX_WORKERS, LLM_STREAMING, STREAM_PERSIST_BATCH, TESTCASE_CONTEXT, LLM_BATCHING,
+                          CHUNKER, TESTCASE_DEDUP)
+from husky.repositories.mysql_repository import MysqlRepository, BatchWriter
+from husky.services.batch_service import requirement_priority
+from husky.services.cancellation import CancelToken, TaskCancelled
+from husky.services.checkpoint import CheckpointStore
+from husky.services.dedup import TestcaseDeduplicator
+from husky.services.chunker import group_sections, merge_modules, reconcile_labels, split_sections, window_sections
+from husky.services.event_bus import TERMINAL_STATUSES, event_bus
+from husky.services.json_stream import JsonArrayStreamParser
+from husky.services.llm_batch import batch_results, pack_batches, run_with_split
+from husky.services.llm_cache import cached_chat, cached_chat_stream
+from husky.services.llm_schema import SchemaError, describe_schema, parse_response, schema_stats, validate_item
+from husky.services.token_counter import estimate_tokens, truncate_to_tokens
+from husky.utils import get_husky_id, text_hash
 
-class TaskService():
-    
-    def __init__(self):
-        self.gpt = OpenAI(api_key=os.getenv("API_KEY"), base_url="https://api.deepseek.com")
-        self.task_status = {}
-
-    def process_point_analysis(self, task_id: str, require_id: str) -> None:
-        """协调处理流程"""
-        # 初始化任务状态
-        self.update_task_status(task_id, status='processing', progress=10, message="开始需求分块处理...")
-            
-        # 第一步：需求分块处理
-        self.chunk_requirements(task_id, require_id)
-        self.update_task_status(task_id, status='processing', progress=30, message="需求分块完成，开始提取功能点...")
-            
-        # 第二步：模块功能点提取
-        self.extract_function_points(task_id)
-        self.update_task_status(task_id, status='processing', progress=90, message="功能点提取完成，正在保存结果...")
-            
-        # 最终结果处理
-        self.finalize_point_task(task_id, require_id)
-        self.update_task_status(
-            task_id,
-            status='completed',
-            progress=100,
-            message="任务完成",
-            result=json.dumps({
-                'points_count': len(self.get_task_points(task_id)),
-                'require_id': require_id
-            })
-        )
-
-    def chunk_requirements(self, task_id: str, require_id: str):
-        """第一步：需求分块处理"""
-        try:
-            with MysqlRepository() as db:
-                requirement = db.search('requirements', columns=['original_text'], where={'require_id': require_id})
-            logger.debug(f"需求拆分模块：{requirement}")
-            original_text = requirement[0]['original_text'] if requirement else ""
-            prompt = """
-                目标：将大型需求文档分解为逻辑连贯的独立模块
-                你是一个资深产品需求分析师，请将以下产品需求文档分解为逻辑独立的分析模块：
+# 各类任务的结果表
+RESULT_TABLES = {
+    'point_analysis': 'points',
+    'testcase_analysis': 'testcases'
+}
 
-                **输入要求**：
-                1. 原始需求文档全文（可能包含PRD、用户故事、技术描述等混合内容）
-                2. 文档类型（如功能需求/性能需求/安全需求等）
+# 本地分块后为各片段标注模块的指令，只返回编号与标注，不复述原文
+CHUNK_LABEL_INSTRUCTIONS = """
+                目标：为需求文档的各个片段标注所属模块
+                你是一个资深产品需求分析师，需求文档已按标题和篇幅切分为有序片段（内容可能只截取了开头），
+                请为每个片段标注所属的功能模块和业务领域：
 
                 **处理规则**：
                 1. 按业务领域和功能耦合度划分模块（如用户模块、支付模块、消息中心等）
-                2. 每个模块应包含完整的功能闭环
-                3. 截取文档原文作为chunks结果，不能对原文进行修改
+                2. 每个模块应包含完整的功能闭环，连续且属于同一模块的片段标注完全相同的模块名称和业务领域
+                3. 只输出片段编号与标注，不要复述片段内容
 
+                **输出格式**：
+                1. 必须严格按以下JSON格式输出，每个片段输出且只输出一次，id为片段编号
+                ```json
+                {
+                    "labels": [
+                        {"id": 0, "module": "用户注册登录", "business_domain": "用户体系"},
+                        {...}
+                    ]
+                }
+
+                待标注片段：
+"""
+
+# 提取功能点的指令，单条与批量调用共用
+POINT_INSTRUCTIONS = """
+                **目标**：对每个模块提取详细功能点
+                作为高级产品经理，请从以下需求模块中提取原子级功能点：
+                
+                **提取要求**：
+                1. 识别最小可交付功能单元（如"支持微信登录"而非"用户认证系统"）
+                2. 按CRUD分类（功能、性能、兼容性、交互）
+                3. 标注技术复杂度（简单/中等/复杂）
+                4. 识别前置条件
+                
                 **输出格式**：
                 1. 必须严格按以下JSON格式输出，不能随意增加或减少字段
+                2. 禁止自行添加complexity、technical_complexity这类字段，严格遵守格式输出第一条准则！
                 ```json
                 {
-                    "chunks": [
+                    "points": [
                         {
-                            "module": "用户注册登录",
-                            "business_domain": "用户体系",
-                            "chunks": "包含手机号注册、第三方登录、密码找回等功能",
+                            "function_name": "手机号验证码注册",
+                            "test_type": "兼容性",
+                            "description": "用户通过手机号+短信验证码完成注册",
+                            "preconditions": ["短信服务可用"]
                         },
                         {...}
                     ]
                 }
-                待分析文档： """ + original_text
-
-            response = self.gpt.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": prompt}
-                ],
-                temperature=1.0,
-                response_format={"type": "json_object"},
-                stream=False
-            )
-
-            # 这里将测试用例存入数据库
-            chunks = json.loads(response.choices[0].message.content)
-            logger.debug(f'需求模块切分结果：{chunks}')
-            self.task_status[task_id] = {'chunks': chunks['chunks']}
-            return self
-        except Exception as error:
-            logger.error(f"需求分块处理失败: {str(error)}")
-            return 0
-
-    def extract_function_points(self, task_id: str):
-        """第二步：模块功能点提取"""
-        try:
-            for chunk in self.task_status[task_id]['chunks']:
-                prompt = """
-                    **目标**：对每个模块提取详细功能点
-                    作为高级产品经理，请从以下需求模块中提取原子级功能点：
-                    
-                    **提取要求**：
-                    1. 识别最小可交付功能单元（如"支持微信登录"而非"用户认证系统"）
-                    2. 按CRUD分类（功能、性能、兼容性、交互）
-                    3. 标注技术复杂度（简单/中等/复杂）
-                    4. 识别前置条件
-                    
-                    **输出格式**：
-                    1. 必须严格按以下JSON格式输出，不能随意增加或减少字段
-                    2. 禁止自行添加complexity、technical_complexity这类字段，严格遵守格式输出第一条准则！
-                    ```json
-                    {
-                        "points": [
-                            {
-                                "function_name": "手机号验证码注册",
-                                "test_type": "兼容性",
-                                "description": "用户通过手机号+短信验证码完成注册",
-                                "preconditions": ["短信服务可用"]
-                            },
-                            {...}
-                        ]
-                    }
-
-                    待分析内容：
-                    1. 模块名称：""" + chunk['module'] + """
-                    2. 业务领域：""" + chunk['business_domain'] + """
-                    3. 原始内容：""" + chunk['chunks']
-
-                response = self.gpt.chat.completions.create(
-                    model="deepseek-chat",
-                    messages=[
-                        {"role": "system", "content": prompt}
-                    ],
-                    temperature=1.0,
-                    response_format={"type": "json_object"},
-                    stream=False
-                )
+"""
 
-                points = json.loads(response.choices[0].message.content)
-                logger.debug(f'需求功能点切分结果：{points}')
-                chunk.setdefault("points", points['points'])
-            return self
-        except Exception as error:
-            logger.error(f"功能点提取失败: {str(error)}")
-            return 0
-    
-    def process_testcase_analysis(self, task_id: str, require_id: str, point_ids: list) -> None:
-        # 初始化任务状态
-        self.init_task('testcase_analysis', task_id, require_id)
-        self.task_status[task_id]['require_id'] = require_id  # 存储 require_id
-            
-        # 第一步：获取需求和测试点
-        self.update_task_status(task_id, 'processing', 20, "开始需求分块处理...")
-        self.search_requirement_and_points(task_id, require_id, point_ids)
-            
-        # 第二步：使用需求和测试点生成测试用例
-        self.update_task_status(task_id, 'processing', 90, "提取模块功能点...")
-        self.generate_testcases(task_id)
-            
-        # 最终结果处理
-        self.finalize_testcase_task(task_id, require_id)
-        self.update_task_status(task_id, 'completed', 100, "完成需求分析...")
-        
-    def search_requirement_and_points(self, task_id: str, require_id: str, point_ids: list):
-        # 查询原始需求内容
-        with MysqlRepository() as db:
-            requirements = db.search('requirements', columns=['require_name', 'original_text'], where={'require_id': require_id})
-            if requirements:
-                self.task_status[task_id] = {'requirement': requirements[0]['original_text']}
-            logger.debug(f"需求内容是：{self.task_status[task_id]['requirement']}")
-        
-        # 查询所有测试点
-        self.task_status[task_id]['points'] = []
-        for point_id in point_ids:
-            with MysqlRepository() as db:
-                point = db.search('points', columns=['function_name', 'description', 'business_domain', 'module', 'chunks', 'preconditions'], where={'point_id': point_id})
-                self.task_status[task_id]['points'].append(point[0])
-                logger.debug(f"功能点内容是：{point[0]}")
-    
-    def generate_testcases(self, task_id: str):
-        try:
-            self.task_status[task_id]['testcases'] = []
-            for point in self.task_status[task_id]['points']:
-                prompt = """
+# 生成测试用例的指令，单条与批量调用共用
+TESTCASE_INSTRUCTIONS = """
             你是一位资深的测试工程师, 负责将产品需求转化为手工测试用例. 请严格遵循以下规则:
             # 角色与目标
             - 角色: 功能测试专家, 擅长用户场景分析
@@ -261,71 +158,917 @@ class TaskService():
                     2. 每个用例步骤数<=6步
                     3. 预期结果必须可观察验证
                     4. 测试类型最多选2个分类
+"""
+
+# 批量调用时追加的输出要求：每个单元的结果按id单独列出，便于逐个落库、缺失时拆分重试
+POINT_BATCH_INSTRUCTIONS = """
+                **批量输出要求**：
+                本次包含多个模块，请分别提取每个模块的功能点，id为模块编号，
+                每个模块输出且只输出一次，必须严格按以下JSON格式输出：
+                ```json
+                {
+                    "results": [
+                        {"id": "模块编号", "points": [与上面格式相同的功能点]},
+                        {...}
+                    ]
+                }
+"""
+
+TESTCASE_BATCH_INSTRUCTIONS = """
+                    # 批量输出要求
+                    本次包含多个测试点，请分别为每个测试点生成测试用例，id为测试点ID，
+                    每个测试点输出且只输出一次，必须严格按以下JSON格式输出：
+                    ```json
+                    {
+                        "results": [
+                            {"id": "测试点ID", "testcases": [与上面示例格式相同的测试用例]},
+                            {...}
+                        ]
+                    }
+"""
+
+
+class TaskService():
+    
+    def __init__(self, bypass_cache: bool = False, cancel_token: Optional[CancelToken] = None):
+        self.task_status = {}
+        # 为True时忽略已缓存的大模型响应，强制重新生成
+        self.bypass_cache = bypass_cache
+        # 任务取消令牌，流水线在步骤之间及大模型调用中检查
+        self.cancel_token = cancel_token or CancelToken()
+        # 按工作单元持久化的检查点，重试/续跑时跳过已完成的单元
+        self.checkpoints = CheckpointStore()
+        # 保护并发单元共同累计的统计数据
+        self._stats_lock = threading.Lock()
+        # 本次执行实际发出的大模型请求数（含命中缓存的调用）
+        self.llm_requests = 0
+        # 大模型用量记录的归属（task_id/require_id），调用时再补充所属阶段
+        self.usage_context = {}
+
+    def process_point_analysis(self, task_id: str, require_id: str, incremental: bool = True) -> None:
+        """
+        协调处理流程
+        :param incremental: 为True时与该需求上一次的分析结果比对，只重新提取新增或变化的模块
+        """
+        # 初始化任务状态
+        self.task_status.setdefault(task_id, {})['require_id'] = require_id
+        self.usage_context = {'task_id': task_id, 'require_id': require_id}
+        self.update_task_status(task_id, status='processing', progress=10, message="开始需求分块处理...")
+            
+        # 第一步：需求分块处理
+        self.chunk_requirements(task_id, require_id)
+        self.cancel_token.raise_if_cancelled()
+        diff = self.carry_over_unchanged(task_id, require_id) if incremental else {}
+        message = "需求分块完成，开始提取功能点..."
+        if diff.get('base_task_id'):
+            message = (f"需求分块完成，沿用 {len(diff['carried_modules'])} 个未变化模块，"
+                       f"重新提取 {len(diff['changed_modules'])} 个模块...")
+        self.update_task_status(task_id, status='processing', progress=30, message=message)
+            
+        # 第二步：模块功能点提取
+        self.extract_function_points(task_id)
+        self.cancel_token.raise_if_cancelled()
+        self.update_task_status(task_id, status='processing', progress=90, message="功能点提取完成，正在保存结果...")
+            
+        # 最终结果处理
+        self.finalize_point_task(task_id, require_id)
+        self.update_task_status(
+            task_id,
+            status='completed',
+            progress=100,
+            message="任务完成",
+            result=json.dumps({
+                'points_count': self._count_results('points', task_id),
+                'failed_chunks': self.task_status[task_id]['failed_chunks'],
+                'diff': diff,
+                'llm_requests': self.llm_requests,
+                'require_id': require_id
+            })
+        )
+
+    def chunk_requirements(self, task_id: str, require_id: str):
+        """第一步：需求分块处理，分块结果写入检查点，续跑时直接复用"""
+        units = self.checkpoints.load(task_id, 'chunk')
+        if 'all' in self.checkpoints.completed(units):
+            logger.info(f"任务 {task_id} 复用检查点中的需求分块结果")
+            self.task_status.setdefault(task_id, {})['chunks'] = units['all']['output']
+            return self
+
+        self.checkpoints.start(task_id, 'chunk', 'all')
+        try:
+            with MysqlRepository() as db:
+                requirement = db.search('requirements', columns=['original_text'], where={'require_id': require_id})
+            logger.debug(f"需求拆分模块：{requirement}")
+            original_text = requirement[0]['original_text'] if requirement else ""
+            if CHUNKER['mode'] == 'local':
+                chunks = self._label_sections(original_text)
+            else:
+                chunks = self._chunk_by_llm(original_text)
+            logger.debug(f'需求模块切分结果：{chunks}')
+            self.task_status.setdefault(task_id, {})['chunks'] = chunks
+            self.checkpoints.complete(task_id, 'chunk', 'all', chunks)
+            return self
+        except TaskCancelled:
+            raise
+        except Exception as error:
+            logger.error(f"需求分块处理失败: {str(error)}")
+            self.checkpoints.fail(task_id, 'chunk', 'all', str(error))
+            raise
+
+    def _chunk_by_llm(self, original_text: str) -> List[Dict]:
+        """
+        由大模型直接切分需求并输出各模块原文；
+        超长文档按重叠窗口并发切分，各窗口的模块在本地按模块名与业务领域合并去重
+        """
+        sections = split_sections(original_text, CHUNKER['max_tokens'], CHUNKER['min_tokens'])
+        if not sections:
+            return []
+        windows = window_sections(
+            [estimate_tokens(original_text[section['start']:section['end']]) for section in sections],
+            CHUNKER['window_tokens'],
+            CHUNKER['overlap_tokens']
+        )
+        texts = [original_text[sections[window[0]]['start']:sections[window[-1]]['end']] for window in windows]
+
+        def chunk_window(text: str) -> List[Dict]:
+            prompt = """
+                目标：将大型需求文档分解为逻辑连贯的独立模块
+                你是一个资深产品需求分析师，请将以下产品需求文档分解为逻辑独立的分析模块：
+
+                **输入要求**：
+                1. 原始需求文档全文（可能包含PRD、用户故事、技术描述等混合内容）
+                2. 文档类型（如功能需求/性能需求/安全需求等）
+
+                **处理规则**：
+                1. 按业务领域和功能耦合度划分模块（如用户模块、支付模块、消息中心等）
+                2. 每个模块应包含完整的功能闭环
+                3. 截取文档原文作为chunks结果，不能对原文进行修改
+
+                **输出格式**：
+                1. 必须严格按以下JSON格式输出，不能随意增加或减少字段
+                ```json
+                {
+                    "chunks": [
+                        {
+                            "module": "用户注册登录",
+                            "business_domain": "用户体系",
+                            "chunks": "包含手机号注册、第三方登录、密码找回等功能",
+                        },
+                        {...}
+                    ]
+                }
+                待分析文档： """ + text
+
+            return self._chat_json(prompt, 'chunk', key='chunks', schema='chunk')['chunks']
+
+        if len(texts) == 1:
+            return chunk_window(texts[0])
+        return merge_modules(self._map_windows(texts, chunk_window))
+
+    def _label_sections(self, original_text: str) -> List[Dict]:
+        """
+        本地按标题、编号与篇幅切分原文，大模型只按区间编号标注模块与业务领域，不再复述原文；
+        区间较多时按重叠窗口并发标注，标注相同（模块名与业务领域）的区间合并为一个模块
+        """
+        sections = split_sections(original_text, CHUNKER['max_tokens'], CHUNKER['min_tokens'])
+        if not sections:
+            return []
+        previews = [
+            truncate_to_tokens(original_text[section['start']:section['end']], CHUNKER['label_preview_tokens'])
+            for section in sections
+        ]
+        windows = window_sections(
+            [estimate_tokens(preview) for preview in previews],
+            CHUNKER['window_tokens'],
+            CHUNKER['overlap_tokens']
+        )
+
+        def label_window(window: List[int]) -> Dict[int, Dict]:
+            prompt = CHUNK_LABEL_INSTRUCTIONS + "\n".join(
+                "                片段编号：" + str(index) + "\n"
+                "                标题：" + sections[index]['heading'] + "\n"
+                "                内容：" + previews[index]
+                for index in window
+            )
+            labels = {}
+            for label in self._chat_json(prompt, 'chunk', key='labels', schema='label')['labels']:
+                try:
+                    index = int(label.get('id'))
+                except (TypeError, ValueError):
+                    continue
+                if index in window:
+                    labels.setdefault(index, label)
+            return labels
+
+        results = self._map_windows(windows, label_window)
+        labels = reconcile_labels(windows, results)
+        missing = [sections[index]['heading'] for index in range(len(sections)) if index not in labels]
+        if missing:
+            logger.warning(f"{len(missing)} 个需求片段缺少模块标注，使用标题作为模块名: {missing}")
+        chunks = group_sections(original_text, sections, labels)
+        logger.info(f"需求本地切分为 {len(sections)} 个片段（{len(windows)} 个窗口），标注合并为 {len(chunks)} 个模块")
+        return chunks
+
+    def _map_windows(self, windows: list, analyze) -> list:
+        """各窗口并发调用大模型，结果按窗口顺序返回"""
+        if len(windows) == 1:
+            return [analyze(windows[0])]
+        workers = max(1, min(LLM_MAX_WORKERS, len(windows)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chunk') as executor:
+            return list(executor.map(analyze, windows))
+
+    def carry_over_unchanged(self, task_id: str, require_id: str) -> Dict:
+        """
+        增量分析：按模块原文指纹与该需求上一次完成的功能点分析比对，
+        未变化模块的功能点直接复制到本任务，并把对应的提取单元记为已完成，
+        只有新增或变化的模块需要调用大模型；
+        原文变化但模块名仍在新版中的模块记为 edited（旧功能点由重新提取的结果取代，不标记），
+        模块名已不在新版中的才是删除的模块，其旧功能点标记为 stale
+        """
+        units = self.checkpoints.load(task_id, 'diff')
+        if 'all' in self.checkpoints.completed(units):
+            # 续跑时沿用已完成的比对结果
+            return units['all']['output']
+
+        chunks = self.task_status[task_id]['chunks']
+        hashes = [text_hash(chunk['chunks']) for chunk in chunks]
+        diff = {
+            'base_task_id': None, 'carried_modules': [], 'changed_modules': [],
+            'edited_modules': [], 'removed_modules': []
+        }
+        with MysqlRepository() as db:
+            previous = db.search(
+                'tasks',
+                columns=['task_id'],
+                where={
+                    'require_id': require_id,
+                    'task_type': 'point_analysis',
+                    'status': 'completed',
+                    'task_id__ne': task_id
+                },
+                order_by=['-created_at'],
+                limit=1
+            )
+            if not previous:
+                diff['changed_modules'] = [chunk['module'] for chunk in chunks]
+                return diff
+            base_task_id = previous[0]['task_id']
+            # 上次比对中途中断时复制的功能点不完整，清理后重新复制
+            db.delete('points', where={'task_id': task_id, 'carried_from__ne': None})
+            base_points = db.search('points', where={'task_id': base_task_id, 'stale': 0})
+
+        # 上一版的模块：优先取检查点中的分块结果（包含没有功能点的模块），否则由功能点反推
+        base_modules = {}
+        base_units = self.checkpoints.load(base_task_id, 'chunk')
+        if 'all' in self.checkpoints.completed(base_units):
+            for chunk in base_units['all']['output']:
+                base_modules[text_hash(chunk['chunks'])] = chunk['module']
+        points_by_hash: Dict[str, List[Dict]] = {}
+        for point in base_points:
+            digest = point.get('chunk_hash') or text_hash(point['chunks'])
+            points_by_hash.setdefault(digest, []).append(point)
+            base_modules.setdefault(digest, point['module'])
+
+        rows, carried_units, seen = [], {}, set()
+        for index, (chunk, digest) in enumerate(zip(chunks, hashes)):
+            if digest not in base_modules or digest in seen:
+                diff['changed_modules'].append(chunk['module'])
+                continue
+            seen.add(digest)
+            carried = points_by_hash.get(digest, [])
+            for point in carried:
+                row = {k: v for k, v in point.items() if k not in ('created_at', 'updated_at')}
+                row.update({
+                    'point_id': get_husky_id('POINT'),
+                    'task_id': task_id,
+                    'module': chunk['module'],
+                    'business_domain': chunk['business_domain'],
+                    'chunks': chunk['chunks'],
+                    'chunk_index': index,
+                    'chunk_hash': digest,
+                    'carried_from': point['point_id']
+                })
+                rows.append(row)
+            carried_units[index] = {'points_count': len(carried), 'carried_from': base_task_id}
+            diff['carried_modules'].append(chunk['module'])
+
+        # 指纹消失的旧模块：模块名仍在新版中视为修改，否则视为删除
+        new_modules = {chunk['module'] for chunk in chunks}
+        missing = [digest for digest in base_modules if digest not in set(hashes)]
+        removed = [digest for digest in missing if base_modules[digest] not in new_modules]
+        diff['base_task_id'] = base_task_id
+        diff['edited_modules'] = list(dict.fromkeys(
+            base_modules[digest] for digest in missing if base_modules[digest] in new_modules
+        ))
+        diff['removed_modules'] = list(dict.fromkeys(base_modules[digest] for digest in removed))
+        stale_ids = [point['point_id'] for digest in removed for point in points_by_hash.get(digest, [])]
+        with MysqlRepository() as db:
+            if rows:
+                db.bulk_upsert('points', rows)
+            if stale_ids:
+                db.update('points', {'stale': 1}, where={'point_id': stale_ids})
+        self.checkpoints.mark_completed(task_id, 'extract', carried_units)
+        self.checkpoints.mark_completed(task_id, 'diff', {'all': diff})
+        logger.info(
+            f"任务 {task_id} 增量分析（基于 {base_task_id}）：沿用 {len(diff['carried_modules'])} 个模块、"
+            f"{len(rows)} 个功能点，重新提取 {len(diff['changed_modules'])} 个模块"
+            f"（其中修改 {len(diff['edited_modules'])} 个），"
+            f"删除 {len(diff['removed_modules'])} 个模块（{len(stale_ids)} 个功能点标记为 stale）"
+        )
+        return diff
+
+    def _chat_json(self, prompt: str, stage: str, key: Optional[str] = None, on_item=None,
+                   schema: Optional[str] = None, reask: bool = True) -> Dict:
+        """
+        调用大模型并解析JSON结果；命中缓存时不占用进程级并发额度
+        stage 为用量记录中的调用阶段（chunk/extract/generate）
+        指定key和on_item时，key数组中的每个元素一旦完整就回调on_item，
+        流式模式下无需等待整段响应结束，返回结果中的该数组即为回调过的元素
+        指定schema时响应先在本地修复，key数组中的元素逐个校验规整，不合规的元素不回调，
+        在响应结束后只针对这些元素补问一次（reask=False 时直接丢弃）
+        """
+        self.cancel_token.raise_if_cancelled()
+        with self._stats_lock:
+            self.llm_requests += 1
+        params = dict(
+            messages=[
+                {"role": "system", "content": prompt}
+            ],
+            temperature=1.0,
+            response_format={"type": "json_object"},
+            bypass_cache=self.bypass_cache,
+            cancel_token=self.cancel_token,
+            usage={**self.usage_context, 'stage': stage}
+        )
+        accepted, invalid = [], []
 
+        def handle(raw) -> None:
+            item, problems = validate_item(schema, raw) if schema else (raw, [])
+            if item is None:
+                invalid.append((raw, problems))
+                return
+            accepted.append(item)
+            if on_item:
+                on_item(item)
+
+        if LLM_STREAMING and key and on_item:
+            parser = JsonArrayStreamParser(key)
+            pieces, streamed = [], 0
+            for piece in cached_chat_stream(**params):
+                pieces.append(piece)
+                for item in parser.feed(piece):
+                    streamed += 1
+                    handle(item)
+            try:
+                result = parse_response(''.join(pieces), key)
+            except SchemaError:
+                # 截断到无法修复时保留已流式解析出的元素，缺失的部分由调用方按单元重试
+                if not streamed:
+                    raise
+                logger.warning(f"大模型响应无法完整解析，保留已解析的 {streamed} 个元素")
+                result = {}
+            if not streamed:
+                # 字段名写错等情况下流式解析取不到元素，按修复后的结果处理
+                for item in result.get(key) or []:
+                    handle(item)
+        else:
+            result = parse_response(cached_chat(**params), key)
+            if key:
+                for item in result.get(key) or []:
+                    handle(item)
+
+        if invalid:
+            logger.warning(f"{stage} 阶段有 {len(invalid)} 个元素不符合 {schema} 格式: {[p for _, p in invalid]}")
+            if reask:
+                accepted.extend(self._reask_invalid(prompt, stage, key, on_item, schema, invalid))
+            else:
+                schema_stats.incr('invalid_items', len(invalid))
+        if key:
+            # 以回调过的对象为准，保证与已落库的数据是同一批对象
+            result[key] = accepted
+        return result
+
+    def _reask_invalid(self, prompt: str, stage: str, key: str, on_item, schema: str, invalid: List[tuple]) -> List[Dict]:
+        """只针对不合规的元素补问一次大模型，返回补问后合规的元素；补问失败时放弃这些元素"""
+        schema_stats.incr('reasked_items', len(invalid))
+        reask_prompt = prompt + """
+                上一次的输出中以下对象不符合格式要求，请只重新输出修正后的这些对象，不要重复输出其它对象，
+                仍按 {"%s": [...]} 的JSON格式输出，每个对象的字段为：%s
+""" % (key, describe_schema(schema)) + "\n".join(
+            "                " + json.dumps(raw, ensure_ascii=False) + "  问题：" + "；".join(problems)
+            for raw, problems in invalid
+        )
+        try:
+            recovered = self._chat_json(reask_prompt, stage, key, on_item, schema, reask=False)[key]
+        except TaskCancelled:
+            raise
+        except Exception as e:
+            schema_stats.incr('invalid_items', len(invalid))
+            logger.warning(f"补问不合规元素失败，放弃 {len(invalid)} 个元素: {e}")
+            return []
+        schema_stats.incr('recovered_items', len(recovered))
+        return recovered
+
+    def _extract_chunk_points(self, chunk: Dict, on_point=None) -> List[Dict]:
+        """对单个模块提取功能点，on_point 在每个功能点解析完成时回调"""
+        prompt = POINT_INSTRUCTIONS + """
+                待分析内容：
+""" + self._chunk_scope(chunk) + "\n"
+
+        points = self._chat_json(prompt, 'extract', key='points', on_item=on_point, schema='point')
+        logger.debug(f'需求功能点切分结果：{points}')
+        return points['points']
+
+    def _extract_batch_points(self, chunks: Dict[str, Dict], on_result) -> None:
+        """一次请求为多个模块提取功能点，chunks 以模块编号为键，on_result 在每个模块的结果解析完成时回调"""
+        prompt = POINT_INSTRUCTIONS + POINT_BATCH_INSTRUCTIONS + """
+                待分析内容：
+""" + "\n".join(
+            "                模块编号：" + unit_id + "\n" + self._chunk_scope(chunk)
+            for unit_id, chunk in chunks.items()
+        ) + "\n"
+
+        results = self._chat_json(prompt, 'extract', key='results', on_item=on_result,
+                                  schema='point_batch', reask=False)
+        logger.debug(f'批量功能点切分结果：{results}')
+
+    @staticmethod
+    def _chunk_scope(chunk: Dict) -> str:
+        return ("                1. 模块名称：" + chunk['module'] + "\n"
+                "                2. 业务领域：" + chunk['business_domain'] + "\n"
+                "                3. 原始内容：" + chunk['chunks'])
+
+    def extract_function_points(self, task_id: str, start: int = 30, end: int = 90):
+        """
+        第二步：模块功能点提取，按token预算把多个模块打包进一次请求并发调用，进度随批次完成推进
+        每个模块的功能点解析完成即落库；每个模块是一个检查点单元，已完成的模块在续跑时跳过
+        """
+        status = self.task_status.get(task_id, {})
+        chunks = status.get('chunks', [])
+        require_id = status.get('require_id')
+        total = len(chunks)
+        units = self.checkpoints.load(task_id, 'extract')
+        completed = self.checkpoints.completed(units)
+        for index in range(total):
+            chunks[index].setdefault('points', [])
+        pending = [str(index) for index in range(total) if str(index) not in completed]
+        if len(pending) < total:
+            logger.info(f"任务 {task_id} 跳过 {total - len(pending)} 个已完成的模块")
+
+        def prepare(unit_id: str) -> None:
+            self.checkpoints.start(task_id, 'extract', unit_id)
+            if unit_id in units:
+                # 上次执行未完成，先清理该模块遗留的部分功能点
+                with MysqlRepository() as db:
+                    db.delete('points', where={'task_id': task_id, 'chunk_index': int(unit_id)})
+
+        def save_points(unit_id: str, points: List[Dict], writer: BatchWriter) -> None:
+            index = int(unit_id)
+            for point in points:
+                if 'point_id' not in point:
+                    writer.add(self._point_row(task_id, require_id, chunks[index], point, index))
+            writer.flush()
+            # 结果回写到对应模块，保持模块原有顺序
+            chunks[index]['points'] = points
+            self.checkpoints.complete(task_id, 'extract', unit_id, {'points_count': len(points)})
+
+        def run_single(unit_id: str) -> None:
+            index = int(unit_id)
+            writer = self._result_writer(task_id, 'points')
+            try:
+                points = self._extract_chunk_points(
+                    chunks[index],
+                    lambda point: writer.add(self._point_row(task_id, require_id, chunks[index], point, index))
+                )
+            finally:
+                # 失败或取消前已解析出的功能点同样保留
+                writer.flush()
+            save_points(unit_id, points, writer)
+
+        def run_batch(unit_ids: List[str], accepted: set) -> None:
+            writer = self._result_writer(task_id, 'points')
+            self._extract_batch_points(
+                {unit_id: chunks[int(unit_id)] for unit_id in unit_ids},
+                batch_results(unit_ids, accepted, 'points', lambda unit_id, points: save_points(unit_id, points, writer))
+            )
+
+        batches = self._pack(pending, lambda unit_id: estimate_tokens(self._chunk_scope(chunks[int(unit_id)])))
+        failures = self._run_batches(
+            task_id, 'extract', batches, prepare, run_batch, run_single,
+            label='功能点提取中', done=total - len(pending), total=total, start=start, end=end
+        )
+        for unit_id, error in failures.items():
+            logger.error(f"模块 {chunks[int(unit_id)].get('module')} 功能点提取失败: {str(error)}")
+            chunks[int(unit_id)]['points'] = []
+        status['failed_chunks'] = [chunks[int(unit_id)].get('module') for unit_id in pending if unit_id in failures]
+        return self
+
+    @staticmethod
+    def _pack(unit_ids: List[str], cost) -> List[List[str]]:
+        """按本地估算的token数把工作单元打包成批次，未开启批量调用时每批一个单元"""
+        if not LLM_BATCHING['enabled']:
+            return [[unit_id] for unit_id in unit_ids]
+        return pack_batches(unit_ids, cost, LLM_BATCHING['token_budget'], LLM_BATCHING['max_items'])
+
+    def _run_batches(self, task_id: str, stage: str, batches: List[List[str]], prepare, run_batch, run_single,
+                     label: str, done: int, total: int, start: int, end: int) -> Dict[str, Exception]:
+        """
+        各批次并发调用大模型，进度随批次完成推进；只有一个单元的批次走单条调用，
+        批量响应中缺失的单元拆半重试，最终失败的单元记入检查点并返回
+        """
+        failures = {}
+
+        def run(batch: List[str]) -> Dict[str, Exception]:
+            self.cancel_token.raise_if_cancelled()
+            for unit_id in batch:
+                prepare(unit_id)
+            return run_with_split(batch, run_batch, run_single)
+
+        workers = max(1, min(LLM_MAX_WORKERS, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{stage}-{task_id}') as executor:
+            futures = {executor.submit(run, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    batch_failures = future.result()
+                except TaskCancelled:
+                    # 排队中的批次会在调用大模型前检查令牌并立即退出
+                    raise
+                except Exception as error:
+                    batch_failures = {unit_id: error for unit_id in batch}
+                for unit_id, error in batch_failures.items():
+                    self.checkpoints.fail(task_id, stage, unit_id, str(error))
+                failures.update(batch_failures)
+                done += len(batch)
+                self.update_task_status(
+                    task_id,
+                    status='processing',
+                    progress=start + (end - start) * done // total,
+                    message=f"{label}（{done}/{total}）..."
+                )
+        logger.info(f"任务 {task_id} {stage} 阶段 {sum(map(len, batches))} 个单元打包为 {len(batches)} 个批次")
+        return failures
+
+    def _result_writer(self, task_id: str, table: str) -> BatchWriter:
+        """单个调用专用的结果写入缓冲，单元完成前先写完自己的数据"""
+        return BatchWriter(table, batch_size=STREAM_PERSIST_BATCH, on_flush=self._items_publisher(task_id, table))
+
+    @staticmethod
+    def _items_publisher(task_id: str, item_type: str):
+        """新落库的功能点/测试用例推送给进度订阅者"""
+        return lambda rows: event_bus.publish(task_id, 'items', {'type': item_type, 'items': rows})
+
+    @staticmethod
+    def _point_row(task_id: str, require_id: str, chunk: Dict, point: Dict, chunk_index: int) -> Dict:
+        """功能点落库行，首次调用时为功能点分配point_id"""
+        point.setdefault('point_id', get_husky_id('POINT'))
+        return {
+            'task_id': task_id,
+            'require_id': require_id,
+            'module': chunk['module'],
+            'chunks': chunk['chunks'],
+            'chunk_index': chunk_index,
+            'chunk_hash': text_hash(chunk['chunks']),
+            'business_domain': chunk['business_domain'],
+            **point,
+        }
+
+    def _context_report(self, task_id: str) -> Dict:
+        """本次执行中需求上下文的token统计"""
+        tokens = self.task_status[task_id].get('context_tokens') or {'full': 0, 'used': 0}
+        report = {
+            'mode': TESTCASE_CONTEXT['mode'],
+            'full_tokens': tokens['full'],
+            'used_tokens': tokens['used'],
+            'saved_tokens': tokens['full'] - tokens['used']
+        }
+        logger.info(f"任务 {task_id} 需求上下文token统计: {report}")
+        return report
+
+    @staticmethod
+    def _count_results(table: str, task_id: str) -> int:
+        """任务已落库的结果数（包含之前执行中已完成的单元）"""
+        with MysqlRepository() as db:
+            return db.count(table, where={'task_id': task_id})
+
+    def process_testcase_analysis(self, task_id: str, require_id: str, point_ids: list) -> None:
+        # 初始化任务状态（任务记录已由接口层创建）
+        self.task_status.setdefault(task_id, {})['require_id'] = require_id  # 存储 require_id
+        self.usage_context = {'task_id': task_id, 'require_id': require_id}
+            
+        # 第一步：获取需求和测试点
+        self.update_task_status(task_id, status='processing', progress=20, message="开始查询需求与测试点...")
+        try:
+            self.search_requirement_and_points(task_id, require_id, point_ids)
+        except ValueError as error:
+            logger.error(f"任务 {task_id} 查询需求与测试点失败: {error}")
+            self.update_task_status(task_id, status='failed', message=str(error))
+            return
+        missing = self.task_status[task_id]['missing_point_ids']
+        message = f"生成测试用例中，{len(missing)} 个测试点不存在: {missing}" if missing else "生成测试用例中..."
+            
+        # 第二步：使用需求和测试点生成测试用例
+        self.update_task_status(task_id, status='processing', progress=30, message=message)
+        self.generate_testcases(task_id)
+        self.cancel_token.raise_if_cancelled()
+            
+        # 最终结果处理
+        self.finalize_testcase_task(task_id, require_id)
+        failed_points = self.task_status[task_id]['failed_points']
+        all_failed = bool(failed_points) and len(failed_points) == len(self.task_status[task_id]['points'])
+        self.update_task_status(
+            task_id,
+            status='failed' if all_failed else 'completed',
+            progress=100,
+            message=f"完成需求分析，{len(failed_points)} 个测试点生成失败" if failed_points else "完成需求分析...",
+            result=json.dumps({
+                'testcases_count': self._count_results('testcases', task_id),
+                'context': self._context_report(task_id),
+                'missing_point_ids': missing,
+                'failed_point_ids': failed_points,
+                'duplicates': self.task_status[task_id].get('duplicates', 0),
+                'llm_requests': self.llm_requests,
+                'require_id': require_id
+            })
+        )
+        
+    def search_requirement_and_points(self, task_id: str, require_id: str, point_ids: list):
+        point_columns = ['point_id', 'function_name', 'description', 'business_domain', 'module', 'chunks', 'preconditions']
+        with MysqlRepository() as db:
+            # 查询原始需求内容
+            requirements = db.search('requirements', columns=['require_name', 'original_text'], where={'require_id': require_id})
+            if not requirements:
+                raise ValueError(f"需求不存在: {require_id}")
+            self.task_status.setdefault(task_id, {})['requirement'] = requirements[0]['original_text']
+            logger.debug(f"需求内容是：{self.task_status[task_id]['requirement']}")
+
+            # 一次IN查询取回所有测试点
+            rows = db.search_in('points', 'point_id', point_ids, columns=point_columns)
+
+        # 按调用方给定的顺序排列，并显式记录缺失的测试点
+        found = {row['point_id']: row for row in rows}
+        ordered_ids = list(dict.fromkeys(point_ids))
+        missing = [point_id for point_id in ordered_ids if point_id not in found]
+        self.task_status[task_id]['points'] = [found[point_id] for point_id in ordered_ids if point_id in found]
+        self.task_status[task_id]['missing_point_ids'] = missing
+        if missing:
+            logger.warning(f"任务 {task_id} 有 {len(missing)} 个测试点不存在: {missing}")
+        if not self.task_status[task_id]['points']:
+            raise ValueError(f"测试点均不存在: {missing}")
+        logger.debug(f"功能点内容是：{self.task_status[task_id]['points']}")
+    
+    def _generate_point_testcases(self, requirement: str, point: Dict, on_testcase=None) -> List[Dict]:
+        """为单个测试点生成测试用例，on_testcase 在每条用例解析完成时回调"""
+        prompt = TESTCASE_INSTRUCTIONS + """
                     # 需求内容如下：
-                """ + self.task_status[task_id]['requirement'] + """
+                """ + requirement + """
                     本次要生成的用范围是：
-                1. 功能名称：""" + point['function_name'] + """
-                2. 功能描述：""" + point['description'] + """
-                3. 业务领域：""" + point['business_domain'] + """
-                4. 功能模块：""" + point['module'] + """
-                5. 需求片段：""" + point['chunks'] + """
-                6. 前置条件：""" + point['preconditions'] + """
+""" + self._point_scope(point) + """
                 请理解需求内容，并为需求片段生成完备的测试用例。"""
 
-                response = self.gpt.chat.completions.create(
-                    model="deepseek-chat",
-                    messages=[
-                        {"role": "system", "content": prompt}
-                    ],
-                    temperature=1.0,
-                    response_format={"type": "json_object"},
-                    stream=False
+        testcases = self._chat_json(prompt, 'generate', key='testcases', on_item=on_testcase, schema='testcase')
+        logger.debug(f'生成测试用例结果：{testcases}')
+        return testcases['testcases']
+
+    def _generate_batch_testcases(self, requirement: str, points: List[Dict], on_result) -> None:
+        """一次请求为多个测试点生成测试用例，on_result 在每个测试点的用例解析完成时回调"""
+        prompt = TESTCASE_INSTRUCTIONS + TESTCASE_BATCH_INSTRUCTIONS + """
+                    # 需求内容如下：
+                """ + requirement + """
+                    本次要生成的测试点如下：
+""" + "\n".join(
+            "                测试点ID：" + point['point_id'] + "\n" + self._point_scope(point)
+            for point in points
+        ) + """
+                请理解需求内容，并为每个测试点的需求片段生成完备的测试用例。"""
+
+        results = self._chat_json(prompt, 'generate', key='results', on_item=on_result,
+                                  schema='testcase_batch', reask=False)
+        logger.debug(f'批量生成测试用例结果：{results}')
+
+    @staticmethod
+    def _point_scope(point: Dict) -> str:
+        return ("                1. 功能名称：" + point['function_name'] + "\n"
+                "                2. 功能描述：" + point['description'] + "\n"
+                "                3. 业务领域：" + point['business_domain'] + "\n"
+                "                4. 功能模块：" + point['module'] + "\n"
+                "                5. 需求片段：" + point['chunks'] + "\n"
+                "                6. 前置条件：" + point['preconditions'])
+
+    def _requirement_context(self, task_id: str, points: List[Dict]) -> str:
+        """
+        一次请求中测试点的需求上下文：检索模式下只取该需求中与这些测试点最相关的片段
+        （各测试点的检索结果轮流合并、去重），并受token预算约束；
+        同时累计逐个测试点携带整篇原文与实际使用的token数，用于统计节省量
+        """
+        status = self.task_status[task_id]
+        requirement = status['requirement']
+        context = requirement
+        if TESTCASE_CONTEXT['mode'] == 'retrieval':
+            ranked = [self._retrieve_passages(status['require_id'], point) for point in points]
+            passages = list(dict.fromkeys(
+                passage for group in zip_longest(*ranked) for passage in group if passage
+            ))
+            if passages:
+                budget = TESTCASE_CONTEXT['token_budget']
+                selected = []
+                for passage in passages:
+                    # 与需求片段重复的内容已在提示词中，无需再放入
+                    if any(passage in point['chunks'] for point in points):
+                        continue
+                    passage = truncate_to_tokens(passage, budget)
+                    if not passage:
+                        break
+                    selected.append(passage)
+                    budget -= estimate_tokens(passage)
+                context = '\n...\n'.join(selected)
+
+        with self._stats_lock:
+            status['context_tokens']['full'] += estimate_tokens(requirement) * len(points)
+            status['context_tokens']['used'] += estimate_tokens(context)
+        return context
+
+    @staticmethod
+    def _retrieve_passages(require_id: str, point: Dict) -> List[str]:
+        """按测试点在该需求的知识库分块中检索，检索失败时返回空列表由调用方回退"""
+        try:
+            from husky.services.knowledge_service import KnowledgeService
+            service = KnowledgeService()
+            question = f"{point['function_name']} {point['description']}"
+            results = service.query(question, TESTCASE_CONTEXT['top_k'], require_id=require_id)
+            if not results and not service.indexed(require_id):
+                logger.warning(f"需求 {require_id} 不在知识库索引中（未上传原文或索引未同步），使用需求全文")
+            return [result['text'] for result in results if result.get('text')]
+        except Exception as e:
+            logger.warning(f"需求 {require_id} 检索相关片段失败，使用需求全文: {e}")
+            return []
+
+    def generate_testcases(self, task_id: str, start: int = 30, end: int = 90):
+        """
+        第二步：按token预算把多个测试点打包进一次请求并发生成测试用例
+        单个测试点失败不影响其他测试点，用例解析完成即落库；
+        每个测试点是一个检查点单元，已完成的测试点在续跑时跳过
+        """
+        status = self.task_status[task_id]
+        status['testcases'] = []
+        status['context_tokens'] = {'full': 0, 'used': 0}
+        points = {point['point_id']: point for point in status.get('points', [])}
+        total = len(points)
+        require_id = status.get('require_id')
+        units = self.checkpoints.load(task_id, 'testcase')
+        completed = self.checkpoints.completed(units)
+        pending = [point_id for point_id in points if point_id not in completed]
+        if len(pending) < total:
+            logger.info(f"任务 {task_id} 跳过 {total - len(pending)} 个已完成的测试点")
+
+        def prepare(point_id: str) -> None:
+            self.checkpoints.start(task_id, 'testcase', point_id)
+            if point_id in units:
+                # 上次执行未完成，先清理该测试点遗留的部分用例
+                with MysqlRepository() as db:
+                    db.delete('testcases', where={'task_id': task_id, 'point_id': point_id})
+
+        dedup = self._testcase_deduplicator(task_id, completed)
+
+        def persist(point_id: str, testcase: Dict, writer: BatchWriter) -> None:
+            """补全主键后查重，重复用例按去重模式标记或丢弃"""
+            self._fill_testcase(task_id, require_id, testcase, point_id)
+            if dedup:
+                testcase['duplicate_of'] = dedup.add(testcase['case_id'], testcase)
+                if testcase['duplicate_of'] and TESTCASE_DEDUP['mode'] == 'merge':
+                    return
+            writer.add(testcase)
+
+        def save_testcases(point_id: str, testcases: List[Dict], writer: BatchWriter) -> None:
+            for testcase in testcases:
+                if 'case_id' not in testcase:
+                    persist(point_id, testcase, writer)
+            writer.flush()
+            if TESTCASE_DEDUP['mode'] == 'merge':
+                testcases = [testcase for testcase in testcases if not testcase.get('duplicate_of')]
+            with self._stats_lock:
+                status['testcases'].extend(testcases)
+            self.checkpoints.complete(task_id, 'testcase', point_id, {'testcases_count': len(testcases)})
+
+        def run_single(point_id: str) -> None:
+            writer = self._result_writer(task_id, 'testcases')
+            try:
+                context = self._requirement_context(task_id, [points[point_id]])
+                testcases = self._generate_point_testcases(
+                    context,
+                    points[point_id],
+                    lambda testcase: persist(point_id, testcase, writer)
                 )
+            finally:
+                # 失败或取消前已解析出的用例同样保留
+                writer.flush()
+            save_testcases(point_id, testcases, writer)
 
-                # 这里将测试用例存入数据库
-                testcases = json.loads(response.choices[0].message.content)
-                logger.debug(f'生成测试用例结果：{testcases}')
-                self.task_status[task_id]['testcases'].extend(testcases['testcases'])
-            return self
-        except Exception as error:
-            logger.error(f"测试用例生成失败: {str(error)}")
-            return 0
+        def run_batch(point_ids: List[str], accepted: set) -> None:
+            writer = self._result_writer(task_id, 'testcases')
+            batch = [points[point_id] for point_id in point_ids]
+            self._generate_batch_testcases(
+                self._requirement_context(task_id, batch),
+                batch,
+                batch_results(point_ids, accepted, 'testcases',
+                              lambda point_id, testcases: save_testcases(point_id, testcases, writer))
+            )
+
+        batches = self._pack(pending, lambda point_id: estimate_tokens(self._point_scope(points[point_id])))
+        failures = self._run_batches(
+            task_id, 'testcase', batches, prepare, run_batch, run_single,
+            label='测试用例生成中', done=total - len(pending), total=total, start=start, end=end
+        )
+        for point_id, error in failures.items():
+            logger.error(f"测试点 {point_id} 测试用例生成失败: {str(error)}")
+        status['failed_points'] = [point_id for point_id in pending if point_id in failures]
+        status['duplicates'] = dedup.duplicates if dedup else 0
+        if status['duplicates']:
+            logger.info(f"任务 {task_id} 发现 {status['duplicates']} 条近似重复的测试用例（{TESTCASE_DEDUP['mode']}）")
+        return self
+
+    @staticmethod
+    def _testcase_deduplicator(task_id: str, completed) -> Optional[TestcaseDeduplicator]:
+        """
+        创建本任务的用例去重索引；续跑时先登记已完成测试点落库的非重复用例，
+        未完成测试点的遗留用例会在重跑前清理，不参与比对
+        """
+        if not TESTCASE_DEDUP['enabled']:
+            return None
+        dedup = TestcaseDeduplicator(TESTCASE_DEDUP['threshold'], TESTCASE_DEDUP['num_perm'], TESTCASE_DEDUP['shingle_size'])
+        if completed:
+            with MysqlRepository() as db:
+                for row in db.stream('testcases', columns=['case_id', 'point_id', 'case_name', 'test_steps',
+                                                           'expected_result', 'duplicate_of'],
+                                     where={'task_id': task_id}, order_by=['created_at']):
+                    if row['point_id'] in completed and not row['duplicate_of']:
+                        dedup.add(row['case_id'], row)
+        return dedup
 
-    def init_task(self, task_type: str, task_id: str, require_id: str = None) -> Dict:
-        """初始化任务记录"""
+    def init_task(self, task_type: str, task_id: str, require_id: str = None, payload: Dict = None) -> Dict:
+        """
+        初始化任务记录，任务以 pending 状态入队，由工作进程领取执行
+        :param payload: 执行任务所需的参数（如 point_ids、no_cache）
+        """
         # 初始化内存中的任务状态
         self.task_status[task_id] = {}
         
         with MysqlRepository() as db:
-            db.create('tasks', {
+            created = db.create('tasks', {
                 'task_id': task_id,
                 'require_id': require_id,
                 'task_type': task_type,
+                'priority': requirement_priority(require_id),
                 'status': 'pending',
                 'progress': 0,
                 'message': '等待开始',
+                'payload': payload or {},
                 'start_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             })
+        if created:
+            # 增量维护任务列表的缓存总数
+            MysqlRepository.bump_count('tasks')
+            event_bus.publish(task_id, 'status', {
+                'require_id': require_id,
+                'task_type': task_type,
+                'status': 'pending',
+                'progress': 0,
+                'message': '等待开始'
+            })
         return self.get_task_status(task_id)
 
     def update_task_status(self, task_id: str, **kwargs) -> Dict:
-        """通用状态更新方法"""
+        """通用状态更新方法，返回本次更新的字段"""
         update_data = {'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         
         # 特殊字段处理
-        if 'status' in kwargs and kwargs['status'] == 'completed':
+        if kwargs.get('status') in TERMINAL_STATUSES:
             update_data['end_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         update_data.update(kwargs)
         
+        # 已取消的任务只接受取消收尾的更新，防止流水线把状态覆盖回处理中/已完成
+        where = {'task_id': task_id}
+        if kwargs.get('status') != 'cancelled':
+            where['status__ne'] = 'cancelled'
         with MysqlRepository() as db:
-            db.update(
+            affected = db.update(
                 table='tasks',
                 update_data=update_data,
-                where={'task_id': task_id}
+                where=where
             )
-        return self.get_task_status(task_id)
+        if not affected:
+            return {'task_id': task_id, **update_data}
+        
+        # 推送给进度订阅者，不再回查数据库
+        event = dict(update_data)
+        if isinstance(event.get('result'), str):
+            try:
+                event['result'] = json.loads(event['result'])
+            except json.JSONDecodeError:
+                pass
+        event_bus.publish(task_id, 'status', event)
+        return {'task_id': task_id, **event}
     
     def get_task_status(self, task_id: str) -> Optional[Dict]:
         """获取完整任务状态"""
@@ -339,110 +1082,81 @@ class TaskService():
             
             task = tasks[0]
             # 处理JSON字段
-            if task.get('result'):
-                try:
-                    task['result'] = json.loads(task['result'])
-                except json.JSONDecodeError:
-                    task['result'] = None
+            for field in ('result', 'payload'):
+                if task.get(field):
+                    try:
+                        task[field] = json.loads(task[field])
+                    except json.JSONDecodeError:
+                        task[field] = None
             return task
 
+    def finish_cancelled(self, task_id: str, task_type: str) -> None:
+        """任务取消后的收尾：按取消请求保留或清理已落库的部分结果"""
+        task = self.get_task_status(task_id) or {}
+        keep_partial = (task.get('payload') or {}).get('keep_partial', True)
+        table = RESULT_TABLES[task_type]
+        with MysqlRepository() as db:
+            if keep_partial:
+                kept, removed = db.count(table, where={'task_id': task_id}), 0
+            else:
+                kept, removed = 0, db.delete(table, where={'task_id': task_id})
+        if not keep_partial:
+            # 结果已清理，检查点随之失效
+            self.checkpoints.clear(task_id)
+        logger.info(f"任务 {task_id} 已取消，保留 {kept} 条、清理 {removed} 条 {table}")
+        self.update_task_status(
+            task_id,
+            status='cancelled',
+            message=f"任务已取消，保留 {kept} 条已生成结果" if keep_partial else f"任务已取消，已清理 {removed} 条已生成结果",
+            result=json.dumps({'kept': kept, 'removed': removed, 'require_id': task.get('require_id')})
+        )
+
     def finalize_point_task(self, task_id: str, require_id: str) -> None:
-        """完成处理任务"""
-        logger.info(f"最终数据是：{self.task_status[task_id]}")
-        
+        """完成处理任务：功能点已在提取过程中分批落库，这里只补存遗漏的功能点"""
         # 1. 准备扁平化数据
         flatten = []
-        for chunk in self.task_status[task_id]['chunks']:   
-            # 遍历每个point
-            for point in chunk['points']:
-                raw = {
-                    'task_id': task_id,
-                    'require_id': require_id,
-                    'module': chunk['module'],
-                    'chunks': chunk['chunks'],
-                    'business_domain': chunk['business_domain'],
-                    **point,
-                }
-                point_id = get_husky_id('POINT')
-                flatten.append({'point_id': point_id, **raw})
+        for index, chunk in enumerate(self.task_status[task_id]['chunks']):
+            # 遍历每个尚未落库的point
+            for point in chunk.get('points', []):
+                if 'point_id' not in point:
+                    flatten.append(self._point_row(task_id, require_id, chunk, point, index))
         
         # 2. 批量更新插入
-        with MysqlRepository() as db:
-            for point_data in flatten:
-                # 构建ON DUPLICATE KEY UPDATE语句
-                with db.connection.cursor() as cursor:
-                    # 转义列名
-                    columns = ', '.join([f'`{k}`' for k in point_data.keys()])
-                    placeholders = ', '.join(['%s'] * len(point_data))
-                    
-                    # 构建UPDATE部分
-                    update_set = ', '.join([f'`{k}` = VALUES(`{k}`)' for k in point_data.keys()])
-                    
-                    sql = f"""
-                    INSERT INTO `points` ({columns})
-                    VALUES ({placeholders})
-                    ON DUPLICATE KEY UPDATE {update_set}
-                    """
-                    
-                    # 准备值（处理JSON字段）
-                    values = []
-                    for v in point_data.values():
-                        if isinstance(v, (list, dict)):
-                            values.append(json.dumps(v, ensure_ascii=False))
-                        else:
-                            values.append(v)
-                    
-                    logger.debug(f"执行SQL: {sql}")
-                    logger.debug(f"参数: {values}")
-                    
-                    cursor.execute(sql, tuple(values))
-            
-            db.connection.commit()
+        if flatten:
+            with MysqlRepository() as db:
+                db.bulk_upsert('points', flatten)
         
-        logger.info(f"任务 {task_id} 处理完成，共处理 {len(flatten)} 条记录")
+        logger.info(f"任务 {task_id} 处理完成，补存 {len(flatten)} 条记录")
     
     
-    def finalize_testcase_task(self, task_id: str, require_id: str) -> None:
-        """完成处理任务"""
-        logger.info(f"最终用例数据是：{self.task_status[task_id]}")
-        
-        for testcase in self.task_status[task_id]['testcases']:
-            case_id = get_husky_id('CASE')
-            testcase.setdefault('case_id', case_id)
-            testcase.setdefault('task_id', task_id)
-            testcase.setdefault('require_id', require_id)
+    @staticmethod
+    def _fill_testcase(task_id: str, require_id: str, testcase: Dict, point_id: Optional[str] = None) -> Dict:
+        """补全测试用例的主键与关联字段"""
+        testcase.setdefault('case_id', get_husky_id('CASE'))
+        testcase.setdefault('task_id', task_id)
+        testcase.setdefault('require_id', require_id)
+        if point_id:
+            testcase.setdefault('point_id', point_id)
+        return testcase
+
+    def save_testcases(self, task_id: str, require_id: str, testcases: List[Dict]) -> int:
+        """补全主键与关联字段后批量落库"""
+        for testcase in testcases:
+            self._fill_testcase(task_id, require_id, testcase)
         
-            with MysqlRepository() as db:
-                # 构建ON DUPLICATE KEY UPDATE语句
-                with db.connection.cursor() as cursor:
-                    # 转义列名
-                    columns = ', '.join([f'`{k}`' for k in testcase.keys()])
-                    placeholders = ', '.join(['%s'] * len(testcase))
-                    
-                    # 构建UPDATE部分
-                    update_set = ', '.join([f'`{k}` = VALUES(`{k}`)' for k in testcase.keys()])
-                    
-                    sql = f"""
-                    INSERT INTO `testcases` ({columns})
-                    VALUES ({placeholders})
-                    ON DUPLICATE KEY UPDATE {update_set}
-                    """
-                    
-                    # 准备值（处理JSON字段）
-                    values = []
-                    for v in testcase.values():
-                        if isinstance(v, (list, dict)):
-                            values.append(json.dumps(v, ensure_ascii=False))
-                        else:
-                            values.append(v)
-                    
-                    logger.debug(f"执行SQL: {sql}")
-                    logger.debug(f"参数: {values}")
-                    
-                    cursor.execute(sql, tuple(values))
-                    db.connection.commit()
+        # 批量更新插入，同一连接内按批提交
+        with MysqlRepository() as db:
+            db.bulk_upsert('testcases', testcases)
+        return len(testcases)
+
+    def finalize_testcase_task(self, task_id: str, require_id: str) -> None:
+        """完成处理任务：测试用例已按测试点增量落库，这里只补存遗漏的用例"""
+        testcases = self.task_status[task_id]['testcases']
+        pending = [testcase for testcase in testcases if 'case_id' not in testcase]
+        if pending:
+            self.save_testcases(task_id, require_id, pending)
         
-        logger.info(f"任务 {task_id} 处理完成，共处理 {len(self.task_status[task_id]['testcases'])} 条记录")
+        logger.info(f"任务 {task_id} 处理完成，共处理 {len(testcases)} 条记录，失败测试点: {self.task_status[task_id]['failed_points']}")
 
 
     def get_task_points(self, task_id: str) -> List[Dict]:
@@ -1,10 +1,10 @@
-import os
-import json
 from loguru import logger
-from openai import OpenAI
 from dotenv import load_dotenv
 from playwright.sync_api import sync_playwright
 
+from husky.services.llm_gateway import get_llm_gateway
+from husky.services.llm_schema import SchemaError, parse_response
+
 load_dotenv()
 
 logger.add("test_automation.log", rotation="10 MB", retention="7 days")
@@ -35,33 +35,28 @@ PROMPT_TEMPLATE = """将自然语言测试用例转换为标准JSON格式，必
 class TestAutomationService:
 
     def __init__(self):
-        self.client = OpenAI(
-            api_key=os.getenv("API_KEY"),
-            base_url="https://api.deepseek.com",
-            timeout=30
-        )
+        self.gateway = get_llm_gateway()
         
     def nl_to_script(self, nl_case):
         try:
             logger.info("开始转换自然语言测试用例", input=nl_case)
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
+            content = self.gateway.chat(
                 messages=[{"role": "user", "content": PROMPT_TEMPLATE+nl_case}],
                 temperature=0.3,
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                timeout=30,
+                usage={'stage': 'script'}
             )
-            
-            content = response.choices[0].message.content
             logger.debug("收到AI响应", raw_response=content)
             
-            data = json.loads(content)
+            data = parse_response(content, 'steps')
             if not isinstance(data.get("steps"), list):
                 raise ValueError("JSON结构缺少steps数组")
                 
             logger.success("成功转换测试步骤", step_count=len(data["steps"]))
             return data
             
-        except json.JSONDecodeError as e:
+        except SchemaError as e:
             logger.error("JSON解析失败", error=str(e), content=content)
             raise ValueError(f"无效的JSON格式: {str(e)}")
         except Exception as e:
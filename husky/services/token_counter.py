@@ -0,0 +1,34 @@
+import re
+import math
+
+
+# DeepSeek 官方给出的换算：1个中文字符约0.6个token，1个英文字符约0.3个token
+CJK_TOKEN_RATE = 0.6
+OTHER_TOKEN_RATE = 0.3
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数，无需加载分词器"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk - text.count(' ')
+    return math.ceil(cjk * CJK_TOKEN_RATE + max(other, 0) * OTHER_TOKEN_RATE)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """截断文本使其估算token数不超过预算"""
+    if budget <= 0:
+        return ''
+    if estimate_tokens(text) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
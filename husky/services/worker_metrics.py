@@ -0,0 +1,66 @@
+import json
+import time
+
+from typing import Dict, List
+
+from loguru import logger
+
+from husky.repositories.mysql_repository import MysqlRepository
+
+
+def process_metrics() -> Dict:
+    """本进程内的指标：大模型网关、响应缓存、结构校验与数据库连接池"""
+    from husky.services.llm_cache import get_llm_cache
+    from husky.services.llm_gateway import get_llm_gateway
+    from husky.services.llm_schema import schema_stats
+    cache = get_llm_cache()
+    return {
+        'mysql_pool': MysqlRepository.pool_stats(),
+        'llm_cache': cache.stats() if cache else None,
+        'llm_gateway': get_llm_gateway().stats(),
+        'llm_schema': schema_stats.snapshot()
+    }
+
+
+class WorkerMetricsStore:
+    """
+    工作进程指标快照（表结构见 sql/worker_metrics.sql）
+    大模型调用都在工作进程中执行，其进程内计数对Web进程不可见；
+    工作进程定时上报快照，/metrics 汇总仍在上报的工作进程
+    """
+
+    TABLE = 'worker_metrics'
+
+    def publish(self, worker_id: str, running: int = 0) -> None:
+        """上报本进程的指标快照，写入失败不影响任务执行"""
+        try:
+            with MysqlRepository() as db:
+                db.bulk_upsert(self.TABLE, [{
+                    'worker_id': worker_id,
+                    'metrics': process_metrics(),
+                    'running': running,
+                    'reported_at': time.time()
+                }])
+        except Exception as e:
+            logger.warning(f"上报工作进程 {worker_id} 指标失败: {e}")
+
+    def remove(self, worker_id: str) -> None:
+        """工作进程退出时删除其快照"""
+        try:
+            with MysqlRepository() as db:
+                db.delete(self.TABLE, where={'worker_id': worker_id})
+        except Exception as e:
+            logger.warning(f"删除工作进程 {worker_id} 指标失败: {e}")
+
+    def active(self, max_age: float) -> List[Dict]:
+        """最近 max_age 秒内上报过的工作进程快照"""
+        with MysqlRepository() as db:
+            rows = db.search(
+                self.TABLE,
+                where={'reported_at__gte': time.time() - max_age},
+                order_by=['worker_id']
+            )
+        for row in rows:
+            if isinstance(row.get('metrics'), str):
+                row['metrics'] = json.loads(row['metrics'])
+        return rows
@@ -1,5 +1,7 @@
-
+import re
+import json
 import uuid
+import hashlib
 import random
 import pymysql
 import os
@@ -66,3 +68,64 @@ def get_husky_id(prefix=None):
     magic = random.randint(10000, 99999)
     id = f"{prefix}-{str(uuid.uuid4())[:8].upper()}-{magic}"
     return id
+
+
+def parse_pagination(data: dict, default_size: int = 20, max_size: int = 200):
+    """
+    解析分页参数，未传 page/size 时返回 (None, None) 表示不分页；参数不是正整数时抛出 ValueError
+    """
+    if 'page' not in data and 'size' not in data:
+        return None, None
+    try:
+        page = int(data.get('page') or 1)
+        size = int(data.get('size') or default_size)
+    except (TypeError, ValueError):
+        raise ValueError('page and size must be integers')
+    if page < 1 or size < 1:
+        raise ValueError('page and size must be positive')
+    return page, min(size, max_size)
+
+
+def parse_bool(value, default: bool = False) -> bool:
+    """
+    解析布尔参数：字符串按 1/true/yes 解析（"false"、"0" 为假），None 时返回默认值，其它类型按真值判断
+    """
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def parse_fields(fields, allowed: list) -> list:
+    """
+    解析字段投影参数（列表或逗号分隔字符串），只保留白名单内的列，非字符串的项忽略
+    """
+    if not fields:
+        return []
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    if not isinstance(fields, (list, tuple)):
+        return []
+    selected = [f.strip() for f in fields if isinstance(f, str) and f.strip() in allowed]
+    return list(dict.fromkeys(selected))
+
+
+def decode_json_fields(rows: list, fields: list, default=None) -> list:
+    """
+    将行内JSON字符串字段解码为对象，解析失败时置为默认值
+    """
+    for row in rows:
+        for field in fields:
+            if isinstance(row.get(field), str):
+                try:
+                    row[field] = json.loads(row[field])
+                except json.JSONDecodeError:
+                    row[field] = [] if default is None else default
+    return rows
+
+
+def text_hash(text: str) -> str:
+    """忽略空白差异的文本指纹，PDF重新解析产生的换行/空格变化不影响比对"""
+    normalized = re.sub(r'\s+', '', text or '')
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
@@ -5,8 +5,10 @@ APP_NAME="husky"
 BACKEND_PORT=5000
 FRONTEND_PORT=3000
 BACKEND_PID_FILE="./logs/${APP_NAME}_backend.pid"
+WORKER_PID_FILE="./logs/${APP_NAME}_worker.pid"
 FRONTEND_PID_FILE="./logs/${APP_NAME}_frontend.pid"
 BACKEND_LOG_FILE="./logs/${APP_NAME}_backend.log"
+WORKER_LOG_FILE="./logs/${APP_NAME}_worker.log"
 FRONTEND_LOG_FILE="./logs/${APP_NAME}_frontend.log"
 
 # 函数: 启动后端应用
@@ -30,6 +32,25 @@ start_backend() {
     echo "${APP_NAME}后端应用已启动 (PID: $(cat $BACKEND_PID_FILE))，日志请查看$BACKEND_LOG_FILE"
 }
 
+# 函数: 启动任务工作进程
+start_worker() {
+    if [ -f "$WORKER_PID_FILE" ]; then
+        echo "工作进程已经在运行中 (PID: $(cat $WORKER_PID_FILE))"
+        return 1
+    fi
+
+    echo "正在启动${APP_NAME}工作进程..."
+    cd "$(dirname "$0")"
+
+    if [ -d ".venv" ]; then
+        source .venv/bin/activate
+    fi
+
+    nohup python worker.py > $WORKER_LOG_FILE 2>&1 &
+    echo $! > $WORKER_PID_FILE
+    echo "${APP_NAME}工作进程已启动 (PID: $(cat $WORKER_PID_FILE))，日志请查看$WORKER_LOG_FILE"
+}
+
 # 函数: 启动前端应用
 start_frontend() {
     if [ -f "$FRONTEND_PID_FILE" ]; then
@@ -49,6 +70,7 @@ start_frontend() {
 # 函数: 启动应用
 start() {
     start_backend
+    start_worker
     start_frontend
     echo "${APP_NAME}应用已全部启动完毕"
     echo "后端服务运行在 http://localhost:$BACKEND_PORT"
@@ -74,6 +96,25 @@ stop_backend() {
     fi
 }
 
+# 函数: 停止任务工作进程（SIGTERM后会等待在途任务结束）
+stop_worker() {
+    if [ ! -f "$WORKER_PID_FILE" ]; then
+        echo "工作进程未运行"
+        return 1
+    fi
+
+    echo "正在停止${APP_NAME}工作进程..."
+    PID=$(cat $WORKER_PID_FILE)
+    kill $PID
+    if [ $? -eq 0 ]; then
+        rm -f $WORKER_PID_FILE
+        echo "${APP_NAME}工作进程已停止"
+    else
+        echo "停止${APP_NAME}工作进程失败"
+        return 1
+    fi
+}
+
 # 函数: 停止前端应用
 stop_frontend() {
     if [ ! -f "$FRONTEND_PID_FILE" ]; then
@@ -96,6 +137,7 @@ stop_frontend() {
 # 函数: 停止应用
 stop() {
     stop_backend
+    stop_worker
     stop_frontend
     echo "${APP_NAME}应用已全部停止"
 }
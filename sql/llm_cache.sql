@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS `llm_cache` (
+  `cache_key` CHAR(64) NOT NULL PRIMARY KEY COMMENT '请求内容哈希(model, messages, temperature, response_format)',
+  `model` VARCHAR(64) NOT NULL COMMENT '模型名称',
+  `response` LONGTEXT NOT NULL COMMENT '模型响应内容',
+  `expires_at` DOUBLE NOT NULL COMMENT '过期时间戳',
+  `last_access_at` DOUBLE NOT NULL COMMENT '最近访问时间戳，用于LRU淘汰',
+  INDEX `idx_expires_at` (`expires_at`),
+  INDEX `idx_last_access_at` (`last_access_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='大模型响应缓存表';
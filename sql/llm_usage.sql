@@ -0,0 +1,20 @@
+CREATE TABLE IF NOT EXISTS `llm_usage` (
+  `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  `task_id` VARCHAR(50) COMMENT '所属任务ID，非任务内的调用为空',
+  `require_id` VARCHAR(50) COMMENT '关联需求ID',
+  `stage` VARCHAR(20) COMMENT '调用阶段：chunk/extract/generate/describe/script',
+  `model` VARCHAR(64) NOT NULL COMMENT '模型名称',
+  `status` ENUM('success', 'failed', 'cancelled') NOT NULL DEFAULT 'success',
+  `cache_hit` TINYINT(1) NOT NULL DEFAULT 0 COMMENT '是否命中本地响应缓存（未请求服务商）',
+  `prompt_tokens` INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '输入token数',
+  `completion_tokens` INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '输出token数',
+  `cached_tokens` INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '服务商上下文缓存命中的输入token数',
+  `latency_ms` INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '耗时（含重试与退避）',
+  `retries` TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '重试次数',
+  `error` VARCHAR(500) COMMENT '失败原因',
+  `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  KEY `idx_task_stage` (`task_id`, `stage`),
+  KEY `idx_require_id` (`require_id`),
+  KEY `idx_created_at` (`created_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='大模型调用用量明细表';
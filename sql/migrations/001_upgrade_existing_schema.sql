@@ -0,0 +1,212 @@
+-- 升级已有数据库：补齐任务队列、批量分析、断点续跑、增量分析与用例去重新增的列和索引
+-- 可重复执行：每条变更执行前先查询 information_schema，已存在的列/索引跳过
+-- 用法：mysql -u root -p husky < sql/migrations/001_upgrade_existing_schema.sql
+-- 新增的表（task_units/llm_usage/llm_cache/worker_metrics）使用 CREATE TABLE IF NOT EXISTS，直接执行 sql/ 下对应脚本即可
+
+-- 任务类型与状态新增 batch_analysis 与 cancelled（MODIFY 重复执行结果不变）
+ALTER TABLE `tasks` MODIFY COLUMN `task_type` ENUM('point_analysis', 'testcase_analysis', 'batch_analysis') NOT NULL COMMENT '任务类型，batch_analysis 为批量分析的父任务';
+ALTER TABLE `tasks` MODIFY COLUMN `status` ENUM('pending', 'processing', 'completed', 'failed', 'cancelled') NOT NULL DEFAULT 'pending';
+
+-- 新增列
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND COLUMN_NAME = 'parent_id') = 0,
+  'ALTER TABLE `tasks` ADD COLUMN `parent_id` VARCHAR(50) COMMENT ''所属批量分析父任务ID'' AFTER `task_type`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND COLUMN_NAME = 'priority') = 0,
+  'ALTER TABLE `tasks` ADD COLUMN `priority` TINYINT UNSIGNED NOT NULL DEFAULT 2 COMMENT ''调度优先级，0最高，取自需求优先级P0-P3'' AFTER `parent_id`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND COLUMN_NAME = 'payload') = 0,
+  'ALTER TABLE `tasks` ADD COLUMN `payload` JSON COMMENT ''任务参数，由工作进程读取后执行'' AFTER `result`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND COLUMN_NAME = 'attempts') = 0,
+  'ALTER TABLE `tasks` ADD COLUMN `attempts` TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT ''已领取执行的次数'' AFTER `payload`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND COLUMN_NAME = 'worker_id') = 0,
+  'ALTER TABLE `tasks` ADD COLUMN `worker_id` VARCHAR(100) COMMENT ''持有租约的工作进程'' AFTER `attempts`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND COLUMN_NAME = 'lease_expires_at') = 0,
+  'ALTER TABLE `tasks` ADD COLUMN `lease_expires_at` DATETIME COMMENT ''租约到期时间，过期未续约视为工作进程失联'' AFTER `worker_id`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'points' AND COLUMN_NAME = 'chunk_index') = 0,
+  'ALTER TABLE `points` ADD COLUMN `chunk_index` INT UNSIGNED COMMENT ''所属需求分块序号，用于按分块续跑'' AFTER `chunks`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'points' AND COLUMN_NAME = 'chunk_hash') = 0,
+  'ALTER TABLE `points` ADD COLUMN `chunk_hash` CHAR(64) COMMENT ''所属需求分块的内容指纹，用于需求修订后的增量分析'' AFTER `chunk_index`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'points' AND COLUMN_NAME = 'carried_from') = 0,
+  'ALTER TABLE `points` ADD COLUMN `carried_from` VARCHAR(50) COMMENT ''增量分析时沿用的上一版功能点ID'' AFTER `chunk_hash`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'points' AND COLUMN_NAME = 'stale') = 0,
+  'ALTER TABLE `points` ADD COLUMN `stale` TINYINT(1) NOT NULL DEFAULT 0 COMMENT ''所属模块已在新版需求中删除'' AFTER `carried_from`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'testcases' AND COLUMN_NAME = 'point_id') = 0,
+  'ALTER TABLE `testcases` ADD COLUMN `point_id` VARCHAR(50) COMMENT ''来源测试点ID，用于按测试点续跑'' AFTER `require_id`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'testcases' AND COLUMN_NAME = 'duplicate_of') = 0,
+  'ALTER TABLE `testcases` ADD COLUMN `duplicate_of` VARCHAR(50) COMMENT ''近似重复的用例ID，为空表示非重复'' AFTER `test_type`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 列组成变化的索引：旧版 idx_task_id 只有 task_id，先删除再按新定义重建
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'points' AND INDEX_NAME = 'idx_task_id') = 1,
+  'ALTER TABLE `points` DROP INDEX `idx_task_id`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 旧版的单列状态索引已被 idx_status_created_at 取代
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND INDEX_NAME = 'idx_status') > 0,
+  'ALTER TABLE `tasks` DROP INDEX `idx_status`',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- 新增索引
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND INDEX_NAME = 'idx_status_created_at') = 0,
+  'ALTER TABLE `tasks` ADD INDEX `idx_status_created_at` (`status`, `created_at`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND INDEX_NAME = 'idx_status_priority') = 0,
+  'ALTER TABLE `tasks` ADD INDEX `idx_status_priority` (`status`, `priority`, `created_at`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND INDEX_NAME = 'idx_parent_status') = 0,
+  'ALTER TABLE `tasks` ADD INDEX `idx_parent_status` (`parent_id`, `status`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND INDEX_NAME = 'idx_status_lease') = 0,
+  'ALTER TABLE `tasks` ADD INDEX `idx_status_lease` (`status`, `lease_expires_at`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND INDEX_NAME = 'idx_created_at_task_id') = 0,
+  'ALTER TABLE `tasks` ADD INDEX `idx_created_at_task_id` (`created_at`, `task_id`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tasks' AND INDEX_NAME = 'idx_updated_at_task_id') = 0,
+  'ALTER TABLE `tasks` ADD INDEX `idx_updated_at_task_id` (`updated_at`, `task_id`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'points' AND INDEX_NAME = 'idx_task_id') = 0,
+  'ALTER TABLE `points` ADD INDEX `idx_task_id` (`task_id`, `created_at`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'points' AND INDEX_NAME = 'idx_task_chunk') = 0,
+  'ALTER TABLE `points` ADD INDEX `idx_task_chunk` (`task_id`, `chunk_index`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'points' AND INDEX_NAME = 'idx_require_id') = 0,
+  'ALTER TABLE `points` ADD INDEX `idx_require_id` (`require_id`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'testcases' AND INDEX_NAME = 'idx_task_id') = 0,
+  'ALTER TABLE `testcases` ADD INDEX `idx_task_id` (`task_id`, `created_at`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'testcases' AND INDEX_NAME = 'idx_require_id') = 0,
+  'ALTER TABLE `testcases` ADD INDEX `idx_require_id` (`require_id`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'testcases' AND INDEX_NAME = 'idx_task_point') = 0,
+  'ALTER TABLE `testcases` ADD INDEX `idx_task_point` (`task_id`, `point_id`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'requirements' AND INDEX_NAME = 'idx_deleted_created_at') = 0,
+  'ALTER TABLE `requirements` ADD INDEX `idx_deleted_created_at` (`is_deleted`, `created_at`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF((SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'requirements' AND INDEX_NAME = 'idx_domain_module') = 0,
+  'ALTER TABLE `requirements` ADD INDEX `idx_domain_module` (`business_domain`, `module`)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
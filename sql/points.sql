@@ -8,9 +8,15 @@ CREATE TABLE points (
     module VARCHAR(100) NOT NULL,
     business_domain VARCHAR(100) NOT NULL,
     chunks TEXT NOT NULL,
+    chunk_index INT UNSIGNED COMMENT '所属需求分块序号，用于按分块续跑',
+    chunk_hash CHAR(64) COMMENT '所属需求分块的内容指纹，用于需求修订后的增量分析',
+    carried_from VARCHAR(50) COMMENT '增量分析时沿用的上一版功能点ID',
+    stale TINYINT(1) NOT NULL DEFAULT 0 COMMENT '所属模块已在新版需求中删除',
     preconditions JSON NOT NULL COMMENT '预条件数组，存储为JSON格式',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    INDEX idx_task_id (task_id),
+    INDEX idx_task_id (task_id, created_at),
+    INDEX idx_task_chunk (task_id, chunk_index),
+    INDEX idx_require_id (require_id),
     INDEX idx_function_name (function_name)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='功能点明细表';
\ No newline at end of file
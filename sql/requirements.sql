@@ -15,5 +15,7 @@ CREATE TABLE `requirements` (
   `created_at` timestamp DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
   `updated_at` timestamp DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
   PRIMARY KEY (`require_id`),
-  UNIQUE KEY `idx_require_id` (`require_id`)
+  UNIQUE KEY `idx_require_id` (`require_id`),
+  KEY `idx_deleted_created_at` (`is_deleted`, `created_at`),
+  KEY `idx_domain_module` (`business_domain`, `module`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='需求主表';
\ No newline at end of file
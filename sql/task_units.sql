@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS `task_units` (
+  `task_id` VARCHAR(50) NOT NULL COMMENT '任务ID',
+  `stage` VARCHAR(20) NOT NULL COMMENT '流水线阶段：chunk/extract/testcase',
+  `unit_key` VARCHAR(64) NOT NULL COMMENT '工作单元标识：分块序号或测试点ID',
+  `status` ENUM('running', 'completed', 'failed') NOT NULL DEFAULT 'running',
+  `attempts` INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '执行次数',
+  `output` JSON COMMENT '单元产出（如需求分块结果、生成数量）',
+  `error` TEXT COMMENT '最近一次失败原因',
+  `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`task_id`, `stage`, `unit_key`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='任务工作单元检查点表';
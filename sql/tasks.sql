@@ -1,16 +1,27 @@
 CREATE TABLE `tasks` (
   `task_id` VARCHAR(50) NOT NULL PRIMARY KEY COMMENT '任务唯一ID',
   `require_id` VARCHAR(50) COMMENT '关联需求ID',
-  `task_type` ENUM('point_analysis', 'testcase_analysis') NOT NULL COMMENT '任务类型',
-  `status` ENUM('pending', 'processing', 'completed', 'failed') NOT NULL DEFAULT 'pending',
+  `task_type` ENUM('point_analysis', 'testcase_analysis', 'batch_analysis') NOT NULL COMMENT '任务类型，batch_analysis 为批量分析的父任务',
+  `parent_id` VARCHAR(50) COMMENT '所属批量分析父任务ID',
+  `priority` TINYINT UNSIGNED NOT NULL DEFAULT 2 COMMENT '调度优先级，0最高，取自需求优先级P0-P3',
+  `status` ENUM('pending', 'processing', 'completed', 'failed', 'cancelled') NOT NULL DEFAULT 'pending',
   `progress` TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '进度百分比(0-100)',
   `message` TEXT COMMENT '当前状态信息',
   `result` JSON COMMENT '最终结果数据',
+  `payload` JSON COMMENT '任务参数，由工作进程读取后执行',
+  `attempts` TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '已领取执行的次数',
+  `worker_id` VARCHAR(100) COMMENT '持有租约的工作进程',
+  `lease_expires_at` DATETIME COMMENT '租约到期时间，过期未续约视为工作进程失联',
   `start_time` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '任务开始时间',
   `end_time` DATETIME COMMENT '任务结束时间',
   `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
   INDEX `idx_require_id` (`require_id`),
-  INDEX `idx_status` (`status`),
+  INDEX `idx_status_created_at` (`status`, `created_at`),
+  INDEX `idx_status_priority` (`status`, `priority`, `created_at`),
+  INDEX `idx_parent_status` (`parent_id`, `status`),
+  INDEX `idx_status_lease` (`status`, `lease_expires_at`),
+  INDEX `idx_created_at_task_id` (`created_at`, `task_id`),
+  INDEX `idx_updated_at_task_id` (`updated_at`, `task_id`),
   FOREIGN KEY (`require_id`) REFERENCES `requirements`(`require_id`) ON DELETE SET NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='异步任务状态表';
\ No newline at end of file
@@ -2,17 +2,22 @@ CREATE TABLE testcases (
     `case_id` VARCHAR(50) NOT NULL PRIMARY KEY COMMENT '测试用例唯一标识符',
     `task_id` VARCHAR(50) NOT NULL COMMENT '任务ID，每次创建用例生成唯一任务ID',
     `require_id` VARCHAR(50) NOT NULL COMMENT '需求ID',
+    `point_id` VARCHAR(50) COMMENT '来源测试点ID，用于按测试点续跑',
     `case_name` VARCHAR(255) NOT NULL COMMENT '测试用例名称',
     `preconditions` JSON COMMENT '前置条件(JSON数组)',
     `test_steps` JSON NOT NULL COMMENT '测试步骤(JSON数组)',
     `expected_result` JSON NOT NULL COMMENT '预期结果(JSON数组)',
     `priority` VARCHAR(10) NOT NULL COMMENT '优先级(P0-P3)',
     `test_type` JSON COMMENT '测试类型(JSON数组)',
+    `duplicate_of` VARCHAR(50) COMMENT '近似重复的用例ID，为空表示非重复',
     `create` BOOLEAN DEFAULT 0 COMMENT '是否手工添加',
     `modify` BOOLEAN DEFAULT 0 COMMENT '是否修改',
     `accept` BOOLEAN DEFAULT 0 COMMENT '是否验收',
     `review` BOOLEAN DEFAULT 0 COMMENT '是否评审',
     `verify` BOOLEAN DEFAULT 0 COMMENT '是否验证',
     `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
-    `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '最后修改时间'
+    `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '最后修改时间',
+    INDEX `idx_task_id` (`task_id`, `created_at`),
+    INDEX `idx_require_id` (`require_id`),
+    INDEX `idx_task_point` (`task_id`, `point_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
\ No newline at end of file
@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS `worker_metrics` (
+  `worker_id` VARCHAR(100) NOT NULL COMMENT '工作进程标识（主机名-进程号）',
+  `metrics` JSON COMMENT '进程内指标快照：大模型网关、响应缓存、结构校验与连接池',
+  `running` INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '在途任务数',
+  `reported_at` DOUBLE NOT NULL COMMENT '上报时间戳',
+  PRIMARY KEY (`worker_id`),
+  INDEX `idx_reported_at` (`reported_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='工作进程指标快照表';
@@ -0,0 +1,83 @@
+import pymysql
+import pytest
+
+from husky.repositories.mysql_repository import MysqlRepository
+from husky.services import batch_service
+from husky.services.batch_service import BatchService
+
+
+class RecordingCursor:
+    """记录执行的语句，第 fail_at 条语句抛出数据库错误"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params=()):
+        self.connection.statements.append(sql)
+        if len(self.connection.statements) == self.connection.fail_at:
+            raise pymysql.err.OperationalError(2013, 'Lost connection')
+        self.rowcount = 1
+
+
+class RecordingConnection:
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def repository(monkeypatch):
+    connection = RecordingConnection()
+
+    class Repository(MysqlRepository):
+        def __init__(self):
+            self.connection = connection
+
+        def __exit__(self, *args):
+            return False
+
+        def search(self, table, **kwargs):
+            return [{'require_id': require_id, 'priority': 'P1', 'text_length': 1000}
+                    for require_id in kwargs['where']['require_id']]
+
+    monkeypatch.setattr(batch_service, 'MysqlRepository', Repository)
+    monkeypatch.setattr(MysqlRepository, 'bump_count', staticmethod(lambda *args: None))
+    monkeypatch.setattr(batch_service.event_bus, 'publish', lambda *args, **kwargs: None)
+    return connection
+
+
+def test_submit_writes_parent_and_children_in_one_transaction(repository):
+    result = BatchService().submit('point_analysis', [{'require_id': 'R1'}, {'require_id': 'R2'}], {})
+
+    assert len(result['children']) == 2
+    # 父任务与子任务列结构不同，分两条语句写入，只提交一次
+    assert len(repository.statements) == 2
+    assert repository.commits == 1
+
+
+def test_submit_rolls_back_parent_when_children_fail(repository):
+    repository.fail_at = 2
+
+    with pytest.raises(pymysql.Error):
+        BatchService().submit('point_analysis', [{'require_id': 'R1'}, {'require_id': 'R2'}], {})
+
+    assert repository.commits == 0
+    assert repository.rollbacks == 1
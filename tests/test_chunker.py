@@ -0,0 +1,45 @@
+from husky.services.chunker import reconcile_labels, split_sections, window_sections
+
+
+def test_split_sections_covers_text_and_breaks_on_headings():
+    body = '正文内容。' * 100
+    text = f"1. 用户登录\n{body}\n2. 订单管理\n{body}\n"
+    sections = split_sections(text, max_tokens=3000, min_tokens=10)
+    assert [section['heading'] for section in sections] == ['1. 用户登录', '2. 订单管理']
+    assert sections[0]['start'] == 0 and sections[-1]['end'] == len(text)
+    assert all(left['end'] == right['start'] for left, right in zip(sections, sections[1:]))
+
+
+def test_split_sections_splits_oversized_section():
+    text = '\n\n'.join('段落内容。' * 50 for _ in range(6))
+    sections = split_sections(text, max_tokens=200, min_tokens=0)
+    assert len(sections) > 1
+    assert ''.join(text[section['start']:section['end']] for section in sections) == text
+
+
+def test_split_sections_merges_small_sections():
+    text = '1. 用户登录\n短\n2. 订单管理\n短\n'
+    assert len(split_sections(text, max_tokens=3000, min_tokens=200)) == 1
+
+
+def test_split_sections_empty_text():
+    assert split_sections('   \n') == []
+
+
+def test_window_sections_respects_budget_and_overlaps():
+    windows = window_sections([40, 40, 40, 40, 40], window_tokens=100, overlap_tokens=40)
+    assert windows == [[0, 1], [1, 2], [2, 3], [3, 4]]
+
+
+def test_window_sections_oversized_section_gets_own_window():
+    assert window_sections([500, 10], window_tokens=100, overlap_tokens=0) == [[0], [1]]
+
+
+def test_reconcile_labels_renames_to_previous_window():
+    windows = [[0, 1], [1, 2]]
+    results = [
+        {0: {'module': '登录'}, 1: {'module': '订单'}},
+        {1: {'module': '订单管理'}, 2: {'module': '订单管理'}},
+    ]
+    labels = reconcile_labels(windows, results)
+    assert labels == {0: ('登录', ''), 1: ('订单', ''), 2: ('订单', '')}
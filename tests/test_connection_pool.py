@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from husky.repositories import connection_pool
+from husky.repositories.connection_pool import ConnectionPool, PoolTimeoutError, pool_options
+
+
+class FakeConnection:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = ConnectionPool(max_size=1, timeout=0.5, wait_warning=0.05)
+    monkeypatch.setattr(pool, '_connect', lambda: connection_pool._PooledConnection(FakeConnection()))
+    return pool
+
+
+def test_pool_size_follows_worker_and_thread_counts(monkeypatch):
+    monkeypatch.setitem(connection_pool.MYSQL_POOL, 'max_size', None)
+    monkeypatch.setitem(connection_pool.TASK_QUEUE, 'workers', 4)
+    monkeypatch.setattr(connection_pool, 'LLM_MAX_WORKERS', 5)
+
+    options = pool_options()
+
+    # 4个任务线程 × (1 + 5个大模型调用线程) × 每线程2个连接 + 预留10个
+    assert options['max_size'] == 4 * 6 * 2 + 10
+    assert 'reserve' not in options and 'connections_per_thread' not in options
+
+
+def test_configured_pool_size_is_kept(monkeypatch):
+    monkeypatch.setitem(connection_pool.MYSQL_POOL, 'max_size', 30)
+    assert pool_options()['max_size'] == 30
+
+
+def test_slow_acquire_is_logged(pool, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(connection_pool.logger, 'warning', warnings.append)
+    held = pool.acquire()
+    threading.Timer(0.1, pool.release, args=(held,)).start()
+
+    pool.release(pool.acquire())
+
+    assert len(warnings) == 1 and '等待数据库连接' in warnings[0]
+    assert pool.stats()['wait_time_max'] >= 0.05
+
+
+def test_acquire_timeout_is_logged(pool, monkeypatch):
+    errors = []
+    monkeypatch.setattr(connection_pool.logger, 'error', errors.append)
+    pool.acquire()
+    started = time.monotonic()
+
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+
+    assert time.monotonic() - started >= 0.5
+    assert errors and '使用中 1/1' in errors[0]
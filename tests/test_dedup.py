@@ -0,0 +1,32 @@
+# 别名避免 pytest 把以 Test 开头的类当作测试类收集
+from husky.services.dedup import TestcaseDeduplicator as Deduplicator, normalize_text
+
+
+def _case(name, steps, expected):
+    return {'case_name': name, 'test_steps': steps, 'expected_result': expected}
+
+
+def test_normalize_text_ignores_numbering_and_punctuation():
+    assert normalize_text('["1. 打开页面", "2、点击登录"]') == normalize_text('打开页面，点击登录')
+
+
+def test_exact_duplicate_after_normalization():
+    deduplicator = Deduplicator()
+    assert deduplicator.add('A', _case('登录成功', ['1. 输入账号', '2. 输入密码'], ['登录成功'])) is None
+    assert deduplicator.add('B', _case('登录成功', ['输入账号；', '输入密码。'], ['登录成功'])) == 'A'
+    assert deduplicator.duplicates == 1
+
+
+def test_near_duplicate_is_detected():
+    deduplicator = Deduplicator()
+    steps = ['打开登录页面', '输入正确的用户名和密码', '点击登录按钮']
+    deduplicator.add('A', _case('使用正确的账号密码登录', steps, ['跳转到首页，显示用户昵称']))
+    duplicate = _case('使用正确账号密码登录', steps, ['跳转到首页，显示用户的昵称'])
+    assert deduplicator.add('B', duplicate) == 'A'
+
+
+def test_distinct_testcases_are_kept():
+    deduplicator = Deduplicator()
+    assert deduplicator.add('A', _case('登录成功', ['输入正确的账号密码', '点击登录'], ['进入首页'])) is None
+    assert deduplicator.add('B', _case('订单退款', ['打开已支付订单', '申请退款'], ['退款状态为处理中'])) is None
+    assert deduplicator.duplicates == 0
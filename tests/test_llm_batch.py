@@ -0,0 +1,47 @@
+import pytest
+
+from husky.services.cancellation import TaskCancelled
+from husky.services.llm_batch import pack_batches, run_with_split
+
+
+def test_pack_batches_respects_budget_and_item_limit():
+    assert pack_batches([3, 3, 3, 10, 1], cost=lambda unit: unit, budget=7, max_items=5) == [[3, 3], [3], [10], [1]]
+    assert pack_batches([1] * 5, cost=lambda unit: unit, budget=100, max_items=2) == [[1, 1], [1, 1], [1]]
+
+
+def test_run_with_split_empty():
+    assert run_with_split([], lambda ids, accepted: None, lambda unit_id: None) == {}
+
+
+def test_run_with_split_retries_missing_units():
+    batches, singles = [], []
+
+    def run_batch(ids, accepted):
+        batches.append(list(ids))
+        # 批量响应只返回第一个单元的结果
+        accepted.add(ids[0])
+
+    results = run_with_split(['a', 'b', 'c', 'd'], run_batch, singles.append)
+    assert results == {}
+    assert batches == [['a', 'b', 'c', 'd'], ['b', 'c']]
+    assert singles == ['c', 'd']
+
+
+def test_run_with_split_reports_failed_units():
+    def run_batch(ids, accepted):
+        raise ValueError('响应被截断')
+
+    def run_single(unit_id):
+        if unit_id == 'b':
+            raise ValueError('解析失败')
+
+    failures = run_with_split(['a', 'b'], run_batch, run_single)
+    assert list(failures) == ['b']
+
+
+def test_run_with_split_propagates_cancellation():
+    def run_batch(ids, accepted):
+        raise TaskCancelled('T1')
+
+    with pytest.raises(TaskCancelled):
+        run_with_split(['a', 'b'], run_batch, lambda unit_id: None)
@@ -0,0 +1,27 @@
+import pytest
+
+from husky.services.llm_cache import _is_cacheable
+
+JSON_OBJECT = {'type': 'json_object'}
+
+
+@pytest.mark.parametrize('content', [
+    '{"points": []}',
+    '```json\n{"points": [{"name": "登录"}]}\n```',
+    '{"points": [{"name": "登录"},]}',
+])
+def test_repairable_json_is_cacheable(content):
+    assert _is_cacheable(content, JSON_OBJECT)
+
+
+@pytest.mark.parametrize('content', [
+    '没有JSON',
+    # 截断后补齐会丢失内容，不缓存
+    '{"points": [{"name": "登录"}, {"name": "注',
+])
+def test_broken_or_truncated_json_is_not_cacheable(content):
+    assert not _is_cacheable(content, JSON_OBJECT)
+
+
+def test_plain_text_is_always_cacheable():
+    assert _is_cacheable('不是JSON', None)
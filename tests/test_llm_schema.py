@@ -0,0 +1,63 @@
+import pytest
+
+from husky.services.llm_schema import SchemaError, parse_response, repair_json, validate_item
+
+
+def test_repair_json_passes_valid_json_through():
+    assert repair_json('{"points": []}') == ({'points': []}, [])
+
+
+def test_repair_json_strips_fence_and_prefix():
+    value, repairs = repair_json('结果如下：\n```json\n{"a": 1}\n```')
+    assert value == {'a': 1}
+    assert 'fence' in repairs
+
+
+def test_repair_json_removes_trailing_commas():
+    value, repairs = repair_json('{"a": [1, 2,], }')
+    assert value == {'a': [1, 2]}
+    assert 'trailing_comma' in repairs
+
+
+@pytest.mark.parametrize('text, expected', [
+    # 逗号在字符串内，截断位置是完整的字符串值之后
+    ('{"a": "b, c"', {'a': 'b, c'}),
+    ('{"a": "b", "c": "d', {'a': 'b'}),
+    ('{"a": "b", "c"', {'a': 'b'}),
+    ('{"a": "x", "b": true', {'a': 'x', 'b': True}),
+    # 结尾的数字可能不完整，退回到上一个逗号
+    ('{"a": 1, "b": 12', {'a': 1}),
+    ('{"points": [{"x": 1}, {"x": 2', {'points': [{'x': 1}]}),
+    ('["a", "b', ['a']),
+])
+def test_repair_json_closes_truncated_response(text, expected):
+    value, repairs = repair_json(text)
+    assert value == expected
+    assert 'truncated' in repairs
+
+
+@pytest.mark.parametrize('text', ['', '没有JSON', '{"a'])
+def test_repair_json_rejects_unrecoverable_response(text):
+    with pytest.raises(SchemaError):
+        repair_json(text)
+
+
+def test_parse_response_renames_single_array_field():
+    assert parse_response('{"cases": [{"x": 1}]}', 'testcases') == {'testcases': [{'x': 1}]}
+
+
+def test_parse_response_wraps_bare_array():
+    assert parse_response('[{"x": 1}]', 'points') == {'points': [{'x': 1}]}
+
+
+def test_validate_item_normalizes_aliases_and_defaults():
+    item, problems = validate_item('point', {'name': '登录', 'desc': '用户登录', 'precondition': '已注册'})
+    assert problems == []
+    assert item == {'function_name': '登录', 'test_type': '功能', 'description': '用户登录',
+                    'preconditions': ['已注册']}
+
+
+def test_validate_item_rejects_missing_required_field():
+    item, problems = validate_item('testcase', {'case_name': '登录成功'})
+    assert item is None
+    assert problems
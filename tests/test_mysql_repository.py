@@ -0,0 +1,123 @@
+import pytest
+
+from husky.repositories.mysql_repository import MysqlRepository
+
+
+@pytest.fixture
+def repository():
+    # 空条件在访问连接之前就被拒绝，不需要真实的数据库连接
+    db = MysqlRepository.__new__(MysqlRepository)
+    db.connection = None
+    return db
+
+
+@pytest.mark.parametrize('where', [None, {}])
+def test_update_requires_where(repository, where):
+    with pytest.raises(ValueError):
+        repository.update('points', {'stale': 1}, where=where)
+
+
+@pytest.mark.parametrize('where', [None, {}])
+def test_delete_requires_where(repository, where):
+    with pytest.raises(ValueError):
+        repository.delete('points', where=where)
+
+
+def test_build_where_operators():
+    clause, params = MysqlRepository._build_where({'task_id': 'T1', 'point_id': ['a', 'b'], 'stale__ne': None})
+    assert clause == " WHERE `task_id` = %s AND `point_id` IN (%s, %s) AND `stale` IS NOT NULL"
+    assert params == ('T1', 'a', 'b')
+
+
+class RecordingCursor:
+    def __init__(self, executed):
+        self.executed = executed
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params=()):
+        self.executed.append((sql, list(params)))
+        self.rowcount = sql.count('(%s')
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return RecordingCursor(self.executed)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def recording():
+    db = MysqlRepository.__new__(MysqlRepository)
+    db.connection = RecordingConnection()
+    return db
+
+
+def test_bulk_upsert_builds_multi_row_sql(recording):
+    affected = recording.bulk_upsert('points', [
+        {'point_id': 'P1', 'stale': True, 'preconditions': ['已登录']},
+        {'point_id': 'P2', 'stale': False, 'preconditions': []},
+    ], update_columns=['stale'])
+
+    assert affected == 2
+    assert recording.connection.executed == [(
+        "INSERT INTO `points` (`point_id`, `stale`, `preconditions`) VALUES (%s, %s, %s), (%s, %s, %s)"
+        " ON DUPLICATE KEY UPDATE `stale` = VALUES(`stale`)",
+        # 布尔值转整型，列表/字典序列化为JSON
+        ['P1', 1, '["已登录"]', 'P2', 0, '[]']
+    )]
+
+
+def test_bulk_upsert_groups_rows_by_column_set(recording):
+    recording.bulk_upsert('points', [
+        {'point_id': 'P1', 'stale': 0},
+        {'point_id': 'P2', 'module': '登录'},
+        {'point_id': 'P3', 'stale': 1},
+    ])
+
+    statements = [sql for sql, _ in recording.connection.executed]
+    assert statements == [
+        "INSERT INTO `points` (`point_id`, `stale`) VALUES (%s, %s), (%s, %s)"
+        " ON DUPLICATE KEY UPDATE `point_id` = VALUES(`point_id`), `stale` = VALUES(`stale`)",
+        "INSERT INTO `points` (`point_id`, `module`) VALUES (%s, %s)"
+        " ON DUPLICATE KEY UPDATE `point_id` = VALUES(`point_id`), `module` = VALUES(`module`)",
+    ]
+    assert recording.connection.executed[0][1] == ['P1', 0, 'P3', 1]
+
+
+def test_bulk_upsert_chunks_and_commits_per_chunk(recording):
+    rows = [{'point_id': f'P{number}'} for number in range(5)]
+
+    assert recording.bulk_upsert('points', rows, chunk_size=2) == 5
+    assert [sql.count('(%s)') for sql, _ in recording.connection.executed] == [2, 2, 1]
+    assert recording.connection.commits == 3
+
+
+def test_bulk_upsert_without_commit(recording):
+    recording.bulk_upsert('points', [{'point_id': 'P1'}], commit=False)
+    assert recording.connection.commits == 0
+
+
+def test_bulk_upsert_rejects_unknown_update_columns(recording):
+    with pytest.raises(ValueError):
+        recording.bulk_upsert('points', [{'point_id': 'P1', 'stale': 1}], update_columns=['stael'])
+    assert recording.connection.executed == []
+
+
+def test_bulk_upsert_empty(recording):
+    assert recording.bulk_upsert('points', []) == 0
+    assert recording.connection.executed == []
@@ -0,0 +1,168 @@
+import json
+import multiprocessing
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from husky.repositories import mysql_repository
+from husky.repositories.mysql_repository import MysqlRepository
+from husky.services import task_queue
+from husky.services.event_bus import event_bus
+from husky.services.task_queue import StatusBridge
+
+
+class FileRepository:
+    """以JSON文件模拟数据库，工作进程与Web进程通过同一文件共享数据"""
+
+    path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            tables = json.load(f)
+        for rows in tables.values():
+            for row in rows:
+                for column in ('created_at', 'updated_at'):
+                    if row.get(column):
+                        row[column] = datetime.fromisoformat(row[column])
+        return tables
+
+    def _save(self, tables):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(tables, f, ensure_ascii=False, default=lambda value: value.isoformat())
+
+    @staticmethod
+    def _match(row, where):
+        for condition, value in (where or {}).items():
+            column, _, operator = condition.partition('__')
+            if operator == 'gte':
+                if row[column] < value:
+                    return False
+            elif isinstance(value, list) or operator == 'in':
+                if row[column] not in value:
+                    return False
+            elif row[column] != value:
+                return False
+        return True
+
+    def search(self, table, columns=None, where=None, order_by=None, limit=None, offset=None):
+        rows = [row for row in self._load()[table] if self._match(row, where)]
+        for column in reversed(order_by or []):
+            rows.sort(key=lambda row: row[column.lstrip('-')], reverse=column.startswith('-'))
+        rows = rows[:limit] if limit is not None else rows
+        return [{k: v for k, v in row.items() if not columns or k in columns} for row in rows]
+
+    def search_in(self, table, column, values, columns=None, where=None):
+        return self.search(table, columns=columns, where={**(where or {}), f'{column}__in': list(values)})
+
+    def bulk_upsert(self, table, rows, **kwargs):
+        tables = self._load()
+        now = datetime.now().replace(microsecond=0)
+        for row in rows:
+            tables[table].append({**{k: MysqlRepository._to_db_value(v) for k, v in row.items()},
+                                  'created_at': now, 'updated_at': now})
+        self._save(tables)
+        return len(rows)
+
+    def update(self, table, data, where=None):
+        tables = self._load()
+        for row in tables[table]:
+            if self._match(row, where):
+                row.update(data, updated_at=datetime.now().replace(microsecond=0) + timedelta(seconds=1))
+        self._save(tables)
+        return 1
+
+
+def run_worker(path, task_id):
+    """在独立进程中模拟工作进程：边生成边落库功能点，事件只发布到本进程的事件总线，最后更新任务状态"""
+    FileRepository.path = path
+    mysql_repository.MysqlRepository = FileRepository
+    writer = mysql_repository.BatchWriter(
+        'points', batch_size=2,
+        on_flush=lambda rows: event_bus.publish(task_id, 'items', {'type': 'points', 'items': rows})
+    )
+    for number in range(3):
+        writer.add({'point_id': f'P{number}', 'task_id': task_id, 'function_name': f'功能{number}',
+                    'preconditions': ['已登录']})
+    writer.flush()
+    FileRepository().update('tasks', {'status': 'completed', 'progress': 100, 'message': '任务完成'},
+                            where={'task_id': task_id})
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = tmp_path / 'db.json'
+    started = datetime.now().replace(microsecond=0)
+    FileRepository.path = str(path)
+    FileRepository()._save({
+        'tasks': [{'task_id': 'T1', 'task_type': 'point_analysis', 'status': 'processing', 'progress': 30,
+                   'message': '提取功能点', 'result': None, 'updated_at': started}],
+        'points': [{'point_id': 'OLD', 'task_id': 'T1', 'function_name': '订阅前', 'preconditions': '[]',
+                    'created_at': started, 'updated_at': started}]
+    })
+    monkeypatch.setattr(task_queue, 'MysqlRepository', FileRepository)
+    return path
+
+
+def drain(subscription):
+    events = []
+    while True:
+        message = subscription.get(timeout=0.01)
+        if message is None:
+            return events
+        events.append(message)
+
+
+def test_bridge_forwards_items_persisted_by_another_process(database):
+    subscription = event_bus.subscribe('T1')
+    try:
+        bridge = StatusBridge()
+        bridge.poll()
+        # 订阅前已落库的明细不推送，只推送当前状态
+        assert [message['event'] for message in drain(subscription)] == ['status']
+
+        worker = multiprocessing.get_context('spawn').Process(target=run_worker, args=(str(database), 'T1'))
+        worker.start()
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+        bridge.poll()
+        events = drain(subscription)
+        assert [message['event'] for message in events] == ['items', 'status']
+        assert [item['point_id'] for item in events[0]['data']['items']] == ['P0', 'P1', 'P2']
+        assert events[0]['data']['items'][0]['preconditions'] == ['已登录']
+        assert events[1]['data']['status'] == 'completed'
+
+        # 回看窗口内已转发的明细不会重复推送
+        bridge.poll()
+        assert drain(subscription) == []
+    finally:
+        event_bus.unsubscribe(subscription)
+
+
+def test_bridge_forwards_late_committed_item_with_older_timestamp(database):
+    subscription = event_bus.subscribe('T1')
+    try:
+        bridge = StatusBridge()
+        bridge.poll()
+        drain(subscription)
+
+        # 并发写入时较早时间戳的行可能在较晚的行之后才提交
+        tables = FileRepository()._load()
+        latest = tables['points'][0]['created_at']
+        tables['points'].append({'point_id': 'LATE', 'task_id': 'T1', 'function_name': '晚提交',
+                                 'preconditions': '[]', 'created_at': latest - timedelta(seconds=2),
+                                 'updated_at': latest})
+        FileRepository()._save(tables)
+
+        bridge.poll()
+        events = drain(subscription)
+        assert [item['point_id'] for message in events for item in message['data']['items']] == ['LATE']
+    finally:
+        event_bus.unsubscribe(subscription)
@@ -0,0 +1,140 @@
+import json
+import re
+
+import pytest
+
+from husky.services import task_queue
+from husky.services.batch_service import BatchService
+from husky.services.task_queue import TaskQueue
+
+
+class FakeCursor:
+    """按领取流程用到的几类语句模拟 tasks 表"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params=()):
+        params = list(params)
+        if sql.startswith('UPDATE'):
+            worker_id, _, *task_ids = params
+            for row in self.rows:
+                if row['task_id'] in task_ids:
+                    row.update(status='processing', worker_id=worker_id, attempts=row['attempts'] + 1)
+            self.result = []
+        elif "`task_type` = %s AND `status` IN ('pending', 'processing')" in sql:
+            self.result = [row for row in self.rows if row['task_type'] == params[0] and row['status'] in ('pending', 'processing')]
+        elif 'GROUP BY `parent_id`' in sql:
+            running = {}
+            for row in self.rows:
+                if row.get('parent_id') in params and row['status'] == 'processing':
+                    stats = running.setdefault(row['parent_id'], {'parent_id': row['parent_id'], 'running': 0, 'tokens': 0})
+                    stats['running'] += 1
+                    stats['tokens'] += json.loads(row['payload']).get('est_tokens', 0)
+            self.result = list(running.values())
+        elif "`status` = 'pending' AND `task_type` <> %s" in sql:
+            task_type, *excluded = params[:-2]
+            limit, offset = params[-2:]
+            rows = [
+                row for row in self.rows
+                if row['status'] == 'pending' and row['task_type'] != task_type
+                and (row.get('parent_id') is None or 'NOT IN' not in sql or row['parent_id'] not in excluded)
+            ]
+            rows.sort(key=lambda row: (row['priority'], row['created_at']))
+            self.result = rows[offset:offset + limit]
+        elif re.search(r'WHERE `task_id` IN', sql):
+            self.result = [dict(row) for row in self.rows if row['task_id'] in params]
+        else:
+            raise AssertionError(f'unexpected sql: {sql}')
+
+    def fetchall(self):
+        return [dict(row) for row in self.result]
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return FakeCursor(self.rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeRepository:
+    rows = []
+
+    def __init__(self):
+        self.connection = FakeConnection(self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def task(task_id, priority, created_at, status='pending', parent_id=None, est_tokens=0, task_type='point_analysis'):
+    return {
+        'task_id': task_id, 'require_id': None, 'task_type': task_type, 'parent_id': parent_id,
+        'priority': priority, 'created_at': created_at, 'status': status, 'attempts': 0,
+        'payload': json.dumps({'est_tokens': est_tokens})
+    }
+
+
+@pytest.fixture
+def tasks_table(monkeypatch):
+    monkeypatch.setattr(task_queue, 'MysqlRepository', FakeRepository)
+    monkeypatch.setattr(task_queue.event_bus, 'publish', lambda *args, **kwargs: None)
+    FakeRepository.rows = []
+    return FakeRepository.rows
+
+
+def test_saturated_batch_does_not_block_standalone_task(tasks_table):
+    parent = task('BATCH', 0, 0, status='processing', task_type='batch_analysis')
+    parent['payload'] = json.dumps({'max_concurrency': 2, 'token_budget': 100000})
+    tasks_table.append(parent)
+    tasks_table.extend(task(f'RUN{i}', 0, i, status='processing', parent_id='BATCH') for i in range(2))
+    tasks_table.extend(task(f'CHILD{i}', 0, 10 + i, parent_id='BATCH') for i in range(80))
+    tasks_table.append(task('SINGLE', 2, 100))
+
+    claimed = TaskQueue('worker-1').claim(4)
+
+    assert [row['task_id'] for row in claimed] == ['SINGLE']
+
+
+def test_claim_keeps_scanning_past_over_budget_children(tasks_table, monkeypatch):
+    monkeypatch.setitem(task_queue.TASK_QUEUE, 'claim_scan_factor', 1)
+    parent = task('BATCH', 0, 0, task_type='batch_analysis')
+    parent['payload'] = json.dumps({'max_concurrency': 10, 'token_budget': 100})
+    tasks_table.append(parent)
+    tasks_table.extend(task(f'CHILD{i}', 0, i, parent_id='BATCH', est_tokens=80) for i in range(5))
+    tasks_table.append(task('SINGLE', 3, 100))
+
+    claimed = TaskQueue('worker-1').claim(2)
+
+    assert [row['task_id'] for row in claimed] == ['CHILD0', 'SINGLE']
+
+
+def test_select_claimable_respects_batch_budget():
+    budgets = {'P': {'max_concurrency': 2, 'token_budget': 100, 'running': 1, 'tokens': 60}}
+    candidates = [
+        {'task_id': 'a', 'parent_id': 'P', 'payload': '{"est_tokens": 50}'},
+        {'task_id': 'b', 'parent_id': 'P', 'payload': '{"est_tokens": 30}'},
+        {'task_id': 'c', 'parent_id': 'P', 'payload': '{"est_tokens": 1}'},
+        {'task_id': 'd', 'parent_id': None, 'payload': '{}'}
+    ]
+
+    assert BatchService.select_claimable(candidates, budgets, 3) == ['b', 'd']
+    assert BatchService.saturated(budgets) == ['P']
@@ -0,0 +1,29 @@
+import pytest
+
+from husky.utils import parse_bool, parse_fields
+
+
+@pytest.mark.parametrize('value, expected', [
+    (True, True), (False, False), (1, True), (0, False),
+    ('true', True), ('True', True), ('1', True), ('yes', True),
+    ('false', False), ('0', False), ('no', False), ('', False),
+])
+def test_parse_bool(value, expected):
+    assert parse_bool(value) is expected
+
+
+def test_parse_bool_default():
+    assert parse_bool(None) is False
+    assert parse_bool(None, default=True) is True
+
+
+@pytest.mark.parametrize('fields, expected', [
+    ('case_name, priority,unknown', ['case_name', 'priority']),
+    (['priority', 'priority', 'case_name'], ['priority', 'case_name']),
+    ([1, None, 'case_name'], ['case_name']),
+    ([None, 2], []),
+    (5, []),
+    (None, []),
+])
+def test_parse_fields_ignores_non_string_items(fields, expected):
+    assert parse_fields(fields, ['case_name', 'priority']) == expected
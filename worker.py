@@ -0,0 +1,31 @@
+import signal
+
+import dotenv
+from loguru import logger
+
+# 配置日志
+logger.add(
+    "logs/worker.log",
+    rotation="500 MB",
+    retention="10 days",
+    compression="zip",
+    level="DEBUG"
+)
+
+# 加载环境变量
+dotenv.load_dotenv()
+
+from husky.services.task_queue import Worker
+
+
+if __name__ == '__main__':
+    worker = Worker()
+
+    # 收到终止信号后停止领取新任务，等在途任务执行完毕再退出
+    def shutdown(signum, frame):
+        logger.info(f"收到信号 {signum}，工作进程准备退出")
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    worker.run()